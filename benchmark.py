@@ -0,0 +1,108 @@
+import os
+import sys
+import time
+import argparse
+import tempfile
+import numpy as np
+
+from core.encoders import OUTPUT_FORMATS, GifFormat, get_output_format
+from core.decoders import DecoderSelector
+
+
+def load_frames(video_path, start_time, duration, fps):
+    """解码一次测试片段，所有编码测试共用这些帧"""
+    with DecoderSelector(logger=print).open(video_path) as decoder:
+        return [frame for _, frame in decoder.iter_frames(start_time, start_time + duration, fps)]
+
+
+def bench_formats(frames, fps, formats, output_dir):
+    """逐个格式编码同一组帧，返回 (格式, 耗时秒, 字节数) 列表"""
+    results = []
+    for name in formats:
+        output_format = get_output_format(name)
+        output_file = output_format.output_path(output_dir, 0)
+
+        begin = time.perf_counter()
+        writer = output_format.create_writer(output_file, fps)
+        for frame in frames:
+            writer.add_frame(frame)
+        writer.close()
+        elapsed = time.perf_counter() - begin
+
+        results.append((name, elapsed, os.path.getsize(output_file)))
+        os.remove(output_file)
+    return results
+
+
+def bench_dither(frames, fps, modes, output_dir):
+    """比较GIF抖动方式，返回 (抖动方式, 量化耗时秒, 编码总耗时秒, 字节数, 帧间变化像素比例) 列表
+
+    帧间变化像素比例为相邻两帧输出颜色不同的像素占比，越低说明闪烁越少，
+    LZW和帧间差分也越有效。
+    """
+    results = []
+    for mode in modes:
+        output_format = get_output_format('gif', dither=mode)
+        output_file = output_format.output_path(output_dir, 0)
+
+        begin = time.perf_counter()
+        images = [output_format.prepare_frame(frame) for frame in frames]
+        quantize_elapsed = time.perf_counter() - begin
+
+        writer = output_format.create_writer(output_file, fps)
+        for image in images:
+            writer.add_prepared_frame(image)
+        writer.close()
+        elapsed = time.perf_counter() - begin
+
+        changed = []
+        previous = None
+        for image in images:
+            current = np.asarray(image.convert('RGB'))
+            if previous is not None:
+                changed.append(np.any(current != previous, axis=2).mean())
+            previous = current
+
+        results.append((mode, quantize_elapsed, elapsed, os.path.getsize(output_file),
+                        float(np.mean(changed)) if changed else 0.0))
+        os.remove(output_file)
+    return results
+
+
+def main(argv=None):
+    """基准测试入口函数"""
+    parser = argparse.ArgumentParser(description="输出格式编码基准测试")
+    parser.add_argument('video', help="测试视频路径")
+    parser.add_argument('--start-time', type=float, default=0, help="开始时间(秒)")
+    parser.add_argument('--duration', type=float, default=5, help="测试片段时长(秒)")
+    parser.add_argument('--fps', type=float, default=10, help="输出帧率")
+    parser.add_argument('--formats', nargs='+', choices=sorted(OUTPUT_FORMATS),
+                        default=sorted(OUTPUT_FORMATS), help="参与测试的格式")
+    parser.add_argument('--dither', action='store_true', help="同时比较GIF的抖动方式")
+    args = parser.parse_args(argv)
+
+    frames = load_frames(args.video, args.start_time, args.duration, args.fps)
+    if not frames:
+        print("测试片段中没有帧")
+        return 1
+
+    height, width = frames[0].shape[:2]
+    print(f"测试片段: {len(frames)} 帧, {width}x{height}, {args.fps}fps")
+    print(f"{'格式':<8}{'编码耗时(秒)':>14}{'帧/秒':>10}{'大小(KB)':>12}")
+
+    with tempfile.TemporaryDirectory() as output_dir:
+        for name, elapsed, size in bench_formats(frames, args.fps, args.formats, output_dir):
+            print(f"{name:<8}{elapsed:>14.3f}{len(frames) / elapsed:>10.1f}{size / 1024:>12.1f}")
+
+        if args.dither:
+            print()
+            print(f"{'GIF抖动':<8}{'量化耗时(秒)':>14}{'总耗时(秒)':>12}{'大小(KB)':>12}{'帧间变化像素':>14}")
+            for mode, quantize_elapsed, elapsed, size, changed in bench_dither(
+                    frames, args.fps, GifFormat.DITHER_MODES, output_dir):
+                print(f"{mode:<8}{quantize_elapsed:>14.3f}{elapsed:>12.3f}{size / 1024:>12.1f}{changed:>14.1%}")
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
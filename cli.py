@@ -0,0 +1,241 @@
+import signal
+import argparse
+import multiprocessing
+
+from core.video_processor import VideoProcessor
+from core.scene_detector import SceneDetector
+from core.folder_watcher import WatchService
+from core.work_queue import WorkQueue, run_local_worker
+from core.cancellation import ProcessingCancelled
+from utils.logger import Logger
+
+
+def parse_region(value):
+    """解析区域参数，格式为 x,y,width,height"""
+    try:
+        x, y, width, height = (int(v) for v in value.split(','))
+    except ValueError:
+        raise argparse.ArgumentTypeError("区域格式应为 x,y,width,height")
+    return x, y, width, height
+
+
+def parse_rendition(value):
+    """解析输出规格参数，格式为 名称[:fps=帧率,scale=缩放,colors=颜色数,format=格式,dither=抖动方式]"""
+    name, _, options = value.partition(':')
+    rendition = {'name': name}
+    converters = {'fps': float, 'scale': float, 'colors': int, 'format': str, 'dither': str}
+    for option in filter(None, options.split(',')):
+        key, _, text = option.partition('=')
+        if key not in converters or not text:
+            raise argparse.ArgumentTypeError(f"无效的规格参数: {option}")
+        try:
+            rendition[key] = converters[key](text)
+        except ValueError:
+            raise argparse.ArgumentTypeError(f"无效的规格参数: {option}")
+    return rendition
+
+
+def build_parser():
+    """创建命令行参数解析器"""
+    parser = argparse.ArgumentParser(description="视频转GIF工具（命令行模式）")
+    parser.add_argument('-i', '--input', required=True, help="输入视频所在文件夹路径")
+    parser.add_argument('-o', '--output', required=True, help="GIF输出路径")
+    parser.add_argument('--start-time', type=float, default=0, help="开始时间(秒)")
+    parser.add_argument('--region', type=parse_region, default=None,
+                        help="转换区域 x,y,width,height，不指定时转换整个画面")
+
+    split_group = parser.add_mutually_exclusive_group(required=True)
+    split_group.add_argument('--split-duration', type=float, help="按时长分割(秒)")
+    split_group.add_argument('--split-count', type=int, help="按数量分割")
+    split_group.add_argument('--split-scene', action='store_true', help="按场景切换分割")
+
+    parser.add_argument('--scene-threshold', type=float, default=0.35, help="场景切换阈值(0~1)")
+    parser.add_argument('--min-scene-length', type=float, default=1.0, help="最短片段时长(秒)")
+    parser.add_argument('--max-scene-length', type=float, default=10.0, help="最长片段时长(秒)")
+
+    parser.add_argument('--output-mode', choices=['gif', 'clip'], default='gif',
+                        help="输出模式: gif 重新编码为GIF，clip 流复制输出视频片段")
+    parser.add_argument('--format', choices=['gif', 'webp', 'apng'], default='gif',
+                        help="gif模式下的动图格式")
+    parser.add_argument('--dither', choices=['none', 'bayer'], default=None,
+                        help="GIF抖动方式: none 每帧自适应调色板、不抖动，bayer 固定调色板加有序抖动，"
+                             "渐变不出现色带；不指定时ffmpeg后端使用误差扩散抖动")
+    parser.add_argument('--rendition', action='append', type=parse_rendition, default=None,
+                        help="输出规格，可重复指定，每帧只解码一次，各规格写入同名子目录，"
+                             "例如 thumb:scale=0.25,fps=5 full:format=webp")
+    parser.add_argument('--decoder', choices=['auto', 'opencv', 'pyav', 'ffmpeg'], default='auto',
+                        help="解码器，auto时按文件自动选择")
+    parser.add_argument('--backend', choices=['auto', 'python', 'ffmpeg'], default='auto',
+                        help="GIF生成后端，auto时在可用时使用ffmpeg滤镜图")
+    parser.add_argument('--encode-workers', type=int, default=1,
+                        help="Python后端下每个视频的编码进程数")
+    parser.add_argument('--spool-threshold', type=float, default=None,
+                        help="时长不短于该值(秒)的片段把帧缓存到磁盘，降低内存占用")
+    parser.add_argument('--spool-dir', default=None, help="帧缓存文件所在目录，默认使用系统临时目录")
+    parser.add_argument('--container', choices=['mp4', 'mkv'], default='mp4', help="clip模式的输出容器")
+    parser.add_argument('--archive', choices=['none', 'video', 'run'], default='none',
+                        help="打包输出: video 每个视频一个归档，run 整批一个归档，不再创建大量小文件")
+    parser.add_argument('--archive-format', choices=['zip', 'tar'], default='zip',
+                        help="归档格式，均不压缩，并包含索引index.json")
+    parser.add_argument('--no-snap', action='store_true', help="clip模式下不将片段边界对齐到关键帧")
+    parser.add_argument('--target-size', type=int, default=None, help="每个GIF的目标大小上限(KB)")
+    parser.add_argument('--workers', type=int, default=1, help="最大并行处理视频数，默认逐个处理")
+    parser.add_argument('--memory-budget', type=int, default=None, help="内存预算(MB)")
+
+    parser.add_argument('--prefetch', type=int, default=2,
+                        help="处理当前视频时在后台预读之后的几个视频，0为不预读")
+    parser.add_argument('--prefetch-budget', type=int, default=None,
+                        help="已预读但尚未开始处理的最大数据量(MB)，默认1024")
+    parser.add_argument('--dry-run', action='store_true',
+                        help="只预估不处理: 计算片段并试处理一小段，输出预计片段数、输出大小和总耗时")
+
+    parser.add_argument('--video-timeout', type=float, default=None,
+                        help="单个视频一次尝试的时限(秒)，超时结束处理进程")
+    parser.add_argument('--segment-timeout', type=float, default=None,
+                        help="两个片段完成之间的最长间隔(秒)，超时结束处理进程")
+    parser.add_argument('--retries', type=int, default=0, help="视频处理失败后的重试次数")
+    parser.add_argument('--retry-backoff', type=float, default=2.0,
+                        help="第一次重试前的等待时间(秒)，之后每次加倍")
+
+    parser.add_argument('--watch', action='store_true',
+                        help="持续监视输入文件夹，只处理新增或内容变化的视频，Ctrl+C停止")
+    parser.add_argument('--settle-time', type=float, default=5.0,
+                        help="监视模式下文件大小保持不变多少秒后视为写入完成")
+    parser.add_argument('--poll-interval', type=float, default=2.0, help="监视模式的检查间隔(秒)")
+    parser.add_argument('--no-inotify', action='store_true', help="监视模式下不使用inotify，定期扫描目录")
+
+    parser.add_argument('--queue-dir', default=None,
+                        help="分布式模式: 把任务拆分为工作项写入共享目录，由各节点的queue_worker.py处理")
+    parser.add_argument('--segments-per-item', type=int, default=None,
+                        help="分布式模式下每个工作项包含的片段数，不指定时每个视频一个工作项")
+    parser.add_argument('--lease-seconds', type=float, default=None, help="分布式模式的租约有效期(秒)")
+    parser.add_argument('--local-workers', type=int, default=0,
+                        help="分布式模式下在本机启动的处理节点数，启动时等待所有工作项完成")
+    return parser
+
+
+def enqueue(args, options, logger):
+    """分布式模式: 写入工作项，可选地在本机启动处理节点并等待完成"""
+    params = {name: value for name, value in options.items() if name != 'scene_detector'}
+    params.update(input_path=args.input, output_path=args.output)
+    if args.split_scene:
+        params.update(split_scene=True, scene_threshold=args.scene_threshold,
+                      min_scene_length=args.min_scene_length, max_scene_length=args.max_scene_length)
+
+    processor = VideoProcessor()
+    processor.set_logger_callback(logger.info)
+    work_queue = WorkQueue(args.queue_dir, args.lease_seconds, logger=logger.info)
+    work_queue.enqueue(params, args.segments_per_item, processor)
+
+    if args.local_workers <= 0:
+        return 0
+
+    context = multiprocessing.get_context('spawn')
+    workers = [context.Process(target=run_local_worker,
+                               args=(args.queue_dir, args.lease_seconds, f"local-{i + 1}"))
+               for i in range(args.local_workers)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+    status = work_queue.status()
+    logger.info(f"工作项共 {status['total']} 个: 成功 {status['done']}，失败 {status['failed']}，"
+                f"未完成 {status['pending'] + status['leased']}")
+    return 0 if status['failed'] == 0 else 1
+
+
+def install_interrupt_handler(token, on_cancel=None):
+    """第一次Ctrl+C取消处理，正在处理的视频删除未写完的输出后退出；再次按下时立即中断"""
+    def handler(signum, frame):
+        if token.cancelled:
+            raise KeyboardInterrupt
+        token.cancel()
+        print("正在取消，等待正在处理的视频清理（再次按Ctrl+C立即退出）...")
+        if on_cancel is not None:
+            on_cancel()
+
+    signal.signal(signal.SIGINT, handler)
+
+
+def main(argv=None):
+    """命令行入口函数"""
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    # 与HTTP接口一致，分割时长和数量必须为正数，否则计算片段时会除零或无法结束
+    if args.split_duration is not None and args.split_duration <= 0:
+        parser.error(f"--split-duration 应为正数，实际为 {args.split_duration}")
+    if args.split_count is not None and args.split_count <= 0:
+        parser.error(f"--split-count 应为正整数，实际为 {args.split_count}")
+
+    scene_detector = None
+    if args.split_scene:
+        scene_detector = SceneDetector(threshold=args.scene_threshold,
+                                       min_scene_length=args.min_scene_length,
+                                       max_scene_length=args.max_scene_length)
+
+    logger = Logger()
+    processor = VideoProcessor()
+    processor.set_logger_callback(logger.info)
+
+    options = dict(
+        start_time=args.start_time,
+        split_duration=args.split_duration,
+        split_count=args.split_count,
+        selected_region=args.region,
+        memory_budget=args.memory_budget * 1024 * 1024 if args.memory_budget else None,
+        scene_detector=scene_detector,
+        target_size=args.target_size * 1024 if args.target_size else None,
+        output_mode=args.output_mode,
+        clip_container=args.container,
+        snap_to_keyframes=not args.no_snap,
+        output_format=args.format,
+        renditions=args.rendition,
+        dither=args.dither,
+        archive=args.archive,
+        archive_format=args.archive_format,
+        prefetch=args.prefetch,
+        prefetch_budget=args.prefetch_budget * 1024 * 1024 if args.prefetch_budget else None,
+        decoder_backend=args.decoder,
+        encoder_backend=args.backend,
+        encode_workers=args.encode_workers,
+        spool_threshold=args.spool_threshold,
+        spool_dir=args.spool_dir,
+        video_timeout=args.video_timeout,
+        segment_timeout=args.segment_timeout,
+        retries=args.retries,
+        retry_backoff=args.retry_backoff
+    )
+
+    if args.dry_run:
+        install_interrupt_handler(processor.cancel_token)
+        try:
+            processor.process_videos(input_path=args.input, output_path=args.output,
+                                     max_workers=args.workers, dry_run=True, **options)
+        except ProcessingCancelled:
+            return 130
+        return 0
+
+    if args.queue_dir:
+        return enqueue(args, options, logger)
+
+    if args.watch:
+        # 监视模式下--workers为同时处理的视频数
+        service = WatchService(processor, args.input, args.output, concurrency=args.workers or 1,
+                               settle_time=args.settle_time, poll_interval=args.poll_interval,
+                               use_inotify=not args.no_inotify, **options)
+        # Ctrl+C停止监视并取消正在处理的视频，取消的视频下次监视时重新处理
+        install_interrupt_handler(processor.cancel_token, service.stop)
+        try:
+            service.run()
+        except KeyboardInterrupt:
+            pass
+        return 0
+
+    install_interrupt_handler(processor.cancel_token)
+    try:
+        processor.process_videos(input_path=args.input, output_path=args.output,
+                                 max_workers=args.workers, **options)
+    except ProcessingCancelled:
+        return 130
+    return 0
@@ -0,0 +1 @@
+"""pytest配置：测试从仓库根目录导入core等模块"""
@@ -0,0 +1,271 @@
+import io
+import os
+import json
+import math
+import shutil
+import tarfile
+import zipfile
+import tempfile
+import threading
+import uuid
+
+
+class _SequentialFile:
+    """只能顺序写入的文件包装
+
+    zipfile检测到文件不能seek时，改用数据描述符记录每个成员的大小和CRC，
+    不再回写本地文件头，归档从头到尾只追加写入。
+    """
+
+    def __init__(self, raw):
+        self.raw = raw
+        self.position = raw.tell()
+
+    def write(self, data):
+        count = self.raw.write(data)
+        self.position += len(data)
+        return count
+
+    def tell(self):
+        return self.position
+
+    def seek(self, offset, whence=0):
+        raise io.UnsupportedOperation("归档只能顺序写入")
+
+    def seekable(self):
+        return False
+
+    def flush(self):
+        self.raw.flush()
+
+
+class ArchiveSink:
+    """不压缩的归档输出
+
+    成员按添加顺序追加到同一目录下的临时文件，使用大缓冲区顺序写入；最后写入索引成员
+    index.json（成员名称、所属视频、大小和数据在归档中的偏移），同步到磁盘后原子地
+    重命名为目标文件。未提交的归档不会出现在目标路径上。
+    """
+
+    FORMATS = ('zip', 'tar')
+    INDEX_NAME = 'index.json'
+    # 输出文件的写缓冲区大小
+    BUFFER_SIZE = 8 * 1024 * 1024
+    # 复制成员数据时每次读取的大小
+    COPY_CHUNK = 1024 * 1024
+
+    def __init__(self, path, archive_format='zip'):
+        """创建临时归档文件
+
+        Args:
+            path: 归档的目标路径
+            archive_format: 归档格式，zip 或 tar
+        """
+        if archive_format not in self.FORMATS:
+            raise ValueError(f"不支持的归档格式: {archive_format}")
+
+        self.path = path
+        self.archive_format = archive_format
+        self.entries = []
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(os.path.abspath(path))
+        # 按0o666创建，由系统按进程的权限掩码得到与普通输出文件相同的权限，提交时不需要再修改
+        self.temp_path = os.path.join(directory, f".{os.path.basename(path)}.{uuid.uuid4().hex}.tmp")
+        fd = os.open(self.temp_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY | getattr(os, 'O_BINARY', 0), 0o666)
+        self._raw = os.fdopen(fd, 'wb', buffering=self.BUFFER_SIZE)
+        self._file = _SequentialFile(self._raw)
+        if archive_format == 'zip':
+            self._archive = zipfile.ZipFile(self._file, 'w', zipfile.ZIP_STORED, allowZip64=True)
+        else:
+            self._archive = tarfile.open(fileobj=self._file, mode='w', format=tarfile.PAX_FORMAT)
+
+    @property
+    def closed(self):
+        return self._raw is None
+
+    def add_file(self, name, file_path, video=None):
+        """把文件作为成员追加到归档
+
+        Args:
+            name: 成员名称，使用 / 分隔目录
+            file_path: 文件路径
+            video: 成员所属的视频路径，写入索引
+        """
+        size = os.path.getsize(file_path)
+        with self._lock, open(file_path, 'rb') as source:
+            if self.closed:
+                raise ValueError("归档已关闭")
+            if self.archive_format == 'zip':
+                info = zipfile.ZipInfo.from_file(file_path, name)
+                info.compress_type = zipfile.ZIP_STORED
+                with self._archive.open(info, 'w', force_zip64=size >= zipfile.ZIP64_LIMIT) as dest:
+                    # 本地文件头已写出，当前位置即成员数据的偏移
+                    offset = self._file.tell()
+                    shutil.copyfileobj(source, dest, self.COPY_CHUNK)
+            else:
+                info = self._archive.gettarinfo(file_path, name)
+                info.uid = info.gid = 0
+                info.uname = info.gname = ''
+                self._archive.addfile(info, source)
+                # 成员数据按块对齐，起点为当前写出位置减去按块向上取整的数据长度
+                offset = self._archive.offset - math.ceil(size / tarfile.BLOCKSIZE) * tarfile.BLOCKSIZE
+            self.entries.append({'name': name, 'video': video, 'size': size, 'offset': offset})
+
+    def add_tree(self, root, video=None):
+        """按相对路径追加目录下的所有文件
+
+        Returns:
+            追加的文件数
+        """
+        files = []
+        for directory, _, names in os.walk(root):
+            files.extend(os.path.join(directory, name) for name in names)
+        for file_path in sorted(files):
+            name = os.path.relpath(file_path, root).replace(os.sep, '/')
+            self.add_file(name, file_path, video)
+        return len(files)
+
+    def _add_index(self):
+        data = json.dumps({'format': self.archive_format, 'entries': self.entries},
+                          ensure_ascii=False, indent=1).encode('utf-8')
+        if self.archive_format == 'zip':
+            self._archive.writestr(zipfile.ZipInfo(self.INDEX_NAME), data)
+        else:
+            info = tarfile.TarInfo(self.INDEX_NAME)
+            info.size = len(data)
+            self._archive.addfile(info, io.BytesIO(data))
+
+    def commit(self):
+        """写入索引，同步到磁盘并重命名为目标文件"""
+        with self._lock:
+            if self.closed:
+                raise ValueError("归档已关闭")
+            try:
+                self._add_index()
+                self._archive.close()
+                self._raw.flush()
+                os.fsync(self._raw.fileno())
+                self._raw.close()
+                self._raw = None
+                os.replace(self.temp_path, self.path)
+            except BaseException:
+                self._discard()
+                raise
+
+    def abort(self):
+        """放弃归档并删除临时文件，已提交时不做任何事"""
+        with self._lock:
+            if not self.closed:
+                self._discard()
+
+    def _discard(self):
+        if self._raw is not None:
+            try:
+                self._archive.close()
+                self._raw.close()
+            except (OSError, ValueError):
+                pass
+            self._raw = None
+        if os.path.exists(self.temp_path):
+            os.remove(self.temp_path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.commit()
+        else:
+            self.abort()
+
+
+class OutputArchiver:
+    """打包输出
+
+    每个视频先输出到本地暂存目录，处理结束后按输出目录的相对路径顺序追加到归档，
+    再删除暂存文件。输出路径上只创建归档文件，不再为每个片段创建目录和小文件。
+    """
+
+    # 打包方式: none 不打包，video 每个视频一个归档，run 整批一个归档
+    MODES = ('none', 'video', 'run')
+
+    def __init__(self, output_path, mode='video', archive_format='zip', run_name='output',
+                 staging_dir=None, logger=None):
+        """初始化打包器
+
+        Args:
+            output_path: 输出路径，归档写在这里
+            mode: 打包方式，video 或 run
+            archive_format: 归档格式，zip 或 tar
+            run_name: 整批打包时的归档名称（不含扩展名）
+            staging_dir: 暂存目录所在的本地目录，为None时使用系统临时目录
+            logger: 日志函数
+        """
+        if mode not in self.MODES or mode == 'none':
+            raise ValueError(f"不支持的打包方式: {mode}")
+        if archive_format not in ArchiveSink.FORMATS:
+            raise ValueError(f"不支持的归档格式: {archive_format}")
+
+        self.output_path = output_path
+        self.mode = mode
+        self.archive_format = archive_format
+        self.run_name = run_name
+        self.staging_dir = staging_dir
+        self.logger = logger
+        self._run_sink = None
+        self._lock = threading.Lock()
+
+    def log(self, message):
+        """输出日志"""
+        if self.logger:
+            self.logger(message)
+
+    def archive_path(self, name):
+        """归档文件的路径"""
+        return os.path.join(self.output_path, f"{name}.{self.archive_format}")
+
+    def stage(self):
+        """为一个视频创建暂存目录，作为该视频的输出路径"""
+        if self.staging_dir:
+            os.makedirs(self.staging_dir, exist_ok=True)
+        return tempfile.mkdtemp(prefix='archive_staging_', dir=self.staging_dir)
+
+    def pack(self, video_path, staging):
+        """把视频暂存目录中的输出追加到归档
+
+        Returns:
+            追加的文件数
+        """
+        name = os.path.basename(video_path)
+        if self.mode == 'video':
+            if not any(files for _, _, files in os.walk(staging)):
+                return 0
+            path = self.archive_path(os.path.splitext(name)[0])
+            with ArchiveSink(path, self.archive_format) as sink:
+                count = sink.add_tree(staging, video_path)
+            self.log(f"{name} 的 {count} 个文件已打包: {path}")
+            return count
+
+        with self._lock:
+            if self._run_sink is None:
+                self._run_sink = ArchiveSink(self.archive_path(self.run_name), self.archive_format)
+        count = self._run_sink.add_tree(staging, video_path)
+        self.log(f"{name} 的 {count} 个文件已追加到归档")
+        return count
+
+    @staticmethod
+    def discard(staging):
+        """删除暂存目录"""
+        shutil.rmtree(staging, ignore_errors=True)
+
+    def close(self):
+        """提交整批归档"""
+        if self._run_sink is not None and not self._run_sink.closed:
+            self._run_sink.commit()
+            self.log(f"{len(self._run_sink.entries)} 个文件已打包: {self._run_sink.path}")
+
+    def abort(self):
+        """放弃未提交的整批归档"""
+        if self._run_sink is not None:
+            self._run_sink.abort()
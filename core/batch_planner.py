@@ -0,0 +1,275 @@
+import os
+import math
+import time
+import heapq
+import shutil
+import tempfile
+
+from core.stream_splitter import StreamCopySplitter
+from core.renditions import build_renditions
+from core.cancellation import ProcessingCancelled
+
+
+class BatchPlanner:
+    """批处理预估类
+
+    不做实际处理，只读取元数据，按与正式处理相同的方式计算每个视频的片段，
+    并试处理每个视频中间的一小段，以此标定处理速度和输出大小，预测整批的片段数、
+    输出字节数和在给定并行数下的总耗时。视频数超过试处理上限时，未试处理的视频
+    使用同分辨率视频的平均值。
+    """
+
+    # 试处理的时长（秒）
+    SAMPLE_DURATION = 2.0
+    # 最多试处理的视频数
+    MAX_SAMPLES = 16
+
+    def __init__(self, processor, sample_duration=None, max_samples=None, logger=None):
+        """初始化预估器
+
+        Args:
+            processor: VideoProcessor，提供片段计算和试处理
+            sample_duration: 试处理的时长（秒）
+            max_samples: 最多试处理的视频数
+            logger: 日志函数
+        """
+        self.processor = processor
+        self.sample_duration = sample_duration or self.SAMPLE_DURATION
+        self.max_samples = max_samples or self.MAX_SAMPLES
+        self.logger = logger
+
+    def log(self, message):
+        """输出日志"""
+        if self.logger:
+            self.logger(message)
+
+    def output_frames(self, segments, options):
+        """片段列表对应的输出帧数（多规格时为各规格之和）"""
+        if options['output_mode'] == 'clip':
+            return 0
+        if options.get('renditions'):
+            rates = [rendition.fps for rendition in
+                     build_renditions(options['renditions'], self.processor.GIF_FPS)]
+        else:
+            rates = [self.processor.GIF_FPS]
+        return sum(max(1, math.ceil((seg_end - seg_start) * fps - 1e-6))
+                   for _, seg_start, seg_end in segments for fps in rates)
+
+    def plan_segments(self, video_path, duration, options):
+        """计算视频的片段
+
+        场景分割需要完整解码，预估时按最长片段时长计算，结果标记为近似值。
+
+        Returns:
+            (片段列表, 是否为近似值)
+        """
+        scene_detector = options.get('scene_detector')
+        if scene_detector is not None:
+            return self.processor.plan_segments(duration, scene_detector.max_scene_length), True
+        return self.processor.build_segments(video_path, options['start_time'], duration,
+                                             options['split_duration'], options['split_count']), False
+
+    def _sample(self, video_path, duration, options):
+        """试处理视频中间的一小段
+
+        Returns:
+            (每秒视频的处理耗时, 每秒视频的输出字节数)
+        """
+        sample_duration = min(self.sample_duration, duration)
+        sample_start = max(0.0, (duration - sample_duration) / 2)
+        sample = [(0, sample_start, sample_start + sample_duration)]
+
+        # 关键帧索引和解码器选择结果都会缓存，正式处理时直接复用，不计入试处理耗时
+        self.processor.seek_index_cache.get(video_path)
+        if options['output_mode'] != 'clip' and options['decoder_backend'] == 'auto':
+            self.processor.decoder_selector.select(video_path)
+
+        trial = type(self.processor)()
+        trial.set_logger_callback(lambda message: None)
+        trial.set_cancel_token(self.processor.cancel_token)
+        trial.decoder_selector = self.processor.decoder_selector
+        trial.seek_index_cache = self.processor.seek_index_cache
+        with tempfile.TemporaryDirectory(prefix='dry_run_') as output_dir:
+            begin = time.perf_counter()
+            if options['output_mode'] == 'clip':
+                seek_index = self.processor.seek_index_cache.get(video_path)
+                keyframes = seek_index.keyframes if seek_index is not None else None
+                splitter = StreamCopySplitter(options['clip_container'], options['snap_to_keyframes'])
+                splitter.split(video_path, output_dir, options['start_time'], sample, keyframes,
+                               cancel_token=self.processor.cancel_token)
+            else:
+                trial.convert_video_to_gif(
+                    video_path, output_dir, options['start_time'], segments=sample,
+                    selected_region=options['selected_region'], target_size=options['target_size'],
+                    output_format=options['output_format'], decoder_backend=options['decoder_backend'],
+                    encoder_backend=options['encoder_backend'], spool_threshold=options['spool_threshold'],
+                    spool_dir=options['spool_dir'], renditions=options['renditions'],
+                    dither=options['dither'])
+            elapsed = time.perf_counter() - begin
+
+            output_bytes = 0
+            for root, _, files in os.walk(output_dir):
+                output_bytes += sum(os.path.getsize(os.path.join(root, name)) for name in files)
+
+        return elapsed / sample_duration, output_bytes / sample_duration
+
+    @staticmethod
+    def _resolution(metadata):
+        return metadata['width'], metadata['height']
+
+    def calibrate(self, jobs, options):
+        """试处理视频，超过上限时先保证每种分辨率至少一个
+
+        Returns:
+            {任务序号: (每秒视频的处理耗时, 每秒视频的输出字节数)}
+        """
+        candidates = [job for job in jobs if job.metadata['duration'] > options['start_time']]
+        seen = set()
+        first_of_group = []
+        for job in candidates:
+            if self._resolution(job.metadata) not in seen:
+                seen.add(self._resolution(job.metadata))
+                first_of_group.append(job)
+        candidates = first_of_group + [job for job in candidates if job not in first_of_group]
+
+        rates = {}
+        for job in candidates[:self.max_samples]:
+            duration = job.metadata['duration'] - options['start_time']
+            try:
+                rates[job.index] = self._sample(job.video_path, duration, options)
+                self.log(f"试处理 {os.path.basename(job.video_path)}: 每秒视频耗时 "
+                         f"{rates[job.index][0]:.2f}秒，输出 {rates[job.index][1] / 1024:.0f}KB")
+            except ProcessingCancelled:
+                raise
+            except Exception as e:
+                self.log(f"试处理 {os.path.basename(job.video_path)} 出错: {str(e)}")
+        return rates
+
+    def _rate_for(self, job, jobs, rates):
+        """取视频自己的试处理结果，没有时取同分辨率视频的平均值，
+        仍没有时按像素数从最接近的分辨率换算"""
+        if job.index in rates:
+            return rates[job.index]
+
+        groups = {}
+        for other in jobs:
+            if other.index in rates:
+                groups.setdefault(self._resolution(other.metadata), []).append(rates[other.index])
+        key = self._resolution(job.metadata)
+        ratio = 1.0
+        if key not in groups:
+            pixels = key[0] * key[1]
+            nearest = min(groups, key=lambda item: abs(item[0] * item[1] - pixels))
+            ratio = pixels / max(1, nearest[0] * nearest[1])
+            key = nearest
+        samples = groups[key]
+        return (ratio * sum(seconds for seconds, _ in samples) / len(samples),
+                ratio * sum(output_bytes for _, output_bytes in samples) / len(samples))
+
+    @staticmethod
+    def simulate(jobs, seconds, scheduler):
+        """按调度器的放行规则模拟整批处理，返回预计总耗时（秒）
+
+        并行数不超过CPU核心数，超过部分的任务之间会争用CPU，不会更快。
+        """
+        workers = min(scheduler.max_workers, os.cpu_count() or 1)
+        pending = scheduler.order_jobs([job for job in jobs if job.index in seconds])
+        running = []
+        now = 0.0
+        memory = 0
+        while pending:
+            job = None
+            if len(running) < workers:
+                job = next((job for job in pending
+                            if memory + job.estimated_memory <= scheduler.memory_budget), None)
+                if job is None and not running:
+                    job = pending[0]
+            if job is None:
+                now, released = heapq.heappop(running)
+                memory -= released
+                continue
+            pending.remove(job)
+            memory += job.estimated_memory
+            heapq.heappush(running, (now + seconds[job.index], job.estimated_memory))
+        return max([now] + [end for end, _ in running])
+
+    def plan(self, jobs, scheduler, output_path, options):
+        """预估整批处理
+
+        Args:
+            jobs: VideoJob列表
+            scheduler: 正式处理时使用的JobScheduler
+            output_path: 输出路径
+            options: VideoProcessor.convert_video的参数字典
+
+        Returns:
+            预估结果字典: videos 为每个视频的 {video, segments, frames, seconds, bytes,
+            approximate, error} 列表，以及合计的 segments, frames, bytes, cpu_seconds,
+            wall_seconds, workers, free_bytes
+        """
+        probed = [job for job in jobs if job.metadata is not None]
+        rates = self.calibrate(probed, options)
+
+        videos = []
+        seconds = {}
+        for job in jobs:
+            entry = {'video': job.video_path, 'segments': 0, 'frames': 0, 'seconds': 0.0,
+                     'bytes': 0, 'approximate': False, 'error': None}
+            videos.append(entry)
+            if job.metadata is None:
+                entry['error'] = "无法读取视频信息"
+                continue
+
+            duration = job.metadata['duration'] - options['start_time']
+            if duration <= 0:
+                entry['error'] = "开始时间超过视频时长"
+                continue
+            if not rates:
+                entry['error'] = "没有可用的试处理结果"
+                continue
+
+            segments, approximate = self.plan_segments(job.video_path, duration, options)
+            seconds_per_second, bytes_per_second = self._rate_for(job, probed, rates)
+            entry.update(segments=len(segments), frames=self.output_frames(segments, options),
+                         seconds=seconds_per_second * duration,
+                         bytes=int(bytes_per_second * duration), approximate=approximate)
+            seconds[job.index] = entry['seconds']
+
+        free_path = os.path.abspath(output_path)
+        while not os.path.exists(free_path):
+            free_path = os.path.dirname(free_path)
+
+        return {
+            'videos': videos,
+            'segments': sum(entry['segments'] for entry in videos),
+            'frames': sum(entry['frames'] for entry in videos),
+            'bytes': sum(entry['bytes'] for entry in videos),
+            'cpu_seconds': sum(seconds.values()),
+            'wall_seconds': self.simulate(jobs, seconds, scheduler),
+            'workers': min(scheduler.max_workers, os.cpu_count() or 1),
+            'free_bytes': shutil.disk_usage(free_path).free,
+        }
+
+    @staticmethod
+    def format_duration(seconds):
+        """把秒数格式化为 时:分:秒"""
+        seconds = int(round(seconds))
+        return f"{seconds // 3600}:{seconds // 60 % 60:02d}:{seconds % 60:02d}"
+
+    def summarize(self, report):
+        """输出预估结果"""
+        for entry in report['videos']:
+            name = os.path.basename(entry['video'])
+            if entry['error']:
+                self.log(f"  {name}: {entry['error']}")
+                continue
+            mark = "约" if entry['approximate'] else ""
+            self.log(f"  {name}: {mark}{entry['segments']} 个片段，{entry['frames']} 帧，"
+                     f"约 {entry['bytes'] / 1024 ** 2:.1f}MB，耗时约 {self.format_duration(entry['seconds'])}")
+
+        self.log(f"预估合计: {len(report['videos'])} 个视频，{report['segments']} 个片段，"
+                 f"输出约 {report['bytes'] / 1024 ** 2:.1f}MB，"
+                 f"并行 {report['workers']} 个时预计耗时 {self.format_duration(report['wall_seconds'])}"
+                 f"（单线程合计 {self.format_duration(report['cpu_seconds'])}）")
+        if report['bytes'] > report['free_bytes']:
+            self.log(f"警告: 预计输出超过输出磁盘的剩余空间 {report['free_bytes'] / 1024 ** 3:.1f}GB")
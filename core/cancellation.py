@@ -0,0 +1,95 @@
+import signal
+import threading
+
+
+class ProcessingCancelled(Exception):
+    """处理已被取消"""
+
+
+class CancelToken:
+    """取消和暂停标记
+
+    控制方调用cancel、pause和resume，处理代码在帧和片段之间调用check：
+    暂停时阻塞等待恢复，取消时抛出ProcessingCancelled，由各层在异常中
+    关闭解码器和写入器并删除未写完的输出。用multiprocessing的Event创建时
+    可以传给子进程，与父进程共享状态。
+    """
+
+    # 暂停时检查状态的间隔（秒）
+    POLL_INTERVAL = 0.2
+
+    def __init__(self, cancel_event=None, resume_event=None):
+        """初始化标记
+
+        Args:
+            cancel_event: 取消事件，为None时使用threading.Event
+            resume_event: 运行事件，清除时表示暂停，为None时使用threading.Event
+        """
+        self._cancel = cancel_event if cancel_event is not None else threading.Event()
+        self._resume = resume_event if resume_event is not None else threading.Event()
+        self._resume.set()
+
+    @classmethod
+    def for_process(cls, context):
+        """创建可以传给context创建的子进程的标记"""
+        return cls(context.Event(), context.Event())
+
+    @property
+    def cancelled(self):
+        return self._cancel.is_set()
+
+    @property
+    def paused(self):
+        return not self._resume.is_set() and not self._cancel.is_set()
+
+    def cancel(self):
+        """取消处理，暂停中的处理也会立即结束等待"""
+        self._cancel.set()
+        self._resume.set()
+
+    def pause(self):
+        """暂停处理，处理代码在下一次check时阻塞"""
+        if not self._cancel.is_set():
+            self._resume.clear()
+
+    def resume(self):
+        """恢复处理"""
+        self._resume.set()
+
+    def check(self):
+        """暂停时等待恢复，已取消时抛出ProcessingCancelled"""
+        while not self._resume.is_set():
+            self._resume.wait(self.POLL_INTERVAL)
+        if self._cancel.is_set():
+            raise ProcessingCancelled("处理已取消")
+
+    def sleep(self, seconds):
+        """等待指定时间，取消时提前结束并抛出ProcessingCancelled"""
+        self._cancel.wait(seconds)
+        self.check()
+
+    def copy_state_to(self, other):
+        """把当前状态同步到另一个标记，用于转发给子进程"""
+        if self.cancelled:
+            other.cancel()
+        elif self.paused:
+            other.pause()
+        else:
+            other.resume()
+
+    def hold(self, process):
+        """暂停期间挂起外部进程（如ffmpeg），恢复或取消后让它继续运行
+
+        取消时由调用方结束进程；不支持SIGSTOP的系统上只等待，不挂起进程。
+        """
+        if not self.paused:
+            return
+        stop = getattr(signal, 'SIGSTOP', None)
+        if stop is not None:
+            process.send_signal(stop)
+        try:
+            while self.paused:
+                self._resume.wait(self.POLL_INTERVAL)
+        finally:
+            if stop is not None:
+                process.send_signal(signal.SIGCONT)
@@ -0,0 +1,560 @@
+import os
+import re
+import math
+import time
+import threading
+import subprocess
+
+import cv2
+import numpy as np
+
+from core.ffmpeg_tools import FFmpegTools
+
+
+def crop_frame(frame, selected_region):
+    """裁剪帧到选择区域"""
+    if not selected_region:
+        return frame
+    x, y, width, height = selected_region
+    return np.ascontiguousarray(frame[y:y + height, x:x + width])
+
+
+class VideoDecoder:
+    """视频解码器基类
+
+    所有解码器都输出 (时间戳秒, RGB帧) ，帧为 (H, W, 3) 的uint8数组。
+    子类需要实现 _open, _read, _seek, close。
+    设置关键帧索引后，跳转目标在当前位置之后且中间没有关键帧时直接向后解码，不再跳转。
+    """
+
+    name = None
+    # 判断帧时间戳是否到达目标时间的容差（秒）
+    TIME_EPSILON = 1e-3
+    # 帧时间戳是否由帧序号和帧率算出，是时按输出帧率读取可以跳过不输出的帧
+    constant_frame_rate = False
+
+    def __init__(self, video_path, seek_index=None):
+        """打开视频
+
+        Args:
+            video_path: 视频路径
+            seek_index: 关键帧索引SeekIndex，为None时每次跳转都交给解码器处理
+        """
+        self.video_path = video_path
+        self.seek_index = seek_index
+        self.width = 0
+        self.height = 0
+        self.fps = 0
+        self.frame_count = 0
+        self.duration = 0
+        # 下次read返回的帧，由跳转或区间读取放回
+        self._pending = None
+        # 下次read返回的帧的时间，未知时为None
+        self._position = 0.0
+        # 解码器内部的裁剪区域和缩小后的尺寸，为None时输出原始帧
+        self.output_region = None
+        self.output_size = None
+        self._open()
+
+    @classmethod
+    def is_available(cls):
+        """当前环境是否具备该解码器的依赖"""
+        return True
+
+    @property
+    def metadata(self):
+        """视频元数据字典，格式与VideoProcessor.probe_video一致"""
+        return {
+            'width': self.width,
+            'height': self.height,
+            'fps': self.fps,
+            'frame_count': self.frame_count,
+            'duration': self.duration
+        }
+
+    def set_output(self, region=None, size=None):
+        """在解码器内部先裁剪再缩小后输出帧，需要在读取帧之前设置
+
+        Args:
+            region: 裁剪区域(x, y, width, height)，为None时不裁剪
+            size: 裁剪后缩小到的尺寸(宽, 高)，为None时不缩小
+        """
+        self.output_region = tuple(region) if region else None
+        self.output_size = tuple(size) if size else None
+
+    def _reshape(self, frame):
+        """按输出设置裁剪并缩小帧"""
+        frame = crop_frame(frame, self.output_region)
+        if self.output_size is not None:
+            frame = cv2.resize(frame, self.output_size, interpolation=cv2.INTER_AREA)
+        return frame
+
+    def _open(self):
+        raise NotImplementedError
+
+    def _read(self):
+        """顺序读取下一帧，返回 (时间戳, RGB帧)，读完时返回None"""
+        raise NotImplementedError
+
+    def _skip(self):
+        """顺序跳过下一帧，不转换为RGB，读完时返回False"""
+        return self._read() is not None
+
+    def _seek(self, timestamp, keyframe=None):
+        """跳转到指定时间，之后_read从不晚于timestamp的位置开始返回帧
+
+        Args:
+            timestamp: 目标时间（秒）
+            keyframe: 索引中不晚于目标的最近关键帧时间，没有索引时为None
+        """
+        raise NotImplementedError
+
+    def read(self):
+        """顺序读取下一帧，返回 (时间戳, RGB帧)，读完时返回None"""
+        if self._pending is not None:
+            item, self._pending = self._pending, None
+        else:
+            item = self._read()
+
+        if item is None:
+            self._position = None
+        else:
+            self._position = item[0] + (1.0 / self.fps if self.fps > 0 else 0.0)
+        return item
+
+    def _unread(self, item):
+        """放回一帧，下次read时返回"""
+        self._pending = item
+        self._position = item[0]
+
+    def _should_read_forward(self, timestamp):
+        """从当前位置顺序解码到目标时间是否比跳转更快"""
+        # 下一帧之前的帧已经读过，目标落在上一帧之后、下一帧之前时下一帧就是目标帧
+        interval = 1.0 / self.fps if self.fps > 0 else 0.0
+        if self._position is None or timestamp < self._position - interval + self.TIME_EPSILON:
+            return False
+        if self.seek_index is not None:
+            # 中间有关键帧时跳转到该关键帧解码的帧更少
+            return not self.seek_index.has_keyframe_between(self._position, timestamp)
+        # 没有索引时只在目标就是下一帧时不跳转
+        return self.fps > 0 and timestamp < self._position + 1.0 / self.fps - self.TIME_EPSILON
+
+    def seek(self, timestamp):
+        """跳转到指定时间（秒），之后read返回时间戳不早于timestamp的第一帧"""
+        timestamp = max(0.0, timestamp)
+        if not self._should_read_forward(timestamp):
+            keyframe = self.seek_index.keyframe_before(timestamp) if self.seek_index is not None else None
+            self._pending = None
+            self._position = None
+            self._seek(timestamp, keyframe)
+
+        # 丢弃目标时间之前的帧
+        while True:
+            item = self.read()
+            if item is None:
+                return
+            if item[0] >= timestamp - self.TIME_EPSILON:
+                self._unread(item)
+                return
+
+    def seek_frame(self, frame_index):
+        """跳转到指定帧序号"""
+        self.seek(frame_index / self.fps if self.fps > 0 else 0)
+
+    def close(self):
+        raise NotImplementedError
+
+    def iter_frames(self, start=0, end=None, fps=None):
+        """按输出帧率读取 [start, end) 区间的帧
+
+        每个输出时间点取时间戳不晚于它的最近一帧，fps为None时输出区间内所有原始帧。
+
+        Yields:
+            (输出时间点, RGB帧)
+        """
+        end = self.duration if end is None else min(end, self.duration)
+        if end <= start:
+            return
+
+        if fps is None:
+            self.seek(start)
+            while True:
+                item = self.read()
+                if item is None:
+                    return
+                if item[0] >= end - self.TIME_EPSILON:
+                    self._unread(item)
+                    return
+                yield item
+
+        # 开始时间落在两帧之间时第一个输出时间点取它之前的一帧，从前一个原始帧间隔内开始读取
+        interval = 1.0 / self.fps if self.fps > 0 else 0
+        self.seek(start - interval + self.TIME_EPSILON if interval else start)
+
+        total = max(1, int(math.ceil((end - start) * fps - self.TIME_EPSILON)))
+        index = 0
+        previous = None
+
+        while index < total:
+            # 再下一帧仍不晚于当前输出时间点时，下一帧不会被输出，只跳过不转换
+            following = self._position + interval if self._position is not None else None
+            if (self.constant_frame_rate and interval and self._pending is None and following is not None
+                    and following <= start + index / fps + self.TIME_EPSILON
+                    and following < self.duration - self.TIME_EPSILON):
+                if not self._skip():
+                    break
+                self._position = following
+                continue
+
+            item = self.read()
+            if item is None:
+                break
+            timestamp, frame = item
+
+            # 当前帧已越过目标时间点，目标时间点使用上一帧
+            while index < total and timestamp > start + index / fps + self.TIME_EPSILON:
+                yield start + index / fps, previous if previous is not None else frame
+                index += 1
+
+            if index >= total:
+                # 区间已输出完，越过区间的帧留给后续读取，相邻区间不需要重新跳转
+                self._unread(item)
+                return
+
+            previous = frame
+
+        # 视频结尾不足时用最后一帧补齐
+        while index < total and previous is not None:
+            yield start + index / fps, previous
+            index += 1
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class OpenCVDecoder(VideoDecoder):
+    """基于cv2.VideoCapture的解码器"""
+
+    name = 'opencv'
+    constant_frame_rate = True
+
+    def _open(self):
+        self.cap = cv2.VideoCapture(self.video_path)
+        if not self.cap.isOpened():
+            raise ValueError(f"无法打开视频文件: {self.video_path}")
+
+        self.width = int(self.cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+        self.height = int(self.cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        self.fps = self.cap.get(cv2.CAP_PROP_FPS)
+        self.frame_count = int(self.cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        self.duration = self.frame_count / self.fps if self.fps > 0 else 0
+        self._next_index = 0
+
+    def _read(self):
+        ret, frame = self.cap.read()
+        if not ret:
+            return None
+        timestamp = self._next_index / self.fps if self.fps > 0 else 0
+        self._next_index += 1
+        # 先裁剪缩小再转换颜色，转换的像素更少
+        return timestamp, cv2.cvtColor(self._reshape(frame), cv2.COLOR_BGR2RGB)
+
+    def _skip(self):
+        # 只grab不解码到内存
+        if not self.cap.grab():
+            return False
+        self._next_index += 1
+        return True
+
+    def _seek(self, timestamp, keyframe=None):
+        # 按帧序号跳转时OpenCV内部会从关键帧解码到目标帧
+        index = int(math.ceil(timestamp * self.fps - self.TIME_EPSILON)) if self.fps > 0 else 0
+        if index != self._next_index:
+            self.cap.set(cv2.CAP_PROP_POS_FRAMES, index)
+            self._next_index = index
+
+    def close(self):
+        if self.cap is not None:
+            self.cap.release()
+            self.cap = None
+
+
+class PyAVDecoder(VideoDecoder):
+    """基于PyAV的解码器，直接调用libav，支持多线程解码"""
+
+    name = 'pyav'
+
+    @classmethod
+    def is_available(cls):
+        try:
+            import av  # noqa: F401
+            return True
+        except ImportError:
+            return False
+
+    def _open(self):
+        import av
+
+        self.container = av.open(self.video_path)
+        if not self.container.streams.video:
+            self.container.close()
+            raise ValueError(f"视频文件中没有视频流: {self.video_path}")
+
+        self.stream = self.container.streams.video[0]
+        self.stream.thread_type = 'AUTO'
+
+        self.width = self.stream.codec_context.width
+        self.height = self.stream.codec_context.height
+        rate = self.stream.average_rate or self.stream.guessed_rate
+        self.fps = float(rate) if rate else 0
+        if self.stream.duration is not None:
+            self.duration = float(self.stream.duration * self.stream.time_base)
+        elif self.container.duration is not None:
+            self.duration = self.container.duration / 1000000
+        self.frame_count = self.stream.frames or int(round(self.duration * self.fps))
+
+        # 部分文件的首帧时间戳不为0，对外统一从0开始
+        self._start_offset = 0.0
+        if self.stream.start_time is not None:
+            self._start_offset = float(self.stream.start_time * self.stream.time_base)
+
+        self._frames = self.container.decode(self.stream)
+
+    def _read(self):
+        try:
+            frame = next(self._frames)
+        except (StopIteration, EOFError):
+            return None
+        # 与OpenCV后端相同，转换为RGB后再按面积缩小；在YUV上缩小的帧更平滑，试编码的大小偏小
+        image = self._reshape(frame.to_ndarray(format='rgb24'))
+        return float(frame.time or 0) - self._start_offset, image
+
+    def _seek(self, timestamp, keyframe=None):
+        # 有索引时直接跳到目标之前的关键帧，目标之前的帧由基类丢弃
+        if keyframe is not None:
+            offset = int(round((keyframe + self._start_offset) / self.stream.time_base))
+        else:
+            offset = int((timestamp + self._start_offset) / self.stream.time_base)
+        self.container.seek(offset, stream=self.stream, backward=True)
+        self._frames = self.container.decode(self.stream)
+
+    def close(self):
+        if self.container is not None:
+            self.container.close()
+            self.container = None
+
+
+class FFmpegPipeDecoder(VideoDecoder):
+    """通过ffmpeg子进程输出rawvideo管道的解码器"""
+
+    name = 'ffmpeg'
+    constant_frame_rate = True
+
+    @classmethod
+    def is_available(cls):
+        return FFmpegTools.find_ffmpeg() is not None
+
+    def _open(self):
+        self.ffmpeg = FFmpegTools.find_ffmpeg()
+        if not self.ffmpeg:
+            raise RuntimeError("未找到ffmpeg")
+
+        result = subprocess.run([self.ffmpeg, '-hide_banner', '-i', self.video_path],
+                                stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        info = result.stderr.decode('utf-8', errors='replace')
+
+        stream = re.search(r'Stream #\S+.*?Video: .*?\b(\d{2,5})x(\d{2,5})\b', info)
+        if not stream:
+            raise ValueError(f"无法读取视频信息: {self.video_path}")
+        self.width, self.height = int(stream.group(1)), int(stream.group(2))
+
+        fps = re.search(r'Video: .*?([\d.]+) (?:fps|tbr)', info)
+        self.fps = float(fps.group(1)) if fps else 0
+
+        duration = re.search(r'Duration: (\d+):(\d+):([\d.]+)', info)
+        if duration:
+            hours, minutes, seconds = duration.groups()
+            self.duration = int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+        self.frame_count = int(round(self.duration * self.fps))
+
+        self.process = None
+        self._seek(0)
+
+    def set_output(self, region=None, size=None):
+        super().set_output(region, size)
+        # 已启动的ffmpeg按新的输出设置从当前位置重新启动
+        self._seek(self._position or 0)
+
+    def _frame_size(self):
+        if self.output_size is not None:
+            return self.output_size
+        if self.output_region is not None:
+            return self.output_region[2:]
+        return self.width, self.height
+
+    def _start(self, timestamp):
+        self._stop()
+        width, height = self._frame_size()
+        # 裁剪和缩小由ffmpeg滤镜完成。先转换为RGB：YUV上的裁剪会把奇数坐标对齐到色度采样，
+        # 按面积缩小的结果也与其他后端一致
+        filters = []
+        if self.output_region is not None:
+            x, y, crop_width, crop_height = self.output_region
+            filters.append(f"crop={crop_width}:{crop_height}:{x}:{y}")
+        if self.output_size is not None:
+            filters.append(f"scale={width}:{height}:flags=area")
+        video_filter = ['-vf', ','.join(['format=rgb24'] + filters)] if filters else []
+        self.process = subprocess.Popen(
+            [self.ffmpeg, '-hide_banner', '-loglevel', 'error', '-ss', f"{timestamp:.6f}",
+             '-i', self.video_path, '-map', '0:v:0'] + video_filter + ['-f', 'rawvideo', '-pix_fmt', 'rgb24', '-'],
+            stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, bufsize=width * height * 3 * 4)
+
+    def _stop(self):
+        if self.process is not None:
+            self.process.kill()
+            self.process.stdout.close()
+            self.process.wait()
+            self.process = None
+
+    def _read(self):
+        width, height = self._frame_size()
+        frame_bytes = width * height * 3
+        data = self.process.stdout.read(frame_bytes)
+        if len(data) < frame_bytes:
+            return None
+
+        timestamp = self._start_time + self._next_index / self.fps if self.fps > 0 else 0
+        self._next_index += 1
+        frame = np.frombuffer(data, dtype=np.uint8).reshape(height, width, 3)
+        return timestamp, frame
+
+    def _seek(self, timestamp, keyframe=None):
+        # 输入端-ss由ffmpeg跳到关键帧并精确丢弃之前的帧，输出的第一帧是不早于目标的第一帧
+        if self.fps > 0:
+            timestamp = math.ceil(timestamp * self.fps - self.TIME_EPSILON) / self.fps
+        self._start_time = timestamp
+        self._next_index = 0
+        self._start(timestamp)
+
+    def close(self):
+        self._stop()
+
+
+DECODERS = {
+    OpenCVDecoder.name: OpenCVDecoder,
+    PyAVDecoder.name: PyAVDecoder,
+    FFmpegPipeDecoder.name: FFmpegPipeDecoder,
+}
+
+
+class DecoderSelector:
+    """解码器自动选择类，按文件检查各解码器能否正确解码并做一次小规模测速"""
+
+    # 测速时解码的帧数
+    BENCHMARK_FRAMES = 15
+
+    def __init__(self, candidates=None, benchmark_frames=None, logger=None):
+        """初始化选择器
+
+        Args:
+            candidates: 参与选择的解码器名称列表，为None时使用全部已安装的解码器
+            benchmark_frames: 测速时解码的帧数
+            logger: 日志函数
+        """
+        self.candidates = candidates or list(DECODERS)
+        self.benchmark_frames = benchmark_frames or self.BENCHMARK_FRAMES
+        self.logger = logger
+        self._cache = {}
+        self._lock = threading.Lock()
+
+    def log(self, message):
+        """输出日志"""
+        if self.logger:
+            self.logger(message)
+
+    def _cache_key(self, video_path):
+        stat = os.stat(video_path)
+        return os.path.abspath(video_path), stat.st_size, stat.st_mtime
+
+    def _benchmark(self, decoder_class, video_path):
+        """返回解码测试帧的耗时，无法正确解码时返回None"""
+        begin = time.perf_counter()
+        frames = 0
+        try:
+            with decoder_class(video_path) as decoder:
+                for _ in range(self.benchmark_frames):
+                    item = decoder.read()
+                    if item is None:
+                        break
+                    if item[1].shape != (decoder.height, decoder.width, 3):
+                        return None
+                    frames += 1
+        except Exception:
+            return None
+
+        # 至少要读到一帧才算能够解码
+        return time.perf_counter() - begin if frames else None
+
+    def select(self, video_path):
+        """为视频选择最快的可用解码器
+
+        Returns:
+            解码器类
+        """
+        key = self._cache_key(video_path)
+        with self._lock:
+            if key in self._cache:
+                return self._cache[key]
+
+        timings = {}
+        for name in self.candidates:
+            decoder_class = DECODERS[name]
+            if not decoder_class.is_available():
+                continue
+            elapsed = self._benchmark(decoder_class, video_path)
+            if elapsed is not None:
+                timings[name] = elapsed
+
+        if not timings:
+            raise ValueError(f"没有可以解码该视频的解码器: {video_path}")
+
+        best = min(timings, key=timings.get)
+        self.log(f"{os.path.basename(video_path)} 选择解码器 {best} "
+                 f"({', '.join(f'{name} {t * 1000:.0f}ms' for name, t in timings.items())})")
+
+        with self._lock:
+            self._cache[key] = DECODERS[best]
+        return DECODERS[best]
+
+    def open(self, video_path, backend='auto', seek_index=None):
+        """打开视频并返回解码器实例
+
+        Args:
+            video_path: 视频路径
+            backend: 解码器名称，auto时自动选择
+            seek_index: 关键帧索引SeekIndex
+        """
+        if backend == 'auto':
+            return self.select(video_path)(video_path, seek_index)
+        if backend not in DECODERS:
+            raise ValueError(f"不支持的解码器: {backend}")
+        return DECODERS[backend](video_path, seek_index)
+
+
+# 未指定选择器时共享的解码器选择器，按文件缓存选择结果
+_default_selector = DecoderSelector()
+
+
+def open_decoder(video_path, backend='auto', seek_index=None, selector=None):
+    """打开视频并返回解码器实例
+
+    Args:
+        video_path: 视频路径
+        backend: 解码器名称，auto时按文件自动选择
+        seek_index: 关键帧索引SeekIndex
+        selector: DecoderSelector，为None时使用模块共享的选择器
+    """
+    return (selector or _default_selector).open(video_path, backend, seek_index)
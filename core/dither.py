@@ -0,0 +1,91 @@
+import numpy as np
+from PIL import Image
+
+
+class OrderedDither:
+    """Bayer有序抖动
+
+    先把RGB各通道按阈值矩阵加偏移，再量化到固定的256色调色板。每个通道的结果只取决于
+    像素值和阈值，预先算成查找表，对整帧用NumPy一次取表完成。阈值只与像素位置有关，
+    调色板也不随帧变化，静止区域在相邻帧之间完全相同，不会闪烁，也不影响LZW压缩和帧间差分。
+    """
+
+    def __init__(self, levels=(6, 7, 6), matrix_size=8):
+        """初始化抖动器
+
+        Args:
+            levels: R、G、B各通道的量化级数，乘积不超过256
+            matrix_size: Bayer矩阵边长，2的幂
+        """
+        if int(np.prod(levels)) > 256:
+            raise ValueError("调色板颜色数不能超过256")
+        if matrix_size < 2 or matrix_size & (matrix_size - 1):
+            raise ValueError("Bayer矩阵边长必须是2的幂")
+
+        self.levels = np.array(levels, dtype=np.int32)
+        self.matrix_size = matrix_size
+        self.matrix = self.bayer_matrix(matrix_size)
+        self.palette = self._build_palette()
+        self._tables = self._build_tables()
+        self._offset_cache = {}
+
+    @staticmethod
+    def bayer_matrix(size):
+        """生成 size*size 的Bayer索引矩阵，取值为 0 ~ size*size-1"""
+        matrix = np.zeros((1, 1), dtype=np.int32)
+        while matrix.shape[0] < size:
+            matrix = np.block([[4 * matrix, 4 * matrix + 2],
+                               [4 * matrix + 3, 4 * matrix + 1]])
+        return matrix
+
+    def _build_palette(self):
+        red, green, blue = (np.arange(level) * 255 // (level - 1) for level in self.levels)
+        grid = np.stack(np.meshgrid(red, green, blue, indexing='ij'), axis=-1).reshape(-1, 3)
+        palette = np.zeros((256, 3), dtype=np.uint8)
+        palette[:len(grid)] = grid
+        return palette.reshape(-1).tolist()
+
+    def _build_tables(self):
+        """每个通道的查找表: (阈值序号, 像素值) -> 该通道对调色板索引的贡献"""
+        cells = self.matrix_size ** 2
+        values = np.arange(256, dtype=np.int32)[None, :]
+        thresholds = np.arange(cells, dtype=np.int32)[:, None]
+        strides = (self.levels[1] * self.levels[2], self.levels[2], 1)
+
+        tables = []
+        for level, stride in zip(self.levels, strides):
+            # q = floor(x * (L-1) / 255 + (2m+1) / (2n))，放大 2n*255 倍后整数运算
+            quantized = (values * (level - 1) * 2 * cells + (2 * thresholds + 1) * 255) // (255 * 2 * cells)
+            tables.append((np.minimum(quantized, level - 1) * stride).astype(np.uint8).ravel())
+        return tables
+
+    def _offsets(self, height, width):
+        """平铺到帧大小的查找表行偏移，按帧大小缓存"""
+        key = (height, width)
+        if key not in self._offset_cache:
+            size = self.matrix_size
+            tiles = (-(-height // size), -(-width // size))
+            tiled = np.tile(self.matrix, tiles)[:height, :width]
+            self._offset_cache[key] = (tiled * 256).astype(np.intp)
+        return self._offset_cache[key]
+
+    def quantize(self, frame):
+        """把RGB帧抖动并量化为调色板索引
+
+        Args:
+            frame: (H, W, 3) 的uint8数组
+
+        Returns:
+            (H, W) 的uint8调色板索引数组
+        """
+        offsets = self._offsets(*frame.shape[:2])
+        red, green, blue = self._tables
+        return (red[offsets + frame[..., 0]] + green[offsets + frame[..., 1]]
+                + blue[offsets + frame[..., 2]])
+
+    def apply(self, frame):
+        """把RGB帧转换为使用固定调色板的Pillow P模式图像"""
+        # L模式图像设置调色板后即为P模式
+        image = Image.fromarray(self.quantize(frame))
+        image.putpalette(self.palette)
+        return image
@@ -0,0 +1,496 @@
+import io
+import os
+import struct
+import zlib
+
+import numpy as np
+from PIL import Image
+
+from core.file_manager import FileManager
+from core.dither import OrderedDither
+
+
+class SegmentWriter:
+    """片段写入器，逐帧接收图像，关闭时写出动图文件"""
+
+    def __init__(self, output, fps, output_format):
+        """初始化写入器
+
+        Args:
+            output: 输出文件路径或可写的文件对象
+            fps: 帧率
+            output_format: 所属的输出格式OutputFormat
+        """
+        self.output = output
+        self.fps = fps
+        self.output_format = output_format
+        self.frames = []
+        self.durations = []
+
+    def add_frame(self, frame):
+        """添加一帧，frame为 (H, W, 3) 的uint8数组"""
+        self.add_prepared_frame(self.output_format.prepare_frame(frame))
+
+    def add_prepared_frame(self, image):
+        """添加一帧已经过prepare_frame转换的Pillow图像"""
+        self.frames.append(image)
+        self.durations.append(1000 / self.fps)
+
+    def repeat_last_frame(self):
+        """上一帧再显示一个帧间隔，用于跳过与上一帧相同的帧"""
+        if not self.frames:
+            raise ValueError("没有可重复的帧")
+        self.durations[-1] += 1000 / self.fps
+
+    def close(self):
+        """写出文件"""
+        if not self.frames:
+            raise ValueError("片段中没有可写入的帧")
+
+        try:
+            self.frames[0].save(self.output, format=self.output_format.image_format, save_all=True,
+                                append_images=self.frames[1:], duration=self.durations,
+                                loop=0, **self.output_format.save_options)
+        except Exception:
+            self.abort()
+            raise
+        finally:
+            self.frames = []
+            self.durations = []
+
+    def abort(self):
+        """放弃写入并删除不完整的输出文件"""
+        self.frames = []
+        self.durations = []
+        if isinstance(self.output, str) and os.path.exists(self.output):
+            os.remove(self.output)
+
+
+class SpooledSegmentWriter(SegmentWriter):
+    """帧缓存写入器，用于较长的片段
+
+    RGB帧先写入磁盘缓存，关闭时逐帧读出、转换并交给输出格式流式编码，
+    写出完成或放弃时自动删除缓存文件。
+    """
+
+    def __init__(self, output, fps, output_format, capacity, spool_dir=None):
+        """初始化写入器
+
+        Args:
+            output: 输出文件路径或可写的文件对象
+            fps: 帧率
+            output_format: 所属的输出格式OutputFormat
+            capacity: 片段最多包含的帧数
+            spool_dir: 缓存文件所在目录，为None时使用系统临时目录
+        """
+        super().__init__(output, fps, output_format)
+        self.capacity = capacity
+        self.spool_dir = spool_dir
+        self.spool = None
+
+    def add_frame(self, frame):
+        """添加一帧，frame为 (H, W, 3) 的uint8数组，写入缓存而不转换"""
+        if self.spool is None:
+            self.spool = FileManager.create_frame_spool(frame.shape, self.capacity, self.spool_dir)
+        self.spool.append(frame)
+        self.durations.append(1000 / self.fps)
+
+    def add_prepared_frame(self, image):
+        """添加一帧Pillow图像，转换回RGB数组后写入缓存"""
+        self.add_frame(np.asarray(image.convert('RGB')))
+
+    def repeat_last_frame(self):
+        """上一帧再显示一个帧间隔，用于跳过与上一帧相同的帧"""
+        if not self.durations:
+            raise ValueError("没有可重复的帧")
+        self.durations[-1] += 1000 / self.fps
+
+    def _release_spool(self):
+        if self.spool is not None:
+            self.spool.close()
+            self.spool = None
+
+    def close(self):
+        """逐帧从缓存读出并写出文件"""
+        if self.spool is None or not len(self.spool):
+            raise ValueError("片段中没有可写入的帧")
+
+        prepare = self.output_format.prepare_frame
+        spool = self.spool
+        try:
+            self.output_format.write_frames(self.output, (prepare(frame) for frame in spool),
+                                            len(spool), self.durations)
+        except Exception:
+            self.abort()
+            raise
+        finally:
+            self.durations = []
+            self._release_spool()
+
+    def abort(self):
+        """放弃写入，删除缓存文件和不完整的输出文件"""
+        self._release_spool()
+        super().abort()
+
+
+def _changed_region(previous, current):
+    """两帧RGB数组中内容不同的矩形区域(left, top, right, bottom)，完全相同时返回None"""
+    changed = np.any(previous != current, axis=2)
+    rows = np.flatnonzero(changed.any(axis=1))
+    if not len(rows):
+        return None
+    columns = np.flatnonzero(changed.any(axis=0))
+    return int(columns[0]), int(rows[0]), int(columns[-1]) + 1, int(rows[-1]) + 1
+
+
+class _SequentialFrames(Image.Image):
+    """按顺序逐帧换入的多帧图像
+
+    Pillow保存多帧图像时先把append_images转换为列表，传入单个多帧图像时列表只有这一个
+    对象，每次seek才取出下一帧，编码器内部只保留压缩后的数据。
+    """
+
+    def __init__(self, frames, count):
+        super().__init__()
+        self._frames = iter(frames)
+        self.n_frames = count
+        self.is_animated = count > 1
+        self._current = -1
+        self.seek(0)
+
+    def seek(self, frame):
+        if frame == self._current:
+            return
+        if frame != self._current + 1 or frame >= self.n_frames:
+            raise EOFError("只能按顺序读取下一帧")
+        image = next(self._frames)
+        image.load()
+        self.im = image.im
+        self._mode = image.mode
+        self._size = image.size
+        self.info = dict(image.info)
+        self.palette = image.palette
+        self._current = frame
+
+    def tell(self):
+        return self._current
+
+
+class OutputFormat:
+    """输出格式基类"""
+
+    name = None
+    extension = None
+    image_format = None
+    writer_class = SegmentWriter
+
+    def __init__(self, **save_options):
+        """初始化输出格式
+
+        Args:
+            save_options: 传给Pillow保存函数的额外参数，覆盖格式默认值
+        """
+        self.save_options = dict(self.default_options())
+        self.save_options.update(save_options)
+
+    def default_options(self):
+        """格式默认的保存参数"""
+        return {}
+
+    def prepare_frame(self, frame):
+        """将RGB帧转换为待保存的Pillow图像，不依赖写入器状态，可以在其它线程中执行"""
+        return Image.fromarray(frame)
+
+    def create_writer(self, output, fps, spool_capacity=None, spool_dir=None):
+        """创建片段写入器
+
+        Args:
+            output: 输出文件路径或可写的文件对象
+            fps: 帧率
+            spool_capacity: 片段最多包含的帧数，不为None时帧缓存到磁盘，
+                写入器的add_frame直接接收未转换的RGB帧
+            spool_dir: 帧缓存文件所在目录
+        """
+        if spool_capacity is not None:
+            return SpooledSegmentWriter(output, fps, self, spool_capacity, spool_dir)
+        return self.writer_class(output, fps, self)
+
+    def write_frames(self, output, frames, count, durations):
+        """逐帧写出动图文件，用于从磁盘缓存读出的长片段
+
+        Args:
+            output: 输出文件路径或可写的文件对象
+            frames: 按顺序产生待保存Pillow图像的迭代器，只遍历一次
+            count: 帧数
+            durations: 每帧的显示时间（毫秒）
+        """
+        frames = iter(frames)
+        first = next(frames)
+        rest = [_SequentialFrames(frames, count - 1)] if count > 1 else []
+        first.save(output, format=self.image_format, save_all=True, append_images=rest,
+                   duration=list(durations), loop=0, **self.save_options)
+
+    def output_path(self, output_dir, segment_index):
+        """片段的输出文件路径"""
+        return os.path.join(output_dir, f"{segment_index + 1}.{self.extension}")
+
+
+class GifFormat(OutputFormat):
+    """GIF格式，256色调色板，LZW压缩"""
+
+    name = 'gif'
+    extension = 'gif'
+    image_format = 'GIF'
+
+    # 抖动方式: none 每帧自适应调色板、不抖动，bayer 固定调色板加Bayer有序抖动
+    DITHER_MODES = ('none', 'bayer')
+
+    def __init__(self, dither=None, **save_options):
+        """初始化GIF格式
+
+        Args:
+            dither: 抖动方式，none 或 bayer；为None时未指定，Python编码与none相同，
+                ffmpeg后端使用其默认的误差扩散抖动
+            save_options: 传给Pillow保存函数的额外参数
+        """
+        if dither is not None and dither not in self.DITHER_MODES:
+            raise ValueError(f"不支持的抖动方式: {dither}")
+        super().__init__(**save_options)
+        self.dither = dither
+        self.ditherer = OrderedDither() if dither == 'bayer' else None
+
+    def prepare_frame(self, frame):
+        """帧在加入时即量化为调色板图像，减少在途和待写入帧的内存占用"""
+        if self.ditherer is not None:
+            return self.ditherer.apply(frame)
+        return Image.fromarray(frame).convert('P', palette=Image.Palette.ADAPTIVE)
+
+    def _encode_frame(self, image, transparency=None):
+        """用Pillow把单帧编码为GIF
+
+        Returns:
+            (逻辑屏幕描述符和全局调色板, 图像描述符, 图像数据, 透明色索引)，
+            Pillow优化调色板后透明色索引可能改变
+        """
+        buffer = io.BytesIO()
+        options = dict(self.save_options)
+        if transparency is not None:
+            options['transparency'] = transparency
+        image.save(buffer, format='GIF', interlace=False, **options)
+        data = buffer.getvalue()
+        screen_end = 13
+        if data[10] & 0x80:
+            screen_end += 3 << ((data[10] & 0x07) + 1)
+        position = screen_end
+        transparency = None
+        # 跳过扩展块，只从图形控制扩展中取透明色
+        while data[position] == 0x21:
+            if data[position + 1] == 0xF9 and data[position + 3] & 0x01:
+                transparency = data[position + 6]
+            position += 2
+            while data[position]:
+                position += data[position] + 1
+            position += 1
+        if data[position] != 0x2C or data[-1] != 0x3B:
+            raise ValueError("无法解析单帧GIF")
+        return data[6:screen_end], data[position:position + 10], data[position + 10:-1], transparency
+
+    @staticmethod
+    def _delta_frame(image, previous, current, region):
+        """裁剪到变化区域，区域内与上一帧相同的像素填充为未使用的颜色作为透明色
+
+        Returns:
+            (裁剪后的图像, 透明色索引)，调色板已用满时透明色为None
+        """
+        left, top, right, bottom = region
+        image = image.crop(region)
+        indices = np.asarray(image)
+        unused = np.flatnonzero(np.bincount(indices.ravel(), minlength=256) == 0)
+        if not len(unused):
+            return image, None
+        transparency = int(unused[0])
+        unchanged = np.all(previous[top:bottom, left:right] == current[top:bottom, left:right], axis=2)
+        palette = image.getpalette() or []
+        palette += [0] * max(0, (transparency + 1) * 3 - len(palette))
+        delta = Image.fromarray(np.where(unchanged, transparency, indices).astype(np.uint8), 'P')
+        delta.putpalette(palette)
+        return delta, transparency
+
+    def write_frames(self, output, frames, count, durations):
+        """逐帧写出GIF
+
+        每帧单独用Pillow编码后拼接图像块：首帧的调色板作为全局调色板，之后的帧只编码与
+        上一帧不同的矩形区域并带局部调色板，区域内不变的像素设为透明，与上一帧相同的帧
+        并入上一帧的显示时间，和Pillow一次保存全部帧的结果一致。常驻内存只有上一帧和
+        一帧编码后的数据。
+        """
+        if isinstance(output, (str, bytes, os.PathLike)):
+            with open(output, 'wb') as file:
+                return self.write_frames(file, frames, count, durations)
+
+        previous = None
+        pending = None
+        for image, duration in zip(frames, durations):
+            current = np.asarray(image.convert('RGB'))
+            if previous is None:
+                screen, descriptor, body, transparency = self._encode_frame(image)
+                output.write(b'GIF89a' + screen)
+                output.write(b'!\xff\x0bNETSCAPE2.0\x03\x01' + struct.pack('<H', 0) + b'\x00')
+            else:
+                region = _changed_region(previous, current)
+                if region is None:
+                    pending[0] += duration
+                    continue
+                screen, descriptor, body, transparency = self._encode_frame(
+                    *self._delta_frame(image, previous, current, region))
+                # 单帧文件的全局调色板改为局部调色板
+                flags = descriptor[9]
+                if screen[4] & 0x80:
+                    flags |= 0x80 | (screen[4] & 0x07)
+                descriptor = (b',' + struct.pack('<4H', region[0], region[1], region[2] - region[0],
+                                                 region[3] - region[1]) + bytes([flags]) + screen[7:])
+            if pending is not None:
+                self._write_block(output, *pending)
+            pending = [duration, transparency, descriptor, body]
+            previous = current
+        if pending is None:
+            raise ValueError("片段中没有可写入的帧")
+        self._write_block(output, *pending)
+        output.write(b';')
+
+    @staticmethod
+    def _write_block(output, duration, transparency, descriptor, body):
+        """写出图形控制扩展和图像块"""
+        delay = int(duration / 10)
+        if delay or transparency is not None:
+            output.write(b'!\xf9\x04' + bytes([1 if transparency is not None else 0])
+                         + struct.pack('<H', delay) + bytes([transparency or 0]) + b'\x00')
+        output.write(descriptor)
+        output.write(body)
+
+
+class WebPFormat(OutputFormat):
+    """动态WebP格式，有损压缩，支持真彩色"""
+
+    name = 'webp'
+    extension = 'webp'
+    image_format = 'WEBP'
+
+    def default_options(self):
+        return {'quality': 80, 'method': 4}
+
+
+class ApngFormat(OutputFormat):
+    """APNG格式，无损压缩，支持真彩色"""
+
+    name = 'apng'
+    extension = 'png'
+    image_format = 'PNG'
+
+    PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+
+    @staticmethod
+    def _chunk(chunk_type, data):
+        return (struct.pack('>I', len(data)) + chunk_type + data
+                + struct.pack('>I', zlib.crc32(chunk_type + data) & 0xFFFFFFFF))
+
+    def _encode_frame(self, image):
+        """用Pillow把单帧编码为PNG，返回[(块类型, 块数据)]"""
+        buffer = io.BytesIO()
+        image.save(buffer, format='PNG', **self.save_options)
+        data = buffer.getvalue()
+        chunks = []
+        position = len(self.PNG_SIGNATURE)
+        while position < len(data):
+            length, chunk_type = struct.unpack('>I4s', data[position:position + 8])
+            chunks.append((chunk_type, data[position + 8:position + 8 + length]))
+            position += length + 12
+        return chunks
+
+    def write_frames(self, output, frames, count, durations):
+        """逐帧写出APNG
+
+        每帧单独用Pillow编码后把图像数据改写为动画帧块，之后的帧只编码与上一帧不同的
+        矩形区域，与上一帧相同的帧并入上一帧的显示时间，写完后回填文件头中的帧数。
+        常驻内存只有上一帧和一帧编码后的数据。
+        """
+        if isinstance(output, (str, bytes, os.PathLike)):
+            with open(output, 'wb') as file:
+                return self.write_frames(file, frames, count, durations)
+
+        previous = None
+        pending = None
+        animation_control = None
+        written = 0
+        sequence = 0
+        for image, duration in zip(frames, durations):
+            current = np.asarray(image.convert('RGB'))
+            if previous is None:
+                region = (0, 0) + image.size
+                chunks = self._encode_frame(image)
+                output.write(self.PNG_SIGNATURE)
+                for chunk_type, data in chunks:
+                    if chunk_type in (b'IDAT', b'IEND'):
+                        break
+                    output.write(self._chunk(chunk_type, data))
+                animation_control = output.tell()
+                output.write(self._chunk(b'acTL', struct.pack('>II', count, 0)))
+            else:
+                region = _changed_region(previous, current)
+                if region is None:
+                    pending[0] += duration
+                    continue
+                chunks = self._encode_frame(image.crop(region))
+            if pending is not None:
+                sequence = self._write_frame(output, sequence, *pending)
+                written += 1
+            pending = [duration, region, [data for chunk_type, data in chunks if chunk_type == b'IDAT']]
+            previous = current
+        if pending is None:
+            raise ValueError("片段中没有可写入的帧")
+        self._write_frame(output, sequence, *pending)
+        written += 1
+        output.write(self._chunk(b'IEND', b''))
+        if written != count:
+            end = output.tell()
+            output.seek(animation_control)
+            output.write(self._chunk(b'acTL', struct.pack('>II', written, 0)))
+            output.seek(end)
+
+    def _write_frame(self, output, sequence, duration, region, data):
+        """写出帧控制块和图像数据块，首帧使用IDAT，之后的帧使用fdAT，返回下一个序号"""
+        left, top, right, bottom = region
+        output.write(self._chunk(b'fcTL', struct.pack(
+            '>IIIIIHHBB', sequence, right - left, bottom - top, left, top,
+            int(round(duration)), 1000, 0, 0)))
+        first = sequence == 0
+        sequence += 1
+        for block in data:
+            if first:
+                output.write(self._chunk(b'IDAT', block))
+            else:
+                output.write(self._chunk(b'fdAT', struct.pack('>I', sequence) + block))
+                sequence += 1
+        return sequence
+
+
+OUTPUT_FORMATS = {
+    GifFormat.name: GifFormat,
+    WebPFormat.name: WebPFormat,
+    ApngFormat.name: ApngFormat,
+}
+
+
+def get_output_format(name, dither=None, **save_options):
+    """按名称创建输出格式
+
+    Args:
+        name: 格式名称，gif, webp 或 apng
+        dither: GIF的抖动方式(none, bayer)，为None时使用默认值，真彩色格式忽略此参数
+        save_options: 传给Pillow保存函数的额外参数
+    """
+    if name not in OUTPUT_FORMATS:
+        raise ValueError(f"不支持的输出格式: {name}")
+    if dither is not None and OUTPUT_FORMATS[name] is GifFormat:
+        save_options['dither'] = dither
+    return OUTPUT_FORMATS[name](**save_options)
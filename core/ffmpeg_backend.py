@@ -0,0 +1,162 @@
+import os
+import math
+import subprocess
+
+from core.ffmpeg_tools import FFmpegTools
+from core.cancellation import ProcessingCancelled
+
+
+class FFmpegGifBackend:
+    """ffmpeg滤镜图GIF后端
+
+    用一个ffmpeg进程完成裁剪、缩放、帧率转换以及每个片段独立的palettegen/paletteuse，
+    一次读取视频即可输出所有片段的GIF，不经过Python逐帧处理。
+    """
+
+    # 单个进程处理的最大片段数，避免滤镜图和命令行过长
+    MAX_SEGMENTS_PER_PROCESS = 64
+    # 进度输出的间隔（秒）
+    STATS_PERIOD = 0.5
+
+    def __init__(self, dither='sierra2_4a', logger=None):
+        """初始化后端
+
+        Args:
+            dither: paletteuse的抖动算法
+            logger: 日志函数
+        """
+        self.dither = dither
+        self.logger = logger
+
+    def log(self, message):
+        """输出日志"""
+        if self.logger:
+            self.logger(message)
+
+    @staticmethod
+    def is_available():
+        """本地是否有可用的ffmpeg"""
+        return FFmpegTools.find_ffmpeg() is not None
+
+    def build_filter_graph(self, segments, fps, selected_region=None, settings=None, dither=None):
+        """构建滤镜图
+
+        Args:
+            segments: (片段索引, 开始时间, 结束时间) 列表，时间相对于输入的开始时间
+            fps: 输出帧率
+            selected_region: 选择的区域(x, y, width, height)
+            settings: GifSettings，用于缩放和颜色数
+            dither: paletteuse的抖动算法，为None时使用初始化时指定的算法
+
+        Returns:
+            (滤镜图字符串, 各片段输出标签列表, 进度输出标签)
+        """
+        filters = []
+        if selected_region:
+            x, y, width, height = selected_region
+            filters.append(f"crop={width}:{height}:{x}:{y}")
+        if settings is not None and settings.scale != 1.0:
+            filters.append(f"scale=trunc(iw*{settings.scale}/2)*2:-2:flags=area")
+        filters.append(f"fps={fps}")
+
+        max_colors = settings.colors if settings is not None else 256
+        branches = ''.join(f"[s{i}]" for i in range(len(segments)))
+        graph = [f"[0:v]{','.join(filters)},split={len(segments) + 1}{branches}[tap]",
+                 "[tap]scale=2:2[progress]"]
+
+        outputs = []
+        for i, (_, seg_start, seg_end) in enumerate(segments):
+            # 过短的片段向前扩展，保证至少包含一帧
+            seg_start = max(0.0, min(seg_start, seg_end - 1.0 / fps))
+            graph.append(f"[s{i}]trim=start={seg_start:.6f}:end={seg_end:.6f},"
+                         f"setpts=PTS-STARTPTS,split[a{i}][b{i}]")
+            graph.append(f"[a{i}]palettegen=max_colors={max_colors}:stats_mode=diff[p{i}]")
+            graph.append(f"[b{i}][p{i}]paletteuse=dither={dither or self.dither}[o{i}]")
+            outputs.append(f"[o{i}]")
+
+        return ';'.join(graph), outputs, '[progress]'
+
+    def convert(self, video_path, output_dir, start_time, segments, fps, output_format,
+                selected_region=None, settings=None, cancel_token=None):
+        """输出所有片段的GIF
+
+        Args:
+            video_path: 视频路径
+            output_dir: 输出目录
+            start_time: 开始时间（秒），片段时间相对于它
+            segments: (片段索引, 开始时间, 结束时间) 列表
+            fps: 输出帧率
+            output_format: 输出格式，提供输出文件路径，GIF格式指定的抖动方式(none, bayer)传给paletteuse
+            selected_region: 选择的区域(x, y, width, height)
+            settings: GifSettings，用于缩放和颜色数
+            cancel_token: CancelToken，暂停时挂起ffmpeg，取消时结束ffmpeg、删除未完成的输出并抛出ProcessingCancelled
+        """
+        for begin in range(0, len(segments), self.MAX_SEGMENTS_PER_PROCESS):
+            batch = segments[begin:begin + self.MAX_SEGMENTS_PER_PROCESS]
+            if cancel_token is not None:
+                cancel_token.check()
+            self._convert_batch(video_path, output_dir, start_time, batch, fps, output_format,
+                                selected_region, settings, cancel_token)
+
+    def _convert_batch(self, video_path, output_dir, start_time, segments, fps, output_format,
+                       selected_region, settings, cancel_token=None):
+        ffmpeg = FFmpegTools.find_ffmpeg()
+        if not ffmpeg:
+            raise RuntimeError("未找到ffmpeg")
+
+        # 输入从第一个片段开始读取，片段时间改为相对于输入
+        offset = segments[0][1]
+        input_start = start_time + offset
+        input_duration = segments[-1][2] - offset
+        relative = [(index, seg_start - offset, seg_end - offset) for index, seg_start, seg_end in segments]
+
+        # 指定的抖动方式(none, bayer)与paletteuse的同名算法一致；未指定抖动方式或不是GIF格式时
+        # 使用初始化时的算法（默认sierra2_4a误差扩散）
+        dither = getattr(output_format, 'dither', None)
+        graph, outputs, progress_label = self.build_filter_graph(relative, fps, selected_region,
+                                                                 settings, dither)
+
+        # 进度输出放在第一个，使-progress报告的帧数反映读取位置
+        args = [ffmpeg, '-hide_banner', '-loglevel', 'error', '-nostats', '-y',
+                '-progress', 'pipe:1', '-stats_period', str(self.STATS_PERIOD),
+                '-ss', f"{input_start:.6f}", '-t', f"{input_duration:.6f}", '-i', video_path,
+                '-filter_complex', graph, '-map', progress_label, '-f', 'null', '-']
+        for (index, _, _), label in zip(segments, outputs):
+            args += ['-map', label, output_format.output_path(output_dir, index)]
+
+        total_frames = max(1, math.ceil(input_duration * fps))
+        self.log(f"ffmpeg一次生成 {len(segments)} 个片段: 片段 {segments[0][0] + 1} - {segments[-1][0] + 1}")
+
+        process = subprocess.Popen(args, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        last_percent = -1
+        cancelled = False
+        for line in process.stdout:
+            # 进度每STATS_PERIOD秒输出一次，取消和暂停在这里及时生效
+            if cancel_token is not None:
+                if cancel_token.cancelled:
+                    cancelled = True
+                    process.kill()
+                    break
+                cancel_token.hold(process)
+            key, _, value = line.decode('utf-8', errors='replace').strip().partition('=')
+            if key == 'frame' and value.isdigit():
+                percent = min(100, int(value) * 100 // total_frames) // 10 * 10
+                if percent > last_percent:
+                    last_percent = percent
+                    self.log(f"ffmpeg进度: {percent}%")
+
+        stderr = process.stderr.read().decode('utf-8', errors='replace').strip()
+        process.stdout.close()
+        process.stderr.close()
+        if process.wait() != 0 or cancelled:
+            # ffmpeg可能和当前进程一起收到了中断信号
+            cancelled = cancelled or (cancel_token is not None and cancel_token.cancelled)
+            # 删除未完成的输出
+            for index, _, _ in segments:
+                partial = output_format.output_path(output_dir, index)
+                if os.path.exists(partial):
+                    os.remove(partial)
+            if cancelled:
+                raise ProcessingCancelled("处理已取消")
+            message = stderr.splitlines()[-1] if stderr else process.returncode
+            raise RuntimeError(f"ffmpeg执行失败: {message}")
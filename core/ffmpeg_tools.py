@@ -0,0 +1,106 @@
+import re
+import shutil
+import subprocess
+
+from core.cancellation import ProcessingCancelled
+
+
+class FFmpegTools:
+    """ffmpeg工具类，查找本地ffmpeg/ffprobe并读取视频关键帧信息"""
+
+    @staticmethod
+    def find_ffmpeg():
+        """查找ffmpeg可执行文件，优先使用PATH中的ffmpeg，其次使用imageio-ffmpeg自带的版本
+
+        Returns:
+            ffmpeg路径，找不到时返回None
+        """
+        path = shutil.which('ffmpeg')
+        if path:
+            return path
+
+        try:
+            import imageio_ffmpeg
+            return imageio_ffmpeg.get_ffmpeg_exe()
+        except (ImportError, RuntimeError):
+            return None
+
+    @staticmethod
+    def find_ffprobe():
+        """查找ffprobe可执行文件，找不到时返回None"""
+        return shutil.which('ffprobe')
+
+    # 等待命令时检查取消和暂停的间隔（秒）
+    POLL_INTERVAL = 0.2
+
+    @staticmethod
+    def run(args, timeout=None, cancel_token=None):
+        """运行ffmpeg相关命令，失败时抛出RuntimeError
+
+        Args:
+            args: 命令行参数列表
+            timeout: 超时时间（秒）
+            cancel_token: CancelToken，暂停时挂起命令，取消时结束命令并抛出ProcessingCancelled
+
+        Returns:
+            subprocess.CompletedProcess
+        """
+        if cancel_token is None:
+            result = subprocess.run(args, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                    timeout=timeout)
+        else:
+            result = FFmpegTools._run_cancellable(args, cancel_token)
+        if result.returncode != 0:
+            message = result.stderr.decode('utf-8', errors='replace').strip().splitlines()
+            raise RuntimeError(f"ffmpeg执行失败: {message[-1] if message else result.returncode}")
+        return result
+
+    @staticmethod
+    def _run_cancellable(args, cancel_token):
+        process = subprocess.Popen(args, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        while True:
+            try:
+                stdout, stderr = process.communicate(timeout=FFmpegTools.POLL_INTERVAL)
+                # ffmpeg可能和当前进程一起收到了中断信号
+                if process.returncode != 0 and cancel_token.cancelled:
+                    raise ProcessingCancelled("处理已取消")
+                return subprocess.CompletedProcess(args, process.returncode, stdout, stderr)
+            except subprocess.TimeoutExpired:
+                if cancel_token.cancelled:
+                    process.kill()
+                    process.communicate()
+                    raise ProcessingCancelled("处理已取消")
+                cancel_token.hold(process)
+
+    @staticmethod
+    def list_keyframes(video_path):
+        """列出视频流中所有关键帧的时间戳
+
+        有ffprobe时只读取数据包标志，不解码；否则使用ffmpeg只解码关键帧。
+
+        Returns:
+            按时间排序的关键帧时间列表（秒）
+        """
+        ffprobe = FFmpegTools.find_ffprobe()
+        if ffprobe:
+            result = FFmpegTools.run([
+                ffprobe, '-v', 'error', '-select_streams', 'v:0',
+                '-show_entries', 'packet=pts_time,flags', '-of', 'csv=p=0', video_path
+            ])
+            times = []
+            for line in result.stdout.decode('utf-8', errors='replace').splitlines():
+                parts = line.strip().split(',')
+                if len(parts) >= 2 and 'K' in parts[1] and parts[0] not in ('', 'N/A'):
+                    times.append(float(parts[0]))
+            return sorted(times)
+
+        ffmpeg = FFmpegTools.find_ffmpeg()
+        if not ffmpeg:
+            raise RuntimeError("未找到ffmpeg，无法读取关键帧")
+
+        result = FFmpegTools.run([
+            ffmpeg, '-hide_banner', '-nostats', '-skip_frame', 'nokey', '-i', video_path,
+            '-map', '0:v:0', '-an', '-vf', 'showinfo', '-f', 'null', '-'
+        ])
+        output = result.stderr.decode('utf-8', errors='replace')
+        return sorted(float(t) for t in re.findall(r'pts_time:\s*([-\d.]+)', output))
@@ -1,6 +1,9 @@
 import os
 import glob
 import shutil
+import tempfile
+
+import numpy as np
 
 
 class FileManager:
@@ -45,3 +48,84 @@ class FileManager:
         else:
             os.makedirs(directory)
         return directory
+
+    @staticmethod
+    def create_frame_spool(frame_shape, capacity, directory=None):
+        """在本地磁盘上创建帧缓存
+
+        Args:
+            frame_shape: 帧的形状，如 (H, W, 3)
+            capacity: 最多缓存的帧数
+            directory: 缓存文件所在目录，为None时使用系统临时目录
+
+        Returns:
+            FrameSpool，关闭时自动删除缓存文件
+        """
+        if directory:
+            FileManager.ensure_directory(directory)
+        return FrameSpool(frame_shape, capacity, directory)
+
+
+class FrameSpool:
+    """磁盘上的帧缓存
+
+    帧依次追加写入临时文件，读取时逐帧读回，常驻内存不随帧数增长。不使用内存映射：
+    映射页面读写过后都计入进程的常驻内存，长片段与全部帧留在内存中无异。
+    """
+
+    def __init__(self, frame_shape, capacity, directory=None):
+        """创建缓存文件
+
+        Args:
+            frame_shape: 帧的形状，如 (H, W, 3)
+            capacity: 最多缓存的帧数
+            directory: 缓存文件所在目录，为None时使用系统临时目录
+        """
+        self.frame_shape = tuple(frame_shape)
+        self.frame_bytes = int(np.prod(self.frame_shape))
+        self.capacity = capacity
+        self.count = 0
+
+        fd, self.path = tempfile.mkstemp(prefix='frame_spool_', suffix='.raw', dir=directory)
+        self._file = os.fdopen(fd, 'w+b')
+
+    def append(self, frame):
+        """追加一帧"""
+        if self.count >= self.capacity:
+            raise ValueError(f"帧缓存已满: {self.capacity} 帧")
+        frame = np.ascontiguousarray(frame, dtype=np.uint8)
+        if frame.shape != self.frame_shape:
+            raise ValueError(f"帧形状 {frame.shape} 与缓存的 {self.frame_shape} 不一致")
+        self._file.seek(self.count * self.frame_bytes)
+        self._file.write(frame.data)
+        self.count += 1
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, index):
+        if not 0 <= index < self.count:
+            raise IndexError(index)
+        frame = np.empty(self.frame_shape, dtype=np.uint8)
+        self._file.seek(index * self.frame_bytes)
+        if self._file.readinto(frame.data) != self.frame_bytes:
+            raise IOError(f"帧缓存文件不完整: {self.path}")
+        return frame
+
+    def __iter__(self):
+        for index in range(self.count):
+            yield self[index]
+
+    def close(self):
+        """关闭并删除缓存文件"""
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
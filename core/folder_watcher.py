@@ -0,0 +1,364 @@
+import os
+import sys
+import json
+import time
+import errno
+import select
+import struct
+import threading
+import ctypes
+import ctypes.util
+from concurrent.futures import ThreadPoolExecutor
+
+from core.file_manager import FileManager
+from core.scheduler import JobScheduler
+from core.cancellation import ProcessingCancelled
+
+
+class InotifyWatch:
+    """通过ctypes调用Linux inotify监视单个目录"""
+
+    IN_MODIFY = 0x00000002
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_TO = 0x00000080
+    IN_CREATE = 0x00000100
+    IN_Q_OVERFLOW = 0x00004000
+    IN_NONBLOCK = 0o4000
+    IN_CLOEXEC = 0o2000000
+
+    EVENT_HEADER = struct.Struct('iIII')
+    WATCH_MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+
+    def __init__(self, directory):
+        """开始监视目录，失败时抛出OSError"""
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        self.fd = libc.inotify_init1(self.IN_NONBLOCK | self.IN_CLOEXEC)
+        if self.fd < 0:
+            code = ctypes.get_errno()
+            raise OSError(code, os.strerror(code))
+
+        if libc.inotify_add_watch(self.fd, os.fsencode(directory), self.WATCH_MASK) < 0:
+            code = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(code, os.strerror(code))
+
+    @staticmethod
+    def is_available():
+        """当前系统是否支持inotify"""
+        return sys.platform.startswith('linux')
+
+    def wait(self, timeout):
+        """等待事件
+
+        Returns:
+            (发生变化的文件名集合, 事件队列是否溢出)，超时返回空集合。溢出时有事件丢失，
+            需要重新扫描目录
+        """
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return set(), False
+
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return set(), False
+
+        names = set()
+        overflowed = False
+        offset = 0
+        while offset + self.EVENT_HEADER.size <= len(data):
+            _, mask, _, length = self.EVENT_HEADER.unpack_from(data, offset)
+            offset += self.EVENT_HEADER.size
+            name = data[offset:offset + length].rstrip(b'\0')
+            offset += length
+            if mask & self.IN_Q_OVERFLOW:
+                overflowed = True
+            if name:
+                names.add(os.fsdecode(name))
+        return names, overflowed
+
+    def close(self):
+        os.close(self.fd)
+
+
+class FolderWatcher:
+    """文件夹监视类
+
+    发现目录中新增或仍在写入的视频文件，等文件大小和修改时间在settle_time秒内
+    不再变化后才视为写入完成。Linux上使用inotify接收变化通知，其它系统或
+    inotify不可用时定期扫描目录。使用inotify时也每隔rescan_interval秒扫描一次，
+    事件队列溢出时立即扫描，补上丢失的事件。
+    """
+
+    def __init__(self, directory, extensions, settle_time=5.0, poll_interval=2.0,
+                 use_inotify=True, logger=None, rescan_interval=60.0):
+        """初始化监视器
+
+        Args:
+            directory: 监视的目录
+            extensions: 视频扩展名列表，如 ['.mp4', '.avi']
+            settle_time: 文件大小保持不变多少秒后视为写入完成
+            poll_interval: 检查间隔（秒）
+            use_inotify: 是否尝试使用inotify
+            logger: 日志函数
+            rescan_interval: 使用inotify时完整扫描目录的间隔（秒）
+        """
+        self.directory = directory
+        self.extensions = tuple(ext.lower() for ext in extensions)
+        self.settle_time = settle_time
+        self.poll_interval = poll_interval
+        self.use_inotify = use_inotify
+        self.rescan_interval = rescan_interval
+        self.logger = logger
+        self.inotify = None
+        self._last_scan = None
+        # 等待写入完成的文件: 路径 -> (大小, 修改时间, 开始保持不变的时间)
+        self._pending = {}
+        self._stop = threading.Event()
+
+    def log(self, message):
+        """输出日志"""
+        if self.logger:
+            self.logger(message)
+
+    def _is_video(self, name):
+        return name.lower().endswith(self.extensions)
+
+    def _scan(self):
+        """把目录中所有视频文件加入待检查列表
+
+        目录暂时无法访问（如网络共享短暂断开）时记录日志，下次检查时重新扫描。
+        """
+        self._last_scan = time.monotonic()
+        try:
+            names = os.listdir(self.directory)
+        except OSError as e:
+            self.log(f"扫描目录出错，下次检查时重试: {str(e)}")
+            # 使用inotify时也不等到下一次定期扫描
+            self._last_scan = None
+            return
+        for name in names:
+            path = os.path.join(self.directory, name)
+            if self._is_video(name) and os.path.isfile(path):
+                self._pending.setdefault(path, None)
+
+    def start(self):
+        """开始监视，目录中已有的文件也会被检查"""
+        if self.use_inotify and InotifyWatch.is_available():
+            try:
+                self.inotify = InotifyWatch(self.directory)
+                self.log(f"使用inotify监视目录: {self.directory}")
+            except OSError as e:
+                self.log(f"inotify不可用，改为定期扫描: {str(e)}")
+        if self.inotify is None:
+            self.log(f"每 {self.poll_interval} 秒扫描目录: {self.directory}")
+        self._scan()
+
+    def stop(self):
+        """让正在等待的poll尽快返回"""
+        self._stop.set()
+
+    def close(self):
+        """停止监视并释放资源"""
+        self._stop.set()
+        if self.inotify is not None:
+            self.inotify.close()
+            self.inotify = None
+
+    def _wait(self):
+        if self.inotify is None:
+            self._stop.wait(self.poll_interval)
+            if not self._stop.is_set():
+                self._scan()
+            return
+
+        # 有等待写入完成的文件时缩短等待，按时检查它们是否稳定
+        names, overflowed = self.inotify.wait(self.poll_interval)
+        for name in names:
+            if self._is_video(name):
+                self._pending.setdefault(os.path.join(self.directory, name), None)
+        if overflowed:
+            self.log("inotify事件队列溢出，重新扫描目录")
+            self._scan()
+        elif self._last_scan is None or time.monotonic() - self._last_scan >= self.rescan_interval:
+            self._scan()
+
+    def poll(self):
+        """等待一个检查间隔，返回已写入完成的文件
+
+        Returns:
+            写入完成的文件路径列表
+        """
+        self._wait()
+
+        ready = []
+        now = time.monotonic()
+        for path, state in list(self._pending.items()):
+            try:
+                stat = os.stat(path)
+            except OSError as e:
+                if e.errno == errno.ENOENT:
+                    del self._pending[path]
+                continue
+
+            current = (stat.st_size, stat.st_mtime)
+            if state is None or state[:2] != current:
+                self._pending[path] = current + (now,)
+            elif stat.st_size > 0 and now - state[2] >= self.settle_time:
+                del self._pending[path]
+                ready.append(path)
+        return sorted(ready)
+
+
+class ProcessedLedger:
+    """已处理文件记录
+
+    以JSON保存每个文件处理时的大小和修改时间，文件内容变化后会重新处理。
+    """
+
+    def __init__(self, path):
+        """初始化记录
+
+        Args:
+            path: 记录文件路径
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        self._records = {}
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                self._records = json.load(f)
+        except (OSError, ValueError):
+            self._records = {}
+
+    @staticmethod
+    def _signature(video_path):
+        stat = os.stat(video_path)
+        return [stat.st_size, stat.st_mtime]
+
+    def is_processed(self, video_path):
+        """文件当前的内容是否已经处理过（包括处理失败）"""
+        with self._lock:
+            record = self._records.get(os.path.abspath(video_path))
+        try:
+            return record is not None and record['signature'] == self._signature(video_path)
+        except OSError:
+            return False
+
+    def mark(self, video_path, success):
+        """记录文件的处理结果"""
+        try:
+            signature = self._signature(video_path)
+        except OSError:
+            return
+
+        with self._lock:
+            self._records[os.path.abspath(video_path)] = {'signature': signature, 'success': success}
+            FileManager.ensure_directory(os.path.dirname(os.path.abspath(self.path)))
+            temp_path = f"{self.path}.tmp"
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump(self._records, f, ensure_ascii=False, indent=1)
+            os.replace(temp_path, self.path)
+
+
+class WatchService:
+    """监视文件夹并增量处理新视频
+
+    写入完成且未处理过的视频逐个交给VideoProcessor，最多同时处理concurrency个，
+    处理结果记录在输出目录中，重新启动后不会重复处理。所有处理线程共用一个JobScheduler，
+    每个视频开始前按预估内存从同一份预算中申请，同时处理的视频合计不超过预算。
+    """
+
+    LEDGER_NAME = '.watch_processed.json'
+
+    def __init__(self, processor, input_path, output_path, concurrency=1, settle_time=5.0,
+                 poll_interval=2.0, use_inotify=True, **process_options):
+        """初始化服务
+
+        Args:
+            processor: VideoProcessor
+            input_path: 监视的输入目录
+            output_path: 输出目录
+            concurrency: 同时处理的视频数
+            settle_time: 文件大小保持不变多少秒后视为写入完成
+            poll_interval: 检查间隔（秒）
+            use_inotify: 是否尝试使用inotify
+            process_options: 传给VideoProcessor.process_videos的其它参数，
+                memory_budget和schedule_order用于共用的调度器
+        """
+        if process_options.get('archive') == 'run':
+            raise ValueError("监视模式逐个处理新视频，不支持整批打包，请使用按视频打包")
+
+        self.processor = processor
+        self.input_path = input_path
+        self.output_path = output_path
+        self.concurrency = max(1, concurrency)
+        self.scheduler = JobScheduler(memory_budget=process_options.pop('memory_budget', None),
+                                      max_workers=self.concurrency,
+                                      order=process_options.pop('schedule_order', 'largest_first'),
+                                      logger=processor.log)
+        self.process_options = process_options
+        self.watcher = FolderWatcher(input_path, processor.VIDEO_EXTENSIONS, settle_time,
+                                     poll_interval, use_inotify, logger=processor.log)
+        self.ledger = ProcessedLedger(os.path.join(output_path, self.LEDGER_NAME))
+        self._stop = threading.Event()
+        self._in_flight = set()
+        self._lock = threading.Lock()
+
+    def stop(self):
+        """停止监视，已开始处理的视频会处理完"""
+        self._stop.set()
+        self.watcher.stop()
+
+    def _process(self, video_path):
+        success = False
+        cancelled = False
+        try:
+            results = self.processor.process_videos(self.input_path, self.output_path,
+                                                    video_files=[video_path], scheduler=self.scheduler,
+                                                    **self.process_options)
+            success = bool(results and results.get(video_path))
+        except ProcessingCancelled:
+            # 取消的视频不记入处理记录，下次监视时重新处理
+            cancelled = True
+        except Exception as e:
+            self.processor.log(f"处理视频出错: {str(e)}")
+        finally:
+            if not cancelled:
+                self.ledger.mark(video_path, success)
+            with self._lock:
+                self._in_flight.discard(video_path)
+
+    def run(self):
+        """持续监视，直到调用stop"""
+        if not os.path.isdir(self.input_path):
+            raise ValueError(f"输入路径不是目录: {self.input_path}")
+        FileManager.ensure_directory(self.output_path)
+
+        self.watcher.start()
+        self.processor.log(f"开始监视输入目录，最多同时处理 {self.concurrency} 个视频")
+        executor = ThreadPoolExecutor(max_workers=self.concurrency)
+        try:
+            while not self._stop.is_set():
+                try:
+                    ready = self.watcher.poll()
+                except OSError as e:
+                    # 输入目录暂时无法访问时不结束监视，等待后重试
+                    self.processor.log(f"检查输入目录出错，稍后重试: {str(e)}")
+                    self._stop.wait(self.watcher.poll_interval)
+                    continue
+                for video_path in ready:
+                    with self._lock:
+                        if video_path in self._in_flight:
+                            continue
+                    if self.ledger.is_processed(video_path):
+                        continue
+
+                    self.processor.log(f"发现新视频: {os.path.basename(video_path)}")
+                    with self._lock:
+                        self._in_flight.add(video_path)
+                    executor.submit(self._process, video_path)
+        finally:
+            self.watcher.close()
+            executor.shutdown(wait=True)
+            self.processor.log("已停止监视")
@@ -0,0 +1,81 @@
+import queue
+from multiprocessing import shared_memory
+
+import numpy as np
+
+
+class SharedFrameRing:
+    """基于共享内存的帧环形缓冲
+
+    共享内存被划分为固定大小的帧槽，生产者直接把帧写入空闲槽，消费者进程
+    通过NumPy视图读取，不需要复制；进程之间只传递槽序号。对象可以随任务
+    传给子进程，子进程中会按名称重新连接同一块共享内存。
+    """
+
+    def __init__(self, frame_shape, slot_count, context):
+        """创建帧缓冲
+
+        Args:
+            frame_shape: 帧的形状，如 (H, W, 3)
+            slot_count: 帧槽数量
+            context: multiprocessing上下文，用于创建空闲槽队列
+        """
+        self.frame_shape = tuple(frame_shape)
+        self.slot_count = slot_count
+        self.frame_bytes = int(np.prod(self.frame_shape))
+
+        self._shm = shared_memory.SharedMemory(create=True, size=self.frame_bytes * slot_count)
+        self._owner = True
+        self._free_slots = context.Queue()
+        for slot in range(slot_count):
+            self._free_slots.put(slot)
+        self._attach_view()
+
+    def _attach_view(self):
+        self._frames = np.ndarray((self.slot_count,) + self.frame_shape, dtype=np.uint8,
+                                  buffer=self._shm.buf)
+
+    def __getstate__(self):
+        return {
+            'name': self._shm.name,
+            'frame_shape': self.frame_shape,
+            'slot_count': self.slot_count,
+            'free_slots': self._free_slots,
+        }
+
+    def __setstate__(self, state):
+        self.frame_shape = state['frame_shape']
+        self.slot_count = state['slot_count']
+        self.frame_bytes = int(np.prod(self.frame_shape))
+        self._free_slots = state['free_slots']
+        self._shm = shared_memory.SharedMemory(name=state['name'])
+        self._owner = False
+        self._attach_view()
+
+    def acquire(self, timeout=None):
+        """获取一个空闲槽，超时返回None"""
+        try:
+            return self._free_slots.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def write(self, slot, frame):
+        """把帧复制进槽中"""
+        self._frames[slot][...] = frame
+
+    def view(self, slot):
+        """返回槽中帧的只读视图，不复制数据"""
+        frame = self._frames[slot]
+        frame.flags.writeable = False
+        return frame
+
+    def release(self, slot):
+        """归还槽，供生产者再次写入"""
+        self._free_slots.put(slot)
+
+    def close(self):
+        """断开共享内存，创建者同时释放共享内存"""
+        self._frames = None
+        self._shm.close()
+        if self._owner:
+            self._shm.unlink()
@@ -0,0 +1,357 @@
+import time
+import inspect
+import itertools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from core.video_processor import VideoProcessor
+from core.scene_detector import SceneDetector
+from core.scheduler import JobScheduler
+from core.encoders import OUTPUT_FORMATS, GifFormat
+from core.decoders import DECODERS, DecoderSelector
+from core.seek_index import SeekIndexCache
+from core.stream_splitter import StreamCopySplitter
+from core.archive_sink import OutputArchiver, ArchiveSink
+
+
+class Job:
+    """一次process_videos调用对应的任务，记录状态、进度、耗时和日志"""
+
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+
+    def __init__(self, job_id, params):
+        """初始化任务
+
+        Args:
+            job_id: 任务编号
+            params: process_videos参数字典（JSON形式）
+        """
+        self.job_id = job_id
+        self.params = params
+        self.status = self.QUEUED
+        self.error = None
+        self.results = {}
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        # 视频路径 -> {'done', 'total', 'timings', 'success'}
+        self.videos = {}
+        self.quarantine = []
+        self.events = []
+        self._condition = threading.Condition()
+
+    @property
+    def finished(self):
+        return self.status in (self.DONE, self.FAILED)
+
+    def add_event(self, message):
+        """追加一条日志事件并唤醒等待的读取者"""
+        with self._condition:
+            self.events.append({'seq': len(self.events), 'time': time.time(), 'message': message})
+            self._condition.notify_all()
+
+    def update(self, event):
+        """处理VideoProcessor报告的进度事件"""
+        with self._condition:
+            if event['event'] == 'videos':
+                for video in event['videos']:
+                    self.videos.setdefault(video, {'done': 0, 'total': None, 'timings': {}, 'success': None})
+                return
+            if event['event'] == 'quarantine':
+                self.quarantine = list(event['videos'])
+                return
+
+            video = self.videos.setdefault(event['video'], {'done': 0, 'total': None,
+                                                            'timings': {}, 'success': None})
+            if event['event'] == 'segments':
+                video['done'] = event['done']
+                video['total'] = event['total']
+            elif event['event'] == 'timings':
+                for name, elapsed in event['timings'].items():
+                    video['timings'][name] = video['timings'].get(name, 0.0) + elapsed
+            elif event['event'] == 'video_done':
+                video['success'] = event['success']
+
+    def set_status(self, status, error=None):
+        with self._condition:
+            self.status = status
+            self.error = error
+            if status == self.RUNNING:
+                self.started_at = time.time()
+            elif self.finished:
+                self.finished_at = time.time()
+            self._condition.notify_all()
+
+    def wait_events(self, since, timeout):
+        """等待序号不小于since的日志事件
+
+        Returns:
+            (事件列表, 任务是否已结束)
+        """
+        with self._condition:
+            if len(self.events) <= since and not self.finished:
+                self._condition.wait(timeout)
+            return self.events[since:], self.finished
+
+    def progress(self):
+        """整体进度（0~1），已完成的视频计为1，未开始的视频计为0"""
+        if self.status == self.DONE:
+            return 1.0
+        if not self.videos:
+            return 0.0
+
+        total = 0.0
+        for video in self.videos.values():
+            if video['success'] is not None:
+                total += 1.0
+            elif video['total']:
+                total += video['done'] / video['total']
+        return total / len(self.videos)
+
+    def to_dict(self, detail=False):
+        """任务状态的JSON字典"""
+        with self._condition:
+            info = {
+                'id': self.job_id,
+                'status': self.status,
+                'progress': round(self.progress(), 4),
+                'error': self.error,
+                'created_at': self.created_at,
+                'started_at': self.started_at,
+                'finished_at': self.finished_at,
+            }
+            if detail:
+                timings = {}
+                for video in self.videos.values():
+                    for name, elapsed in video['timings'].items():
+                        timings[name] = timings.get(name, 0.0) + elapsed
+                info.update({
+                    'params': self.params,
+                    'timings': timings,
+                    'videos': {path: dict(video, timings=dict(video['timings']))
+                               for path, video in self.videos.items()},
+                    'results': dict(self.results),
+                    'quarantine': list(self.quarantine),
+                    'events': len(self.events),
+                })
+            return info
+
+
+class JobManager:
+    """任务管理类
+
+    任务排队后由共享的线程池执行，每个任务使用独立的VideoProcessor，
+    日志和进度互不干扰。进程常驻，调用方不需要每次承担导入和启动开销。
+    所有任务共用一个调度器，同时执行的任务在同一份内存预算和并行数限制下放行视频；
+    解码器选择结果和关键帧索引也在任务之间共用。
+    """
+
+    # 场景分割参数，用于构建SceneDetector
+    SCENE_OPTIONS = ('scene_threshold', 'min_scene_length', 'max_scene_length')
+    # 已结束任务最多保留的数量
+    MAX_FINISHED_JOBS = 200
+
+    # 取值有限的参数及其可选值
+    CHOICE_PARAMS = {
+        'output_mode': VideoProcessor.OUTPUT_MODES,
+        'output_format': tuple(OUTPUT_FORMATS),
+        'dither': GifFormat.DITHER_MODES,
+        'decoder_backend': ('auto',) + tuple(DECODERS),
+        'encoder_backend': VideoProcessor.ENCODER_BACKENDS,
+        'schedule_order': JobScheduler.ORDERS,
+        'clip_container': StreamCopySplitter.CONTAINERS,
+        'archive': OutputArchiver.MODES,
+        'archive_format': ArchiveSink.FORMATS,
+    }
+    # 数值参数: 参数名 -> (是否必须为整数, 是否允许为0)，都不能为负数
+    NUMBER_PARAMS = {
+        'start_time': (False, True),
+        'split_duration': (False, False),
+        'split_count': (True, False),
+        'max_workers': (True, False),
+        'memory_budget': (True, False),
+        'target_size': (True, False),
+        'encode_workers': (True, False),
+        'spool_threshold': (False, False),
+        'video_timeout': (False, False),
+        'segment_timeout': (False, False),
+        'retries': (True, True),
+        'retry_backoff': (False, True),
+        'prefetch': (True, True),
+        'prefetch_budget': (True, False),
+        'scene_threshold': (False, False),
+        'min_scene_length': (False, False),
+        'max_scene_length': (False, False),
+    }
+    # 布尔参数
+    BOOL_PARAMS = ('snap_to_keyframes', 'split_scene')
+    # 字符串参数
+    STRING_PARAMS = ('input_path', 'output_path', 'spool_dir')
+    # 默认值不为None但可以传null的参数: max_workers为None时使用CPU核心数
+    NULLABLE_PARAMS = ('max_workers',)
+    # 由共用的调度器决定、不能按任务设置的参数
+    SCHEDULER_PARAMS = ('memory_budget', 'max_workers', 'schedule_order')
+
+    def __init__(self, workers=1, memory_budget=None, max_workers=None, schedule_order='largest_first',
+                 logger=None):
+        """初始化管理器
+
+        Args:
+            workers: 同时执行的任务数
+            memory_budget: 所有任务共用的内存预算（字节），为None时使用物理内存的一半
+            max_workers: 所有任务合计最多并行处理的视频数，为None时使用CPU核心数
+            schedule_order: 排队顺序，可选 largest_first, smallest_first, input
+            logger: 日志函数，所有任务的日志也会输出到这里
+        """
+        self.logger = logger
+        self.scheduler = JobScheduler(memory_budget=memory_budget, max_workers=max_workers,
+                                      order=schedule_order, logger=self.log)
+        self.decoder_selector = DecoderSelector(logger=self.log)
+        self.seek_index_cache = SeekIndexCache(logger=self.log)
+        self._executor = ThreadPoolExecutor(max_workers=max(1, workers))
+        self._jobs = {}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def log(self, message):
+        """输出日志"""
+        if self.logger:
+            self.logger(message)
+
+    @classmethod
+    def allowed_params(cls):
+        """process_videos可通过JSON传入的参数名集合"""
+        signature = inspect.signature(VideoProcessor.process_videos)
+        return (set(signature.parameters) - {'self', 'scene_detector', 'dry_run', 'scheduler'}) | \
+            {'split_scene'} | set(cls.SCENE_OPTIONS)
+
+    @classmethod
+    def validate_params(cls, params):
+        """检查JSON参数的类型和取值，参数无效时抛出ValueError
+
+        只有process_videos中默认值为None的参数和NULLABLE_PARAMS可以传null。
+        """
+        defaults = {name: parameter.default for name, parameter
+                    in inspect.signature(VideoProcessor.process_videos).parameters.items()}
+        for name, value in params.items():
+            if value is None:
+                if name not in cls.NULLABLE_PARAMS and (name not in defaults or defaults[name] is not None):
+                    raise ValueError(f"{name} 不能为null")
+                continue
+
+            if name in cls.CHOICE_PARAMS:
+                choices = cls.CHOICE_PARAMS[name]
+                if not isinstance(value, str) or value not in choices:
+                    raise ValueError(f"{name} 应为 {', '.join(choices)} 之一，实际为 {value!r}")
+            elif name in cls.NUMBER_PARAMS:
+                integer, allow_zero = cls.NUMBER_PARAMS[name]
+                # JSON的true/false在Python中也是整数，需要单独排除
+                if isinstance(value, bool) or not isinstance(value, int if integer else (int, float)):
+                    raise ValueError(f"{name} 应为{'整数' if integer else '数值'}，实际为 {value!r}")
+                if value < 0 or (value == 0 and not allow_zero):
+                    raise ValueError(f"{name} 应为{'非负数' if allow_zero else '正数'}，实际为 {value!r}")
+            elif name in cls.BOOL_PARAMS:
+                if not isinstance(value, bool):
+                    raise ValueError(f"{name} 应为true或false，实际为 {value!r}")
+            elif name in cls.STRING_PARAMS:
+                if not isinstance(value, str):
+                    raise ValueError(f"{name} 应为字符串，实际为 {value!r}")
+            elif name == 'video_files':
+                if not isinstance(value, (list, tuple)) or not all(isinstance(path, str) for path in value):
+                    raise ValueError("video_files 应为字符串列表")
+            elif name == 'renditions':
+                if not isinstance(value, (list, tuple)) or not all(isinstance(item, dict) for item in value):
+                    raise ValueError("renditions 应为对象列表")
+            elif name == 'selected_region':
+                if (not isinstance(value, (list, tuple)) or len(value) != 4
+                        or not all(isinstance(v, int) and not isinstance(v, bool) for v in value)
+                        or min(value) < 0 or min(value[2:]) == 0):
+                    raise ValueError("selected_region 格式应为 [x, y, width, height]，均为非负整数且宽高大于0")
+
+    @classmethod
+    def build_options(cls, params):
+        """把JSON参数转换为process_videos的参数，参数无效时抛出ValueError"""
+        unknown = set(params) - cls.allowed_params()
+        if unknown:
+            raise ValueError(f"不支持的参数: {', '.join(sorted(unknown))}")
+        for name in ('input_path', 'output_path'):
+            if not params.get(name):
+                raise ValueError(f"缺少参数: {name}")
+        cls.validate_params(params)
+
+        options = dict(params)
+        scene_options = {name: options.pop(name) for name in cls.SCENE_OPTIONS if name in options}
+        if options.pop('split_scene', False):
+            options['scene_detector'] = SceneDetector(
+                threshold=scene_options.get('scene_threshold', 0.35),
+                min_scene_length=scene_options.get('min_scene_length', 1.0),
+                max_scene_length=scene_options.get('max_scene_length', 10.0))
+        elif options.get('split_duration') is None and options.get('split_count') is None:
+            raise ValueError("需要指定 split_duration, split_count 或 split_scene")
+
+        if options.get('selected_region') is not None:
+            options['selected_region'] = tuple(options['selected_region'])
+        return options
+
+    def submit(self, params):
+        """提交任务
+
+        Returns:
+            Job
+        """
+        shared = sorted(set(params) & set(self.SCHEDULER_PARAMS))
+        if shared:
+            raise ValueError(f"{', '.join(shared)} 由服务统一设置，不能按任务指定")
+        options = self.build_options(params)
+        with self._lock:
+            job = Job(next(self._ids), params)
+            self._jobs[job.job_id] = job
+            self._prune()
+        self._executor.submit(self._run, job, options)
+        self.log(f"任务 {job.job_id} 已排队")
+        return job
+
+    def _prune(self):
+        finished = [job_id for job_id, job in self._jobs.items() if job.finished]
+        for job_id in finished[:max(0, len(finished) - self.MAX_FINISHED_JOBS)]:
+            del self._jobs[job_id]
+
+    def _run(self, job, options):
+        def log(message):
+            job.add_event(message)
+            self.log(f"[任务 {job.job_id}] {message}")
+
+        processor = VideoProcessor()
+        processor.set_logger_callback(log)
+        processor.set_progress_callback(job.update)
+        processor.decoder_selector = self.decoder_selector
+        processor.seek_index_cache = self.seek_index_cache
+
+        job.set_status(Job.RUNNING)
+        try:
+            job.results = processor.process_videos(scheduler=self.scheduler, **options) or {}
+            failed = [path for path, success in job.results.items() if not success]
+            if failed:
+                job.set_status(Job.FAILED, f"{len(failed)} 个视频处理失败")
+            else:
+                job.set_status(Job.DONE)
+        except Exception as e:
+            log(f"任务出错: {str(e)}")
+            job.set_status(Job.FAILED, str(e))
+
+    def get(self, job_id):
+        """按编号获取任务，不存在时返回None"""
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def list(self):
+        """所有任务，按编号排序"""
+        with self._lock:
+            return [self._jobs[job_id] for job_id in sorted(self._jobs)]
+
+    def shutdown(self):
+        """等待正在执行的任务结束"""
+        self._executor.shutdown(wait=True)
@@ -0,0 +1,228 @@
+import time
+import queue
+import signal
+import multiprocessing
+
+import numpy as np
+
+from core.frame_transport import SharedFrameRing
+
+
+def encode_worker(ring, tasks, results, output_format):
+    """编码进程入口，从共享内存帧槽读取帧并写出片段
+
+    Args:
+        ring: SharedFrameRing
+        tasks: 任务队列，消息为 (类型, 片段索引, 参数)，类型为 begin, frame, end, stop 或 abort，
+            abort 时放弃所有未写完的片段并退出
+        results: 结果队列
+        output_format: 输出格式OutputFormat
+    """
+    # 终端的Ctrl+C由父进程处理，父进程通过abort消息让编码进程清理后退出
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    writers = {}
+    segments = {}
+    try:
+        while True:
+            kind, segment_index, payload = tasks.get()
+            if kind == 'stop':
+                break
+            if kind == 'abort':
+                for writer in writers.values():
+                    writer.abort()
+                writers.clear()
+                break
+
+            if kind == 'begin':
+                output_file, settings, spool_capacity, spool_dir = payload
+                writers[segment_index] = output_format.create_writer(output_file, settings.fps,
+                                                                     spool_capacity, spool_dir)
+                segments[segment_index] = {'path': output_file, 'settings': settings, 'previous': None}
+
+            elif kind == 'frame':
+                segment = segments[segment_index]
+                try:
+                    frame = ring.view(payload)
+                    if not segment['settings'].is_default():
+                        frame = segment['settings'].apply(frame)
+
+                    # 与上一帧相同时只延长上一帧的显示时间
+                    previous = segment['previous']
+                    if previous is not None and np.array_equal(previous, frame):
+                        writers[segment_index].repeat_last_frame()
+                    else:
+                        segment['previous'] = np.array(frame)
+                        writers[segment_index].add_frame(segment['previous'])
+                finally:
+                    ring.release(payload)
+
+            elif kind == 'end':
+                writers.pop(segment_index).close()
+                results.put(('done', segment_index, segments.pop(segment_index)['path']))
+    except BaseException as e:
+        for writer in writers.values():
+            writer.abort()
+        results.put(('error', None, f"{type(e).__name__}: {e}"))
+    finally:
+        ring.close()
+
+
+class ParallelSegmentEncoder:
+    """多进程片段编码类
+
+    当前进程负责解码并把帧写入共享内存帧槽，片段按轮询分配给编码进程，
+    编码进程直接读取帧槽完成变换、量化和写出，进程之间只传递槽序号。
+    """
+
+    # 每个编码进程对应的帧槽数
+    SLOTS_PER_WORKER = 4
+    # 等待空闲槽时检查编码进程状态的间隔（秒）
+    POLL_INTERVAL = 0.1
+    # 出错或取消后等待编码进程清理未写完片段的时间（秒），超时后强制结束
+    ABORT_TIMEOUT = 5.0
+
+    def __init__(self, workers, logger=None):
+        """初始化编码器
+
+        Args:
+            workers: 编码进程数
+            logger: 日志函数
+        """
+        self.workers = max(1, workers)
+        self.logger = logger
+
+    def log(self, message):
+        """输出日志"""
+        if self.logger:
+            self.logger(message)
+
+    def _handle_result(self, result):
+        kind, segment_index, payload = result
+        if kind == 'error':
+            raise RuntimeError(f"编码进程出错: {payload}")
+        self.log(f"片段 {segment_index + 1} 处理完成: {payload}")
+        self._done += 1
+        if self._on_segment_done:
+            self._on_segment_done(self._done)
+
+    def _poll_results(self, results, processes, block=False):
+        """处理已返回的结果，编码进程异常退出时抛出异常
+
+        Returns:
+            处理的结果数量
+        """
+        handled = 0
+        while True:
+            try:
+                result = results.get(timeout=self.POLL_INTERVAL if block else 0)
+            except queue.Empty:
+                if any(not process.is_alive() and process.exitcode for process in processes):
+                    raise RuntimeError("编码进程异常退出")
+                return handled
+            self._handle_result(result)
+            handled += 1
+            block = False
+
+    def _acquire(self, ring, results, processes):
+        """等待空闲槽，期间处理已返回的结果
+
+        Returns:
+            (槽序号, 处理的结果数量)
+        """
+        handled = 0
+        while True:
+            slot = ring.acquire(timeout=self.POLL_INTERVAL)
+            if slot is not None:
+                return slot, handled
+            handled += self._poll_results(results, processes)
+
+    def encode(self, decoder, plan, output_dir, output_format, crop=None,
+               spool_capacity=None, spool_dir=None, cancel_token=None, on_segment_done=None):
+        """解码并分发所有片段，等待编码进程全部写出
+
+        Args:
+            decoder: 已打开的VideoDecoder
+            plan: (片段索引, 绝对开始时间, 绝对结束时间, GifSettings) 列表
+            output_dir: 输出目录
+            output_format: 输出格式OutputFormat
+            crop: 帧裁剪函数，为None时不裁剪
+            spool_capacity: 函数(开始时间, 结束时间, 帧率)，返回片段的帧缓存容量，
+                返回None或该参数为None时片段在内存中编码
+            spool_dir: 帧缓存文件所在目录
+            cancel_token: CancelToken，每帧检查一次，取消时编码进程删除未写完的片段后退出
+            on_segment_done: 每完成一个片段调用一次，参数为已完成的片段数
+        """
+        if not plan:
+            return
+
+        self._done = 0
+        self._on_segment_done = on_segment_done
+
+        # 用第一帧确定帧槽形状，裁剪区域在整个视频内不变；没有帧的片段与逐个编码时一样由编码器报错
+        first_frame = None
+        for _, segment_start, segment_end, settings in plan:
+            item = next(decoder.iter_frames(segment_start, segment_end, settings.fps), None)
+            if item is not None:
+                first_frame = item[1]
+                break
+        if first_frame is None:
+            raise ValueError("所有片段中都没有可解码的帧")
+        if crop is not None:
+            first_frame = crop(first_frame)
+
+        context = multiprocessing.get_context('spawn')
+        ring = SharedFrameRing(first_frame.shape, self.workers * self.SLOTS_PER_WORKER, context)
+        tasks = [context.Queue() for _ in range(self.workers)]
+        results = context.Queue()
+        processes = [context.Process(target=encode_worker, daemon=True,
+                                     args=(ring, tasks[i], results, output_format))
+                     for i in range(self.workers)]
+
+        for process in processes:
+            process.start()
+        self.log(f"启动 {self.workers} 个编码进程，共享内存帧槽 {ring.slot_count} 个")
+
+        finished = 0
+        completed = False
+        try:
+            for n, (segment_index, segment_start, segment_end, settings) in enumerate(plan):
+                task = tasks[n % self.workers]
+                output_file = output_format.output_path(output_dir, segment_index)
+                capacity = spool_capacity(segment_start, segment_end, settings.fps) if spool_capacity else None
+                task.put(('begin', segment_index, (output_file, settings, capacity, spool_dir)))
+
+                for _, frame in decoder.iter_frames(segment_start, segment_end, settings.fps):
+                    if cancel_token is not None:
+                        cancel_token.check()
+                    if crop is not None:
+                        frame = crop(frame)
+                    slot, handled = self._acquire(ring, results, processes)
+                    finished += handled
+                    ring.write(slot, frame)
+                    task.put(('frame', segment_index, slot))
+
+                task.put(('end', segment_index, None))
+                finished += self._poll_results(results, processes)
+
+            for task in tasks:
+                task.put(('stop', None, None))
+
+            while finished < len(plan):
+                finished += self._poll_results(results, processes, block=True)
+
+            for process in processes:
+                process.join()
+            completed = True
+        finally:
+            if not completed:
+                # 让编码进程删除未写完的片段和帧缓存后退出，超时未退出时强制结束
+                for task in tasks:
+                    task.put(('abort', None, None))
+                deadline = time.monotonic() + self.ABORT_TIMEOUT
+                for process in processes:
+                    process.join(max(0.0, deadline - time.monotonic()))
+            for process in processes:
+                if process.is_alive():
+                    process.terminate()
+                    process.join()
+            ring.close()
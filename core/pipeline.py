@@ -0,0 +1,134 @@
+import time
+import queue
+import threading
+
+
+class PipelineExecutor:
+    """流水线执行器
+
+    数据源、各处理阶段和输出阶段分别运行在独立线程中，阶段之间通过有界队列
+    连接，使解码、变换和编码可以重叠执行，同时把在途帧数限制在队列容量内。
+    任一阶段出错时所有阶段尽快停止，并在调用线程中重新抛出该异常。
+    """
+
+    # 队列结束标记
+    _END = object()
+    # 执行器已停止的标记
+    _STOPPED = object()
+    # 等待队列的轮询间隔（秒），用于及时响应停止
+    POLL_INTERVAL = 0.1
+
+    def __init__(self, queue_size=8):
+        """初始化执行器
+
+        Args:
+            queue_size: 每个阶段之间队列的最大长度
+        """
+        self.queue_size = queue_size
+        self.timings = {}
+        self._stop = threading.Event()
+        self._errors = []
+        self._lock = threading.Lock()
+
+    def _put(self, target, item):
+        while not self._stop.is_set():
+            try:
+                target.put(item, timeout=self.POLL_INTERVAL)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _get(self, source):
+        while not self._stop.is_set():
+            try:
+                return source.get(timeout=self.POLL_INTERVAL)
+            except queue.Empty:
+                continue
+        return self._STOPPED
+
+    def _fail(self, error):
+        with self._lock:
+            self._errors.append(error)
+        self._stop.set()
+
+    def _add_time(self, name, elapsed):
+        with self._lock:
+            self.timings[name] = self.timings.get(name, 0.0) + elapsed
+
+    def _produce(self, source, output):
+        try:
+            iterator = iter(source)
+            while True:
+                begin = time.perf_counter()
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    break
+                finally:
+                    self._add_time('source', time.perf_counter() - begin)
+                if not self._put(output, item):
+                    return
+            self._put(output, self._END)
+        except BaseException as e:
+            self._fail(e)
+
+    def _work(self, name, function, source, output):
+        try:
+            while True:
+                item = self._get(source)
+                if item is self._STOPPED:
+                    return
+                if item is self._END:
+                    self._put(output, self._END)
+                    return
+
+                begin = time.perf_counter()
+                result = function(item)
+                self._add_time(name, time.perf_counter() - begin)
+
+                # 阶段返回None表示丢弃该数据
+                if result is not None and not self._put(output, result):
+                    return
+        except BaseException as e:
+            self._fail(e)
+
+    def run(self, source, stages, sink):
+        """执行流水线，直到数据源耗尽或出错
+
+        Args:
+            source: 可迭代的数据源，在独立线程中迭代
+            stages: (阶段名称, 处理函数) 列表，每个阶段一个线程，返回None时丢弃数据
+            sink: 输出函数，在调用线程中按顺序处理最后一个阶段的结果
+
+        Returns:
+            各阶段累计耗时字典（秒）
+        """
+        queues = [queue.Queue(maxsize=self.queue_size) for _ in range(len(stages) + 1)]
+        threads = [threading.Thread(target=self._produce, args=(source, queues[0]), daemon=True)]
+        for i, (name, function) in enumerate(stages):
+            threads.append(threading.Thread(target=self._work, daemon=True,
+                                            args=(name, function, queues[i], queues[i + 1])))
+
+        for thread in threads:
+            thread.start()
+
+        try:
+            while True:
+                item = self._get(queues[-1])
+                if item is self._STOPPED or item is self._END:
+                    break
+                begin = time.perf_counter()
+                sink(item)
+                self._add_time('sink', time.perf_counter() - begin)
+        except BaseException as e:
+            self._fail(e)
+        finally:
+            for thread in threads:
+                thread.join()
+            if hasattr(source, 'close'):
+                source.close()
+
+        if self._errors:
+            raise self._errors[0]
+        return dict(self.timings)
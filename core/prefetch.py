@@ -0,0 +1,159 @@
+import os
+import queue
+import threading
+
+
+class InputPrefetcher:
+    """输入文件预读类
+
+    处理当前视频时，在后台把排在后面的几个视频读入系统页缓存，并提前建立
+    关键帧索引等元数据，轮到它们时解码可以立即开始，不必等待冷数据的网络I/O。
+    已预读但尚未开始处理的字节数（包括末尾的容器索引）不超过预算。建立元数据通常要读完
+    整个文件，只对能完整预读的文件进行。
+    """
+
+    # 每次读取的块大小
+    CHUNK_SIZE = 8 * 1024 * 1024
+    # 文件末尾总是预读的字节数，MP4等容器的索引常在文件末尾
+    TAIL_SIZE = 4 * 1024 * 1024
+    # 默认预读预算
+    DEFAULT_BUDGET = 1024 * 1024 * 1024
+
+    def __init__(self, paths, depth=2, byte_budget=None, warmers=None, logger=None):
+        """初始化预读器
+
+        Args:
+            paths: 按预计处理顺序排列的视频路径列表
+            depth: 预读当前视频之后的几个视频
+            byte_budget: 已预读但尚未开始处理的最大字节数，为None时使用DEFAULT_BUDGET
+            warmers: 文件完整预读后对其调用的函数列表，如建立关键帧索引；
+                文件超出预算时不调用，避免读取预算之外的数据
+            logger: 日志函数
+        """
+        self.pending = list(paths)
+        self.depth = max(0, depth)
+        self.byte_budget = byte_budget or self.DEFAULT_BUDGET
+        self.warmers = list(warmers or [])
+        self.logger = logger
+
+        self._lock = threading.Lock()
+        self._started = set()
+        self._scheduled = set()
+        # 路径 -> 已预读的字节数
+        self._prefetched = {}
+        self._queue = queue.Queue()
+        self._thread = None
+        self._closed = False
+
+    def log(self, message):
+        """输出日志"""
+        if self.logger:
+            self.logger(message)
+
+    def start(self):
+        """启动后台线程，第一个视频开始处理后才预读后面的视频"""
+        if self.depth == 0:
+            return
+        self._thread = threading.Thread(target=self._run, name='prefetch', daemon=True)
+        self._thread.start()
+
+    def advance(self, path):
+        """某个视频开始处理，释放它占用的预算并预读后面的视频"""
+        with self._lock:
+            self._started.add(path)
+            if path in self.pending:
+                self.pending.remove(path)
+            self._prefetched.pop(path, None)
+        self._schedule()
+
+    def close(self):
+        """停止预读"""
+        self._closed = True
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+
+    def _schedule(self):
+        if self._thread is None:
+            return
+        with self._lock:
+            for path in self.pending[:self.depth]:
+                if path not in self._scheduled:
+                    self._scheduled.add(path)
+                    self._queue.put(path)
+
+    def _cancelled(self, path):
+        return self._closed or path in self._started
+
+    def _reserve(self, path, size):
+        """在预算内申请预读字节数，返回实际可读的字节数"""
+        with self._lock:
+            if path in self._started:
+                return 0
+            available = self.byte_budget - sum(self._prefetched.values())
+            granted = max(0, min(size, available))
+            self._prefetched[path] = self._prefetched.get(path, 0) + granted
+            return granted
+
+    @staticmethod
+    def _advise(fd, offset, length):
+        if hasattr(os, 'posix_fadvise'):
+            try:
+                os.posix_fadvise(fd, offset, length, os.POSIX_FADV_WILLNEED)
+            except OSError:
+                pass
+
+    def _read_range(self, path, f, offset, length, buffer):
+        """提示内核预读一段数据并顺序读取，使其进入页缓存"""
+        self._advise(f.fileno(), offset, length)
+        f.seek(offset)
+        remaining = length
+        view = memoryview(buffer)
+        while remaining > 0 and not self._cancelled(path):
+            count = f.readinto(view[:min(remaining, len(buffer))])
+            if not count:
+                break
+            remaining -= count
+
+    def _prefetch(self, path, buffer):
+        try:
+            size = os.path.getsize(path)
+        except OSError:
+            return
+
+        granted = self._reserve(path, size)
+        if granted == 0:
+            return
+
+        tail = min(self.TAIL_SIZE, granted)
+        with open(path, 'rb', buffering=0) as f:
+            # 先读末尾的容器索引，再从头顺序读取预算剩余的部分
+            self._read_range(path, f, size - tail, tail, buffer)
+            self._read_range(path, f, 0, min(granted - tail, size - tail), buffer)
+
+        if granted < size:
+            self.log(f"预读 {os.path.basename(path)}: {granted / 1024 ** 2:.0f}MB / "
+                     f"{size / 1024 ** 2:.0f}MB（受预读预算限制，不提前建立元数据）")
+            return
+
+        for warmer in self.warmers:
+            if self._cancelled(path):
+                return
+            try:
+                warmer(path)
+            except Exception as e:
+                self.log(f"预读 {os.path.basename(path)} 的元数据出错: {str(e)}")
+
+    def _run(self):
+        buffer = bytearray(self.CHUNK_SIZE)
+        while True:
+            path = self._queue.get()
+            if path is None or self._closed:
+                return
+            if self._cancelled(path):
+                continue
+            try:
+                self._prefetch(path, buffer)
+            except OSError as e:
+                self.log(f"预读 {os.path.basename(path)} 出错: {str(e)}")
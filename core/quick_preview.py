@@ -0,0 +1,193 @@
+import io
+import math
+import time
+
+import cv2
+import numpy as np
+from PIL import Image
+
+from core.decoders import DecoderSelector
+from core.encoders import GifFormat, get_output_format
+from core.size_estimator import GifSettings, GifSizeEstimator
+
+
+class QuickPreviewRenderer:
+    """快速预览渲染类
+
+    只解码开始时间后的几秒，按当前的区域和帧率取帧，缩小并减少颜色后在内存中编码为GIF，
+    用于在批量处理前检查裁剪、帧率和调色板的效果。同时把同一段帧缩小到限定的像素数，
+    按实际输出格式连续试编码后外推到原尺寸，预测每个片段和整个视频的输出大小。
+    帧在解码器内部裁剪并缩小到试编码需要的尺寸，高分辨率视频不在Python中转换原尺寸帧。
+    预测按Python编码路径计算，ffmpeg后端生成的GIF通常更小。
+    """
+
+    # 预览的时长（秒）
+    PREVIEW_DURATION = 3.0
+    # 预览GIF的最大宽度
+    MAX_WIDTH = 240
+    # 预览GIF的颜色数
+    PREVIEW_COLORS = 64
+    # 预测大小时试编码的每帧最大像素数，原尺寸更大时缩小后试编码再外推到原尺寸
+    PROJECTION_PIXELS = 480 * 270
+    # 预测大小时连续试编码的帧数
+    PROJECTION_FRAMES = 10
+
+    def __init__(self, duration=None, max_width=None, colors=None, decoder_selector=None,
+                 seek_index_cache=None, size_estimator=None):
+        """初始化渲染器
+
+        Args:
+            duration: 预览的时长（秒）
+            max_width: 预览GIF的最大宽度
+            colors: 预览GIF的颜色数
+            decoder_selector: DecoderSelector，为None时新建；传入预览窗口的选择器可以复用
+                已选出的解码后端
+            seek_index_cache: SeekIndexCache，开始时间较晚时用关键帧索引直接跳转，为None时不使用
+            size_estimator: GifSizeEstimator，用于预测原尺寸输出的大小，为None时在预览中间
+                取一个PROJECTION_FRAMES帧的连续窗口试编码
+        """
+        self.duration = duration or self.PREVIEW_DURATION
+        self.max_width = max_width or self.MAX_WIDTH
+        self.colors = colors or self.PREVIEW_COLORS
+        self.decoder_selector = decoder_selector or DecoderSelector()
+        self.seek_index_cache = seek_index_cache
+        self.size_estimator = size_estimator or GifSizeEstimator(sample_windows=1,
+                                                                 frames_per_window=self.PROJECTION_FRAMES)
+        self.keyframe_estimator = GifSizeEstimator(sample_windows=1, frames_per_window=1)
+
+    @staticmethod
+    def _resize(frame, scale):
+        if scale >= 1.0:
+            return frame
+        height, width = frame.shape[:2]
+        size = (max(1, int(width * scale)), max(1, int(height * scale)))
+        return cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+
+    def _quantize(self, frame, ditherer):
+        """量化为调色板图像"""
+        if ditherer is not None:
+            return ditherer.prepare_frame(frame)
+        return Image.fromarray(frame).convert('P', palette=Image.Palette.ADAPTIVE, colors=self.colors)
+
+    def render(self, video_path, start_time=0, selected_region=None, fps=10, output_format='gif',
+               dither='none', split_duration=None, split_count=None, cancel_token=None):
+        """渲染预览并预测输出大小
+
+        Args:
+            video_path: 视频路径
+            start_time: 开始时间（秒）
+            selected_region: 选择的区域(x, y, width, height)
+            fps: 输出帧率
+            output_format: 实际输出的动图格式名称(gif, webp, apng)，用于预测大小
+            dither: GIF的抖动方式(none, bayer)
+            split_duration: 分割时长（秒），用于预测每个片段的大小
+            split_count: 分割数量，未指定分割时长时用于计算片段时长
+            cancel_token: CancelToken，每帧检查一次
+
+        Returns:
+            预览结果字典: data 为预览GIF的字节，width, height, frames, duration 为预览的尺寸、
+            帧数和时长，segment_duration, segment_bytes 为片段时长和预计每个片段的大小，
+            total_bytes 为从开始时间起整个视频的预计大小，elapsed 为渲染耗时（秒）
+        """
+        begin = time.perf_counter()
+        seek_index = self.seek_index_cache.get(video_path) if self.seek_index_cache else None
+        decoder = self.decoder_selector.open(video_path, seek_index=seek_index)
+        try:
+            video_duration = decoder.frame_count / decoder.fps if decoder.fps > 0 else 0
+            if start_time >= video_duration:
+                raise ValueError(f"开始时间 {start_time}秒 超过视频时长 {video_duration:.1f}秒")
+            end_time = min(start_time + self.duration, video_duration)
+
+            # 由解码器裁剪并缩小到试编码和预览需要的尺寸中较大的一个
+            width, height = selected_region[2:] if selected_region else (decoder.width, decoder.height)
+            projection_scale = min(1.0, (self.PROJECTION_PIXELS / (width * height)) ** 0.5)
+            decode_scale = max(projection_scale, min(1.0, self.max_width / width))
+            decode_size = None
+            if decode_scale < 1.0:
+                decode_size = (max(1, round(width * decode_scale)), max(1, round(height * decode_scale)))
+            decoder.set_output(selected_region, decode_size)
+            preview_scale = min(1.0, self.max_width / width) / decode_scale
+            projection_resize = projection_scale / decode_scale
+
+            preview_format = GifFormat()
+            ditherer = GifFormat(dither='bayer') if dither == 'bayer' else None
+            buffer = io.BytesIO()
+            writer = preview_format.create_writer(buffer, fps)
+
+            projection_frames = []
+            previous = None
+            preview_size = None
+            frame_count = 0
+            for _, frame in decoder.iter_frames(start_time, end_time, fps):
+                if cancel_token is not None:
+                    cancel_token.check()
+                frame_count += 1
+                projection_frames.append(self._resize(frame, projection_resize))
+
+                small = self._resize(frame, preview_scale)
+                preview_size = (small.shape[1], small.shape[0])
+                # 与上一帧相同时延长上一帧的显示时间
+                if previous is not None and np.array_equal(previous, small):
+                    writer.repeat_last_frame()
+                else:
+                    previous = small
+                    writer.add_prepared_frame(self._quantize(small, ditherer))
+            if frame_count == 0:
+                raise ValueError("预览范围内没有可解码的帧")
+            writer.close()
+        finally:
+            decoder.close()
+
+        if cancel_token is not None:
+            cancel_token.check()
+
+        remaining = video_duration - start_time
+        if split_duration:
+            segment_duration = min(split_duration, remaining)
+        elif split_count:
+            segment_duration = remaining / split_count
+        else:
+            segment_duration = remaining
+
+        # 每个片段的首帧是完整帧，其余帧只编码与上一帧的差异，分别估算后按帧数外推，
+        # 预览比片段短时不会把首帧的开销摊得过大
+        full_format = get_output_format(output_format, dither=dither)
+        sample_duration = frame_count / fps
+        sample_total = max(1, math.ceil(sample_duration * fps))
+
+        def bytes_per_frame(estimator, frames):
+            def read_window(offset, count, window_fps):
+                index = int(round(offset * window_fps))
+                return frames[index:index + count]
+            return estimator.estimate(read_window, sample_duration, GifSettings(fps=fps),
+                                      output_format=full_format) / sample_total
+
+        sample_frames = min(frame_count, self.size_estimator.frames_per_window)
+        window_bytes = bytes_per_frame(self.size_estimator, projection_frames) * sample_frames
+        keyframe_bytes = bytes_per_frame(self.keyframe_estimator, projection_frames)
+        delta_bytes = max(0.0, window_bytes - keyframe_bytes) / max(1, sample_frames - 1)
+
+        factor = 1.0
+        if projection_scale < 1.0:
+            # 编码大小并不与面积成正比：再按一半边长试编码，拟合大小随面积变化的指数后外推到原尺寸
+            half_frames = [self._resize(frame, 0.5) for frame in projection_frames]
+            half_bytes = bytes_per_frame(self.size_estimator, half_frames) * sample_frames
+            exponent = math.log(window_bytes / half_bytes) / math.log(4) if half_bytes > 0 else 1.0
+            factor = (1 / projection_scale ** 2) ** min(1.0, max(0.5, exponent))
+        keyframe_bytes, delta_bytes = keyframe_bytes * factor, delta_bytes * factor
+
+        segment_frames = max(1, math.ceil(segment_duration * fps - 1e-6))
+        total_frames = max(1, math.ceil(remaining * fps - 1e-6))
+        segment_count = max(1, math.ceil(total_frames / segment_frames))
+
+        return {
+            'data': buffer.getvalue(),
+            'width': preview_size[0],
+            'height': preview_size[1],
+            'frames': frame_count,
+            'duration': end_time - start_time,
+            'segment_duration': segment_duration,
+            'segment_bytes': int(keyframe_bytes + delta_bytes * (segment_frames - 1)),
+            'total_bytes': int(keyframe_bytes * segment_count + delta_bytes * (total_frames - segment_count)),
+            'elapsed': time.perf_counter() - begin,
+        }
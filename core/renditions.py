@@ -0,0 +1,127 @@
+import os
+import math
+
+from core.encoders import OutputFormat, get_output_format
+from core.size_estimator import GifSettings
+
+
+class Rendition:
+    """输出规格：名称、帧率、缩放比例、颜色数和动图格式
+
+    多个规格共用一次解码，每个规格的输出写入以名称命名的子目录。
+    """
+
+    def __init__(self, name, fps=10, scale=1.0, colors=256, output_format='gif', dither=None):
+        """初始化规格
+
+        Args:
+            name: 规格名称，同时作为输出子目录名
+            fps: 帧率
+            scale: 相对于（裁剪后）画面的缩放比例
+            colors: 颜色数，小于256时先减色
+            output_format: 动图格式名称(gif, webp, apng)或OutputFormat对象
+            dither: GIF的抖动方式(none, bayer)，为None时使用默认值
+        """
+        if not name or name in ('.', '..') or os.sep in name or (os.altsep and os.altsep in name):
+            raise ValueError(f"无效的规格名称: {name!r}")
+        if fps <= 0:
+            raise ValueError(f"规格 {name} 的帧率必须大于0")
+        if scale <= 0:
+            raise ValueError(f"规格 {name} 的缩放比例必须大于0")
+        if not 2 <= colors <= 256:
+            raise ValueError(f"规格 {name} 的颜色数应在2到256之间")
+
+        self.name = name
+        self.settings = GifSettings(fps=fps, scale=scale, colors=colors)
+        if not isinstance(output_format, OutputFormat):
+            output_format = get_output_format(output_format, dither=dither)
+        self.output_format = output_format
+
+    @property
+    def fps(self):
+        return self.settings.fps
+
+    @property
+    def scale(self):
+        return self.settings.scale
+
+    @classmethod
+    def from_dict(cls, data, default_fps=10, default_dither=None):
+        """从JSON字典创建规格，字典键为 name, fps, scale, colors, format, dither"""
+        unknown = set(data) - {'name', 'fps', 'scale', 'colors', 'format', 'dither'}
+        if unknown:
+            raise ValueError(f"不支持的规格参数: {', '.join(sorted(unknown))}")
+        return cls(data.get('name'), fps=data.get('fps', default_fps), scale=data.get('scale', 1.0),
+                   colors=data.get('colors', 256), output_format=data.get('format', 'gif'),
+                   dither=data.get('dither', default_dither))
+
+    def output_dir(self, output_path, video_name):
+        """规格下单个视频的输出目录"""
+        return os.path.join(output_path, self.name, video_name)
+
+    def __repr__(self):
+        return f"{self.name}({self.settings}, 格式={self.output_format.name})"
+
+
+def build_renditions(renditions, default_fps=10, default_dither=None):
+    """把规格列表统一转换为Rendition对象
+
+    Args:
+        renditions: Rendition对象或JSON字典的列表
+        default_fps: 字典未指定帧率时使用的帧率
+        default_dither: 字典未指定抖动方式时使用的抖动方式
+
+    Returns:
+        Rendition列表，名称重复时抛出ValueError
+    """
+    result = [item if isinstance(item, Rendition) else Rendition.from_dict(item, default_fps, default_dither)
+              for item in renditions]
+    names = [rendition.name for rendition in result]
+    if len(set(names)) != len(names):
+        raise ValueError("规格名称不能重复")
+    return result
+
+
+class RenditionSampler:
+    """从原始帧中按规格帧率取样
+
+    与VideoDecoder.iter_frames按帧率读取的规则相同：每个输出时间点取时间戳
+    不晚于它的最近一帧，区间结尾不足时用最后一帧补齐。
+    """
+
+    TIME_EPSILON = 1e-6
+
+    def __init__(self, start, end, fps):
+        """初始化取样器
+
+        Args:
+            start: 区间开始时间（秒）
+            end: 区间结束时间（秒）
+            fps: 输出帧率
+        """
+        self.start = start
+        self.fps = fps
+        self.total = max(1, int(math.ceil((end - start) * fps - self.TIME_EPSILON)))
+        self.index = 0
+        self.previous = None
+
+    def feed(self, timestamp, frame):
+        """送入一帧原始帧
+
+        Returns:
+            该帧之前应输出的帧列表
+        """
+        output = []
+        while self.index < self.total and timestamp > self.start + self.index / self.fps + self.TIME_EPSILON:
+            output.append(self.previous if self.previous is not None else frame)
+            self.index += 1
+        self.previous = frame
+        return output
+
+    def finish(self):
+        """区间结束，返回剩余时间点应输出的帧列表"""
+        output = []
+        while self.index < self.total and self.previous is not None:
+            output.append(self.previous)
+            self.index += 1
+        return output
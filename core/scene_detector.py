@@ -0,0 +1,156 @@
+import cv2
+import numpy as np
+
+from core.decoders import open_decoder
+
+
+class SceneDetector:
+    """场景切换检测类，基于降采样帧的颜色直方图差异查找镜头切换点"""
+
+    # 每个通道量化的级数，直方图共 BINS_PER_CHANNEL ** 3 个格子
+    BINS_PER_CHANNEL = 8
+    # 分析时缩放到的宽度
+    ANALYSIS_WIDTH = 64
+    # 批量计算直方图的帧数
+    BATCH_SIZE = 64
+
+    def __init__(self, threshold=0.35, min_scene_length=1.0, max_scene_length=10.0, analysis_fps=5):
+        """初始化场景检测器
+
+        Args:
+            threshold: 切换阈值(0~1)，相邻采样帧直方图差异超过该值视为场景切换
+            min_scene_length: 最短片段时长（秒）
+            max_scene_length: 最长片段时长（秒），为None时不限制
+            analysis_fps: 分析时的采样帧率
+        """
+        if min_scene_length <= 0:
+            raise ValueError("最短片段时长必须大于0")
+        if max_scene_length is not None and max_scene_length < min_scene_length:
+            raise ValueError("最长片段时长不能小于最短片段时长")
+
+        self.threshold = threshold
+        self.min_scene_length = min_scene_length
+        self.max_scene_length = max_scene_length
+        self.analysis_fps = analysis_fps
+
+    def _histograms(self, frames):
+        """批量计算归一化颜色直方图
+
+        Args:
+            frames: 形状为 (N, H, W, 3) 的uint8数组
+
+        Returns:
+            形状为 (N, bins) 的float数组
+        """
+        bins = self.BINS_PER_CHANNEL
+        shift = 8 - int(np.log2(bins))
+        quantized = (frames >> shift).astype(np.int32)
+        index = (quantized[..., 0] * bins + quantized[..., 1]) * bins + quantized[..., 2]
+
+        count = frames.shape[0]
+        total_bins = bins ** 3
+        # 为每一帧加上偏移，一次bincount得到整批直方图
+        index = index.reshape(count, -1) + (np.arange(count) * total_bins)[:, None]
+        hist = np.bincount(index.ravel(), minlength=count * total_bins).reshape(count, total_bins)
+        return hist / float(index.shape[1])
+
+    def _score_batch(self, frames, previous_hist):
+        """计算一批帧与前一采样帧之间的差异分数"""
+        hist = self._histograms(np.stack(frames))
+        if previous_hist is not None:
+            hist_with_prev = np.vstack([previous_hist[None, :], hist])
+        else:
+            hist_with_prev = np.vstack([hist[:1], hist])
+        # 直方图总变差距离，范围为0~1
+        scores = 0.5 * np.abs(np.diff(hist_with_prev, axis=0)).sum(axis=1)
+        return scores, hist[-1]
+
+    def detect_cuts(self, video_path, start_time=0, duration=None, cancel_token=None,
+                    decoder_backend='auto', seek_index=None, decoder_selector=None):
+        """单次顺序读取视频并检测场景切换
+
+        Args:
+            video_path: 视频路径
+            start_time: 开始时间（秒）
+            duration: 检测时长（秒），为None时检测到视频结尾
+            cancel_token: CancelToken，每个采样帧检查一次
+            decoder_backend: 解码器名称，auto时按文件自动选择
+            seek_index: 关键帧索引SeekIndex
+            decoder_selector: DecoderSelector，为None时使用共享的选择器
+
+        Returns:
+            相对于start_time的切换时间点列表（秒）
+        """
+        with open_decoder(video_path, decoder_backend, seek_index, decoder_selector) as decoder:
+            fps = decoder.fps if decoder.fps > 0 else 30
+            # 按原始帧率的整数倍间隔采样，与逐帧计数的采样点一致
+            sample_fps = fps / max(1, int(round(fps / self.analysis_fps)))
+            end_time = start_time + duration if duration is not None else None
+
+            cuts = []
+            batch, batch_times = [], []
+            previous_hist = None
+
+            for timestamp, frame in decoder.iter_frames(start_time, end_time, sample_fps):
+                if cancel_token is not None:
+                    cancel_token.check()
+
+                height, width = frame.shape[:2]
+                small_height = max(1, int(height * self.ANALYSIS_WIDTH / width))
+                batch.append(cv2.resize(frame, (self.ANALYSIS_WIDTH, small_height),
+                                        interpolation=cv2.INTER_AREA))
+                batch_times.append(timestamp - start_time)
+
+                if len(batch) >= self.BATCH_SIZE:
+                    previous_hist = self._collect_cuts(batch, batch_times, previous_hist, cuts)
+                    batch, batch_times = [], []
+
+            if batch:
+                self._collect_cuts(batch, batch_times, previous_hist, cuts)
+
+            return cuts
+
+    def _collect_cuts(self, batch, batch_times, previous_hist, cuts):
+        """对一批采样帧打分并记录超过阈值的切换点"""
+        scores, last_hist = self._score_batch(batch, previous_hist)
+        for time, score in zip(batch_times, scores):
+            if time > 0 and score >= self.threshold:
+                cuts.append(time)
+        return last_hist
+
+    def build_segments(self, cuts, duration):
+        """根据切换点和片段时长限制生成片段列表
+
+        Args:
+            cuts: 切换时间点列表（秒）
+            duration: 总时长（秒）
+
+        Returns:
+            (片段索引, 开始时间, 结束时间) 列表
+        """
+        # 过滤掉距离上一个边界过近的切换点
+        boundaries = [0.0]
+        for cut in sorted(cuts):
+            if cut - boundaries[-1] >= self.min_scene_length and duration - cut > 0:
+                boundaries.append(cut)
+        boundaries.append(duration)
+
+        # 结尾片段过短时合并到前一个片段
+        if (len(boundaries) > 2 and boundaries[-1] - boundaries[-2] < self.min_scene_length):
+            merged = boundaries[-1] - boundaries[-3]
+            if self.max_scene_length is None or merged <= self.max_scene_length:
+                del boundaries[-2]
+
+        # 超过最长时长的片段均匀拆分
+        ranges = []
+        for start, end in zip(boundaries[:-1], boundaries[1:]):
+            length = end - start
+            if self.max_scene_length is not None and length > self.max_scene_length:
+                pieces = int(np.ceil(length / self.max_scene_length))
+                piece_length = length / pieces
+                for i in range(pieces):
+                    ranges.append((start + i * piece_length, min(start + (i + 1) * piece_length, end)))
+            else:
+                ranges.append((start, end))
+
+        return [(i, start, end) for i, (start, end) in enumerate(ranges)]
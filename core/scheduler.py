@@ -0,0 +1,183 @@
+import os
+import math
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+class VideoJob:
+    """调度任务，描述一个待处理视频及其预估内存占用"""
+
+    def __init__(self, index, video_path, metadata, estimated_memory):
+        self.index = index
+        self.video_path = video_path
+        self.metadata = metadata
+        self.estimated_memory = estimated_memory
+
+
+class JobScheduler:
+    """按内存预算调度视频处理任务
+
+    每个任务在开始前按预估内存占用申请预算，只有预算允许时才会被放行；
+    排在前面的大任务放不下时，会继续尝试后面能放下的小任务，尽量让所有
+    工作线程保持忙碌而不触发内存耗尽。多个线程可以同时对同一个调度器调用run，
+    各自的任务在同一份预算和并行数限制下申请放行。
+    """
+
+    # 解码器内部缓存的原始分辨率帧数
+    DECODER_BUFFER_FRAMES = 4
+    # 每个任务的固定额外开销（字节）
+    BASE_OVERHEAD = 64 * 1024 * 1024
+
+    ORDERS = ('largest_first', 'smallest_first', 'input')
+
+    def __init__(self, memory_budget=None, max_workers=None, order='largest_first', logger=None):
+        """初始化调度器
+
+        Args:
+            memory_budget: 内存预算（字节），为None时使用物理内存的一半
+            max_workers: 最大并行任务数，为None时使用CPU核心数
+            order: 排队顺序，可选 largest_first, smallest_first, input
+            logger: 日志函数
+        """
+        if order not in self.ORDERS:
+            raise ValueError(f"不支持的排队顺序: {order}")
+
+        self.memory_budget = memory_budget or self.default_memory_budget()
+        self.max_workers = max(1, max_workers or os.cpu_count() or 1)
+        self.order = order
+        self.logger = logger
+
+        self._condition = threading.Condition()
+        self._memory_in_use = 0
+        self._running = 0
+
+    def log(self, message):
+        """输出日志"""
+        if self.logger:
+            self.logger(message)
+
+    @staticmethod
+    def default_memory_budget():
+        """默认内存预算：物理内存的一半，无法获取时为2GB"""
+        try:
+            total = os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES')
+        except (ValueError, OSError, AttributeError):
+            total = 4 * 1024 ** 3
+        return total // 2
+
+    @classmethod
+    def estimate_memory(cls, metadata, start_time=0, split_duration=None, split_count=None,
+                        selected_region=None, fps=10, spool_threshold=None, outputs=None):
+        """根据视频元数据和分割参数估算单个任务的峰值内存占用
+
+        Args:
+            metadata: 视频元数据字典，包含 width, height, duration
+            start_time: 开始时间（秒）
+            split_duration: 分割时长（秒）
+            split_count: 分割数量
+            selected_region: 选择的区域(x, y, width, height)
+            fps: 输出帧率
+            spool_threshold: 片段帧缓存到磁盘的时长阈值（秒），为None时不缓存
+            outputs: 共用一次解码的多个输出规格 (帧率, 缩放比例) 列表，为None时只有一个fps帧率的原尺寸输出
+
+        Returns:
+            预估的字节数
+        """
+        source_frame_bytes = metadata['width'] * metadata['height'] * 3
+
+        if selected_region:
+            _, _, width, height = selected_region
+            output_frame_bytes = width * height * 3
+        else:
+            output_frame_bytes = source_frame_bytes
+
+        remaining = max(metadata['duration'] - start_time, 0)
+        if split_duration is not None:
+            segment_length = min(split_duration, remaining)
+        elif split_count:
+            segment_length = remaining / split_count
+        else:
+            segment_length = remaining
+
+        # 在内存中编码的片段需要同时持有全部输出帧；超过阈值的片段缓存到磁盘后逐帧流式编码，
+        # 常驻内存只有几帧，因此最多按阈值长度的片段计算
+        if spool_threshold is not None:
+            segment_length = min(segment_length, spool_threshold)
+        if outputs is None:
+            outputs = [(fps, 1.0)]
+        segment_bytes = sum(math.ceil(segment_length * output_fps) * output_frame_bytes * scale ** 2
+                            for output_fps, scale in outputs)
+
+        return (int(segment_bytes)
+                + cls.DECODER_BUFFER_FRAMES * source_frame_bytes
+                + cls.BASE_OVERHEAD)
+
+    def order_jobs(self, jobs):
+        """按配置的顺序排列任务"""
+        if self.order == 'largest_first':
+            return sorted(jobs, key=lambda job: job.estimated_memory, reverse=True)
+        if self.order == 'smallest_first':
+            return sorted(jobs, key=lambda job: job.estimated_memory)
+        return list(jobs)
+
+    def _pick_admissible(self, pending):
+        """从等待队列中选出当前预算可以放行的任务"""
+        if self._running >= self.max_workers:
+            return None
+
+        for job in pending:
+            if self._memory_in_use + job.estimated_memory <= self.memory_budget:
+                return job
+
+        # 超出预算的任务在没有其它任务运行时单独放行，避免永久等待
+        if self._running == 0 and pending:
+            self.log(f"警告: {os.path.basename(pending[0].video_path)} 预估内存超过预算，将单独处理")
+            return pending[0]
+
+        return None
+
+    def _release(self, job):
+        """任务结束后归还内存预算"""
+        with self._condition:
+            self._memory_in_use -= job.estimated_memory
+            self._running -= 1
+            self._condition.notify_all()
+
+    def _run_job(self, job, worker):
+        try:
+            return worker(job)
+        finally:
+            self._release(job)
+
+    def run(self, jobs, worker):
+        """调度执行所有任务
+
+        Args:
+            jobs: VideoJob列表
+            worker: 处理单个任务的函数，参数为VideoJob
+
+        Returns:
+            (VideoJob, 结果或异常) 列表，顺序与任务完成放行顺序一致
+        """
+        pending = self.order_jobs(jobs)
+        futures = []
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            while pending:
+                with self._condition:
+                    job = self._pick_admissible(pending)
+                    while job is None:
+                        self._condition.wait()
+                        job = self._pick_admissible(pending)
+
+                    pending.remove(job)
+                    self._memory_in_use += job.estimated_memory
+                    self._running += 1
+
+                futures.append((job, pool.submit(self._run_job, job, worker)))
+
+        results = []
+        for job, future in futures:
+            error = future.exception()
+            results.append((job, error if error else future.result()))
+        return results
@@ -0,0 +1,152 @@
+import os
+import json
+import bisect
+import hashlib
+import threading
+
+from core.ffmpeg_tools import FFmpegTools
+from core.file_manager import FileManager
+
+
+class SeekIndex:
+    """视频关键帧索引
+
+    记录视频流中所有关键帧的时间（秒，从0开始），用于判断跳转目标之前最近的
+    关键帧，以及从当前位置顺序解码到目标时间是否比重新跳转更快。
+    """
+
+    # 比较时间的容差（秒）
+    TIME_EPSILON = 1e-3
+
+    def __init__(self, keyframes):
+        """初始化索引
+
+        Args:
+            keyframes: 关键帧时间列表（秒）
+        """
+        self.keyframes = sorted(keyframes)
+
+    def __len__(self):
+        return len(self.keyframes)
+
+    def keyframe_before(self, timestamp):
+        """不晚于timestamp的最近关键帧时间，没有时返回None"""
+        i = bisect.bisect_right(self.keyframes, timestamp + self.TIME_EPSILON)
+        return self.keyframes[i - 1] if i > 0 else None
+
+    def has_keyframe_between(self, start, end):
+        """(start, end] 区间内是否有关键帧"""
+        i = bisect.bisect_right(self.keyframes, start + self.TIME_EPSILON)
+        return i < len(self.keyframes) and self.keyframes[i] <= end + self.TIME_EPSILON
+
+    @staticmethod
+    def _keyframes_from_packets(video_path):
+        """用PyAV只解复用不解码，读取关键帧数据包的时间"""
+        import av
+
+        with av.open(video_path) as container:
+            if not container.streams.video:
+                raise ValueError(f"视频文件中没有视频流: {video_path}")
+            stream = container.streams.video[0]
+            start = float(stream.start_time * stream.time_base) if stream.start_time is not None else 0.0
+
+            keyframes = []
+            for packet in container.demux(stream):
+                if packet.is_keyframe and packet.pts is not None:
+                    keyframes.append(float(packet.pts * stream.time_base) - start)
+        return keyframes
+
+    @classmethod
+    def build(cls, video_path):
+        """读取视频的关键帧并建立索引
+
+        优先使用PyAV读取数据包，没有安装时使用ffprobe/ffmpeg。
+        """
+        try:
+            keyframes = cls._keyframes_from_packets(video_path)
+        except ImportError:
+            keyframes = FFmpegTools.list_keyframes(video_path)
+
+        if not keyframes:
+            raise ValueError(f"没有读取到关键帧: {video_path}")
+        return cls(keyframes)
+
+
+class SeekIndexCache:
+    """关键帧索引缓存
+
+    每个文件的索引在内存中缓存，同时以JSON保存在缓存目录中，文件大小或修改时间
+    变化后重新建立。
+    """
+
+    DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'videoProcessTools', 'seek_index')
+
+    def __init__(self, cache_dir=None, logger=None):
+        """初始化缓存
+
+        Args:
+            cache_dir: 索引文件目录，为None时使用DEFAULT_CACHE_DIR，为False时只在内存中缓存
+            logger: 日志函数
+        """
+        self.cache_dir = self.DEFAULT_CACHE_DIR if cache_dir is None else cache_dir
+        self.logger = logger
+        self._cache = {}
+        self._lock = threading.Lock()
+
+    def log(self, message):
+        """输出日志"""
+        if self.logger:
+            self.logger(message)
+
+    def _cache_key(self, video_path):
+        stat = os.stat(video_path)
+        return os.path.abspath(video_path), stat.st_size, stat.st_mtime
+
+    def _cache_file(self, key):
+        digest = hashlib.sha1(repr(key).encode('utf-8')).hexdigest()
+        return os.path.join(self.cache_dir, f"{digest}.json")
+
+    def _load(self, key):
+        path = self._cache_file(key)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return SeekIndex(json.load(f)['keyframes'])
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def _save(self, key, index):
+        try:
+            FileManager.ensure_directory(self.cache_dir)
+            path = self._cache_file(key)
+            temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump({'path': key[0], 'keyframes': index.keyframes}, f)
+            os.replace(temp_path, path)
+        except OSError as e:
+            self.log(f"保存关键帧索引失败: {str(e)}")
+
+    def get(self, video_path):
+        """获取视频的关键帧索引
+
+        Returns:
+            SeekIndex，无法建立索引时返回None
+        """
+        key = self._cache_key(video_path)
+        with self._lock:
+            if key in self._cache:
+                return self._cache[key]
+
+        index = self._load(key) if self.cache_dir else None
+        if index is None:
+            try:
+                index = SeekIndex.build(video_path)
+            except Exception as e:
+                self.log(f"无法建立关键帧索引，按解码器默认方式跳转: {str(e)}")
+            else:
+                self.log(f"{os.path.basename(video_path)} 关键帧索引: {len(index)} 个关键帧")
+                if self.cache_dir:
+                    self._save(key, index)
+
+        with self._lock:
+            self._cache[key] = index
+        return index
@@ -0,0 +1,143 @@
+import io
+import cv2
+import numpy as np
+from PIL import Image
+
+from core.encoders import GifFormat
+
+
+class GifSettings:
+    """GIF编码参数：帧率、缩放比例和颜色数"""
+
+    def __init__(self, fps=10, scale=1.0, colors=256):
+        self.fps = fps
+        self.scale = scale
+        self.colors = colors
+
+    def apply(self, frame):
+        """对单帧应用缩放和减色"""
+        if self.scale != 1.0:
+            height, width = frame.shape[:2]
+            size = (max(1, int(width * self.scale)), max(1, int(height * self.scale)))
+            frame = cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+
+        if self.colors < 256:
+            image = Image.fromarray(frame).quantize(colors=self.colors)
+            frame = np.asarray(image.convert('RGB'))
+
+        return frame
+
+    def is_default(self):
+        """是否为不做任何变换的参数"""
+        return self.scale == 1.0 and self.colors >= 256
+
+    def __repr__(self):
+        return f"fps={self.fps}, 缩放={self.scale:.2f}, 颜色数={self.colors}"
+
+
+class GifSizeEstimator:
+    """动图文件大小估算类
+
+    从片段中抽取少量连续帧，按候选参数试编码，再按帧数外推整个片段的大小，
+    从而在真正编码前选出能满足大小限制的参数。试编码与正式编码使用同一个
+    输出格式写入器，默认为GIF。
+    """
+
+    # 候选参数，按画质从高到低排列
+    DEFAULT_CANDIDATES = [
+        (10, 1.0, 256), (10, 0.75, 256), (8, 0.75, 256), (8, 0.75, 128),
+        (8, 0.5, 256), (6, 0.5, 128), (5, 0.5, 64), (5, 0.35, 64),
+        (5, 0.25, 64), (4, 0.25, 32),
+    ]
+
+    def __init__(self, candidates=None, sample_windows=3, frames_per_window=4, safety_margin=0.9):
+        """初始化估算器
+
+        Args:
+            candidates: (fps, scale, colors) 候选列表，按画质从高到低排列
+            sample_windows: 抽样窗口数
+            frames_per_window: 每个窗口的连续帧数，用于体现帧间差分编码的效果
+            safety_margin: 预测大小需小于 目标大小*safety_margin 才视为满足
+        """
+        candidates = candidates or self.DEFAULT_CANDIDATES
+        self.candidates = [GifSettings(fps, scale, colors) for fps, scale, colors in candidates]
+        self.sample_windows = sample_windows
+        self.frames_per_window = frames_per_window
+        self.safety_margin = safety_margin
+
+    def _window_starts(self, duration, fps):
+        """计算抽样窗口的起始时间，均匀分布在片段内"""
+        window_length = self.frames_per_window / fps
+        usable = max(duration - window_length, 0)
+        if self.sample_windows == 1:
+            return [usable / 2]
+        return [usable * i / (self.sample_windows - 1) for i in range(self.sample_windows)]
+
+    def _encode_size(self, frames, fps, output_format):
+        """在内存中试编码并返回字节数"""
+        buffer = io.BytesIO()
+        writer = output_format.create_writer(buffer, fps)
+        for frame in frames:
+            writer.add_frame(frame)
+        writer.close()
+        return len(buffer.getvalue())
+
+    def estimate(self, read_window, duration, settings, frame_cache=None, output_format=None):
+        """预测片段按指定参数编码后的大小
+
+        Args:
+            read_window: 读取抽样窗口的函数，参数为(片段内开始时间, 帧数, 帧率)，返回RGB帧列表
+            duration: 片段时长（秒）
+            settings: GifSettings
+            frame_cache: 抽样窗口的缓存字典，多个候选参数之间复用已解码的帧
+            output_format: 输出格式OutputFormat，为None时使用GIF
+
+        Returns:
+            预测的字节数
+        """
+        if frame_cache is None:
+            frame_cache = {}
+        if output_format is None:
+            output_format = GifFormat()
+
+        total_frames = max(1, int(np.ceil(duration * settings.fps)))
+        frames_per_window = min(self.frames_per_window, total_frames)
+
+        bytes_per_frame = []
+        for window_start in self._window_starts(duration, settings.fps):
+            key = (round(window_start, 3), frames_per_window, settings.fps)
+            if key not in frame_cache:
+                frame_cache[key] = read_window(window_start, frames_per_window, settings.fps)
+            frames = [settings.apply(frame) for frame in frame_cache[key]]
+            if not frames:
+                continue
+
+            # 每个窗口的首帧是完整帧，外推结果会略微偏大，对大小上限而言更安全
+            bytes_per_frame.append(self._encode_size(frames, settings.fps, output_format) / len(frames))
+
+        if not bytes_per_frame:
+            return 0
+        return int(np.mean(bytes_per_frame) * total_frames)
+
+    def choose_settings(self, read_window, duration, target_size, output_format=None):
+        """选出预测大小满足目标的最高画质参数
+
+        Args:
+            read_window: 读取抽样窗口的函数，参数为(片段内开始时间, 帧数, 帧率)，返回RGB帧列表
+            duration: 片段时长（秒）
+            target_size: 目标大小（字节）
+            output_format: 输出格式OutputFormat，为None时使用GIF
+
+        Returns:
+            (GifSettings, 预测字节数)，所有候选都不满足时返回最后一个候选
+        """
+        frame_cache = {}
+        limit = target_size * self.safety_margin
+        estimated = None
+
+        for settings in self.candidates:
+            estimated = self.estimate(read_window, duration, settings, frame_cache, output_format)
+            if estimated <= limit:
+                return settings, estimated
+
+        return self.candidates[-1], estimated
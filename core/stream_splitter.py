@@ -0,0 +1,130 @@
+import os
+import bisect
+
+from core.ffmpeg_tools import FFmpegTools
+from core.cancellation import ProcessingCancelled
+
+
+class StreamCopySplitter:
+    """流复制分割类，调用本地ffmpeg不重新编码地切分视频片段"""
+
+    CONTAINERS = ('mp4', 'mkv')
+
+    def __init__(self, container='mp4', snap_to_keyframes=True, logger=None):
+        """初始化分割器
+
+        Args:
+            container: 输出容器格式，mp4 或 mkv
+            snap_to_keyframes: 是否将片段边界对齐到最近的关键帧
+            logger: 日志函数
+        """
+        if container not in self.CONTAINERS:
+            raise ValueError(f"不支持的输出容器: {container}")
+
+        self.container = container
+        self.snap_to_keyframes = snap_to_keyframes
+        self.logger = logger
+
+    def log(self, message):
+        """输出日志"""
+        if self.logger:
+            self.logger(message)
+
+    @staticmethod
+    def snap_boundaries(boundaries, keyframes):
+        """将边界时间对齐到最近的关键帧，并去掉重合的边界
+
+        Args:
+            boundaries: 递增的绝对边界时间列表，首尾为开始和结束时间
+            keyframes: 递增的关键帧时间列表
+
+        Returns:
+            对齐后的边界时间列表，结束时间保持不变
+        """
+        if not keyframes:
+            return list(boundaries)
+
+        snapped = []
+        end = boundaries[-1]
+        for boundary in boundaries[:-1]:
+            i = bisect.bisect_left(keyframes, boundary)
+            nearby = keyframes[max(i - 1, 0):i + 1]
+            keyframe = min(nearby, key=lambda k: abs(k - boundary))
+            if keyframe < end and (not snapped or keyframe > snapped[-1]):
+                snapped.append(keyframe)
+        snapped.append(end)
+        return snapped
+
+    def split(self, video_path, output_dir, start_time, segments, keyframes=None, cancel_token=None):
+        """按片段列表切分视频
+
+        Args:
+            video_path: 视频路径
+            output_dir: 输出目录
+            start_time: 开始时间（秒），片段时间相对于它
+            segments: (片段索引, 开始时间, 结束时间) 列表
+            keyframes: 已知的关键帧时间列表，为None时读取视频获取
+            cancel_token: CancelToken，取消时结束ffmpeg并删除本次写出的片段
+
+        Returns:
+            输出文件路径列表
+        """
+        ffmpeg = FFmpegTools.find_ffmpeg()
+        if not ffmpeg:
+            raise RuntimeError("未找到ffmpeg，无法进行流复制分割")
+
+        boundaries = [start_time + seg_start for _, seg_start, _ in segments]
+        boundaries.append(start_time + segments[-1][2])
+
+        if self.snap_to_keyframes:
+            if keyframes is None:
+                keyframes = FFmpegTools.list_keyframes(video_path)
+            boundaries = self.snap_boundaries(boundaries, keyframes)
+            self.log(f"片段边界已对齐到关键帧: {', '.join(f'{b:.2f}' for b in boundaries)}")
+
+        try:
+            if self.snap_to_keyframes:
+                return self._split_single_pass(ffmpeg, video_path, output_dir, boundaries, cancel_token)
+            return self._split_each(ffmpeg, video_path, output_dir, boundaries, cancel_token)
+        except ProcessingCancelled:
+            for i in range(len(boundaries) - 1):
+                partial = self._output_path(output_dir, i)
+                if os.path.exists(partial):
+                    os.remove(partial)
+            raise
+
+    def _output_path(self, output_dir, index):
+        return os.path.join(output_dir, f"{index + 1}.{self.container}")
+
+    def _split_single_pass(self, ffmpeg, video_path, output_dir, boundaries, cancel_token=None):
+        """边界都在关键帧上时，用segment复用器一次顺序读完成所有片段"""
+        first = boundaries[0]
+        segment_times = ','.join(f"{b - first:.6f}" for b in boundaries[1:-1])
+
+        args = [ffmpeg, '-hide_banner', '-loglevel', 'error', '-y',
+                '-ss', f"{first:.6f}", '-i', video_path,
+                '-t', f"{boundaries[-1] - first:.6f}",
+                '-map', '0', '-c', 'copy', '-f', 'segment', '-reset_timestamps', '1',
+                '-segment_start_number', '1', '-segment_format', self.container]
+        if segment_times:
+            args += ['-segment_times', segment_times]
+        args.append(os.path.join(output_dir, f"%d.{self.container}"))
+
+        FFmpegTools.run(args, cancel_token=cancel_token)
+        return [self._output_path(output_dir, i) for i in range(len(boundaries) - 1)]
+
+    def _split_each(self, ffmpeg, video_path, output_dir, boundaries, cancel_token=None):
+        """边界不对齐时逐个片段流复制，片段从前一个关键帧开始并由容器裁掉多余部分"""
+        outputs = []
+        for i, (seg_start, seg_end) in enumerate(zip(boundaries[:-1], boundaries[1:])):
+            if cancel_token is not None:
+                cancel_token.check()
+            output_file = self._output_path(output_dir, i)
+            self.log(f"复制片段 {i + 1}/{len(boundaries) - 1}: {seg_start:.1f}秒 - {seg_end:.1f}秒")
+            FFmpegTools.run([
+                ffmpeg, '-hide_banner', '-loglevel', 'error', '-y',
+                '-ss', f"{seg_start:.6f}", '-i', video_path, '-t', f"{seg_end - seg_start:.6f}",
+                '-map', '0', '-c', 'copy', '-avoid_negative_ts', 'make_zero', output_file
+            ], cancel_token=cancel_token)
+            outputs.append(output_file)
+        return outputs
@@ -1,19 +1,88 @@
 import os
-import cv2
+import json
+import math
 import glob
-from moviepy import VideoFileClip
+import time
+import threading
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+
+from core.scheduler import JobScheduler, VideoJob
+from core.size_estimator import GifSizeEstimator, GifSettings
+from core.stream_splitter import StreamCopySplitter
+from core.encoders import get_output_format
+from core.decoders import DecoderSelector, crop_frame, open_decoder
+from core.ffmpeg_backend import FFmpegGifBackend
+from core.pipeline import PipelineExecutor
+from core.seek_index import SeekIndexCache
+from core.renditions import RenditionSampler, build_renditions
+from core.watchdog import VideoWatchdog
+from core.parallel_encoder import ParallelSegmentEncoder
+from core.batch_planner import BatchPlanner
+from core.prefetch import InputPrefetcher
+from core.cancellation import CancelToken, ProcessingCancelled
+from core.archive_sink import OutputArchiver
 
 
 class VideoProcessor:
     """视频处理类，负责视频转GIF的核心功能"""
 
+    # 默认GIF帧率，使用较低的fps以减小文件大小
+    GIF_FPS = 10
+
+    # 流水线各阶段之间队列的最大帧数
+    PIPELINE_QUEUE_SIZE = 8
+
+    # 输出模式: gif 重新编码为GIF，clip 流复制输出视频片段
+    OUTPUT_MODES = ('gif', 'clip')
+    # GIF生成后端: python 逐帧编码，ffmpeg 滤镜图，auto 可用时使用ffmpeg
+    ENCODER_BACKENDS = ('auto', 'python', 'ffmpeg')
+
+    # 支持的视频文件扩展名
+    VIDEO_EXTENSIONS = ('.mp4', '.avi', '.mov', '.mkv', '.wmv', '.flv')
+
+    # 开启预读时并行读取元数据的线程数
+    PROBE_THREADS = 8
+
+    # 隔离列表文件名；同一进程内多次处理写入同一输出目录时合并，用锁避免互相覆盖
+    QUARANTINE_NAME = 'quarantine.json'
+    _quarantine_lock = threading.Lock()
+
     def __init__(self):
         self.logger_callback = None
+        self.progress_callback = None
+        self.size_estimator = GifSizeEstimator()
+        self.decoder_selector = DecoderSelector(logger=self.log)
+        self.ffmpeg_backend = FFmpegGifBackend(logger=self.log)
+        self.seek_index_cache = SeekIndexCache(logger=self.log)
+        self.cancel_token = CancelToken()
+
+    def set_cancel_token(self, token):
+        """设置取消标记，处理在帧和片段之间检查它，暂停时等待，取消时抛出ProcessingCancelled"""
+        self.cancel_token = token
 
     def set_logger_callback(self, callback):
         """设置日志回调函数"""
         self.logger_callback = callback
 
+    def set_progress_callback(self, callback):
+        """设置进度回调函数，回调接收一个事件字典"""
+        self.progress_callback = callback
+
+    def report(self, event, **data):
+        """报告处理进度
+
+        事件类型:
+            videos: 本次要处理的视频列表 videos
+            segments: 视频video已完成done个片段，共total个
+            timings: 视频video各阶段累计耗时 timings（秒）
+            video_done: 视频video处理结束，success表示是否成功
+            quarantine: 重试后仍失败的视频列表 videos
+            plan: 预估结果 plan（dry_run时）
+        """
+        if self.progress_callback:
+            self.progress_callback(dict(data, event=event))
+
     def log(self, message):
         """输出日志"""
         if self.logger_callback:
@@ -23,18 +92,37 @@ class VideoProcessor:
 
     def get_video_files(self, directory):
         """获取目录下的所有视频文件"""
-        # 支持的视频文件扩展名
-        video_extensions = ['*.mp4', '*.avi', '*.mov', '*.mkv', '*.wmv', '*.flv']
         videos = []
 
-        for ext in video_extensions:
-            pattern = os.path.join(directory, ext)
+        for ext in self.VIDEO_EXTENSIONS:
+            pattern = os.path.join(directory, f"*{ext}")
             videos.extend(glob.glob(pattern))
 
         return sorted(videos)
 
+    def probe_video(self, video_path, decoder_backend='auto'):
+        """读取视频元数据
+
+        Args:
+            video_path: 视频路径
+            decoder_backend: 解码器名称，auto时按文件自动选择，选择结果在解码时复用
+
+        Returns:
+            包含 width, height, fps, frame_count, duration 的字典
+        """
+        with open_decoder(video_path, decoder_backend, selector=self.decoder_selector) as decoder:
+            return decoder.metadata
+
     def process_videos(self, input_path, output_path, start_time=0,
-                       split_duration=None, split_count=None, selected_region=None):
+                       split_duration=None, split_count=None, selected_region=None,
+                       max_workers=1, memory_budget=None, schedule_order='largest_first',
+                       scene_detector=None, target_size=None, output_mode='gif',
+                       clip_container='mp4', snap_to_keyframes=True, output_format='gif',
+                       decoder_backend='auto', encoder_backend='auto', encode_workers=1,
+                       spool_threshold=None, spool_dir=None, video_files=None,
+                       video_timeout=None, segment_timeout=None, retries=0, retry_backoff=2.0,
+                       renditions=None, dither=None, dry_run=False, prefetch=2,
+                       prefetch_budget=None, archive='none', archive_format='zip', scheduler=None):
         """处理视频转GIF
 
         Args:
@@ -44,79 +132,315 @@ class VideoProcessor:
             split_duration: 分割时长（秒），与split_count互斥
             split_count: 分割数量，与split_duration互斥
             selected_region: 选择的区域(x, y, width, height)，如果为None则转换整个视频
+            max_workers: 最大并行处理视频数，默认逐个处理，为None时使用CPU核心数
+            memory_budget: 内存预算（字节），为None时使用物理内存的一半
+            schedule_order: 排队顺序，可选 largest_first, smallest_first, input
+            scene_detector: 场景检测器SceneDetector，指定时按场景切换分割，忽略分割时长和分割数量
+            target_size: 每个GIF的目标大小上限（字节），为None时不限制
+            output_mode: 输出模式，gif 或 clip（流复制输出视频片段）
+            clip_container: clip模式的输出容器，mp4 或 mkv
+            snap_to_keyframes: clip模式下是否将片段边界对齐到关键帧
+            output_format: gif模式下的动图格式，gif, webp 或 apng
+            decoder_backend: 解码器名称(opencv, pyav, ffmpeg)，auto时按文件自动选择
+            encoder_backend: GIF生成后端，python, ffmpeg 或 auto（可用时使用ffmpeg）
+            encode_workers: Python后端下每个视频的编码进程数，大于1时片段在多个进程中并行编码
+            spool_threshold: 时长不短于该值（秒）的片段把帧缓存到磁盘，为None时全部在内存中编码
+            spool_dir: 帧缓存文件所在目录，为None时使用系统临时目录
+            video_files: 要处理的视频文件列表，为None时处理input_path下的所有视频
+            video_timeout: 单个视频一次尝试的时限（秒）
+            segment_timeout: 两个片段完成之间的最长间隔（秒）
+            retries: 视频处理失败后的重试次数
+            retry_backoff: 第一次重试前的等待时间（秒），之后每次加倍
+            renditions: gif模式下的多个输出规格，Rendition对象或字典
+                {'name', 'fps', 'scale', 'colors', 'format'} 的列表。指定时每帧只解码一次，
+                各规格的输出写入 输出路径/规格名称/视频名称/
+            dither: GIF的抖动方式，none 每帧自适应调色板，bayer 固定调色板加有序抖动（帧间稳定），
+                为None时未指定：Python编码与none相同，ffmpeg后端使用其默认的误差扩散抖动
+
+            dry_run: 只预估不处理，读取元数据、计算片段并试处理一小段，
+                预测片段数、输出大小和总耗时
+            prefetch: 处理当前视频时在后台预读之后的几个视频（读入页缓存并建立关键帧索引），
+                为0时不预读；同时决定开始时是否并行读取所有视频的元数据
+            prefetch_budget: 已预读但尚未开始处理的最大字节数，为None时使用默认预算
+            archive: 打包输出，none 每个片段一个文件，video 每个视频打包为 输出路径/视频名称.zip，
+                run 整批打包为 输出路径/输入目录名称.zip。打包时视频先输出到spool_dir（或系统临时目录）
+                下的暂存目录，完成后顺序追加到不压缩的归档，归档写完后才重命名到输出路径
+            archive_format: 归档格式，zip 或 tar
+            scheduler: 共用的JobScheduler，为None时按max_workers、memory_budget和schedule_order新建。
+                多次调用共用同一个调度器时，各自的视频在同一份内存预算中申请放行
+
+            指定了时限或重试次数时，每个视频在可结束的子进程中处理，重试后仍失败的
+            视频记入隔离列表，合并写入输出目录的quarantine.json。
+            取消标记被取消时，正在处理的视频删除未写完的输出后结束，之后抛出ProcessingCancelled。
+
+        Returns:
+            {视频路径: 是否处理成功} 字典，dry_run时为BatchPlanner.plan返回的预估结果
         """
         # 检查参数
+        if output_mode not in self.OUTPUT_MODES:
+            raise ValueError(f"不支持的输出模式: {output_mode}")
+
         if not os.path.exists(input_path):
             raise ValueError(f"输入路径不存在: {input_path}")
 
-        if not os.path.exists(output_path):
+        if not os.path.exists(output_path) and not dry_run:
             self.log(f"输出路径不存在，将创建: {output_path}")
             os.makedirs(output_path, exist_ok=True)
 
-        if split_duration is None and split_count is None:
+        if scene_detector is not None:
+            split_duration = None
+            split_count = None
+        elif split_duration is None and split_count is None:
             raise ValueError("分割时长和分割数量不能同时为空")
 
         if split_duration is not None and split_count is not None:
             self.log("分割时长和分割数量同时指定，将使用分割时长")
             split_count = None
 
+        if output_mode == 'clip' and selected_region:
+            self.log("警告: 流复制模式不支持区域裁剪，将输出完整画面")
+
+        if archive not in OutputArchiver.MODES:
+            raise ValueError(f"不支持的打包方式: {archive}")
+
+        rendition_outputs = None
+        if renditions and output_mode == 'gif':
+            # 提前检查规格参数，避免每个视频都报同样的错误
+            rendition_outputs = [(rendition.fps, rendition.scale)
+                                 for rendition in build_renditions(renditions, self.GIF_FPS, dither)]
+
         # 获取视频文件列表
-        videos = self.get_video_files(input_path)
+        videos = list(video_files) if video_files is not None else self.get_video_files(input_path)
 
         if not videos:
             self.log("未找到视频文件")
-            return
+            return {}
 
         self.log(f"找到 {len(videos)} 个视频文件")
+        self.report('videos', videos=videos)
 
-        # 处理每个视频
-        for i, video_path in enumerate(videos):
+        if scheduler is None:
+            scheduler = JobScheduler(memory_budget=memory_budget, max_workers=max_workers,
+                                     order=schedule_order, logger=self.log)
+
+        def probe(video_path):
             try:
-                self.log(f"处理视频 {i + 1}/{len(videos)}: {os.path.basename(video_path)}")
-                self.convert_video_to_gif(video_path, output_path, start_time,
-                                          split_duration, split_count, selected_region)
+                return self.probe_video(video_path, decoder_backend), None
             except Exception as e:
-                self.log(f"处理视频出错: {str(e)}")
+                return None, e
 
-    def convert_video_to_gif(self, video_path, output_path, start_time=0,
-                             split_duration=None, split_count=None, selected_region=None):
-        """将单个视频转换为GIF
+        # 网络存储上逐个打开文件很慢，开启预读时并行读取元数据
+        threads = min(self.PROBE_THREADS, len(videos)) if prefetch > 0 else 1
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            probed = list(pool.map(probe, videos))
 
-        Args:
-            video_path: 视频路径
-            output_path: 输出GIF路径
-            start_time: 开始时间（秒）
-            split_duration: 分割时长（秒），与split_count互斥
-            split_count: 分割数量，与split_duration互斥
-            selected_region: 选择的区域(x, y, width, height)，如果为None则转换整个视频
-        """
-        video_name = os.path.splitext(os.path.basename(video_path))[0]
-        output_dir = os.path.join(output_path, video_name)
-        os.makedirs(output_dir, exist_ok=True)
+        # 根据元数据估算每个视频的内存占用
+        jobs = []
+        for i, (video_path, (metadata, error)) in enumerate(zip(videos, probed)):
+            try:
+                if error is not None:
+                    raise error
+                # 场景分割时按最长片段时长估算
+                estimate_duration = split_duration
+                if scene_detector is not None:
+                    estimate_duration = scene_detector.max_scene_length
+                if output_mode == 'clip':
+                    # 流复制不解码，只有固定开销
+                    estimated_memory = scheduler.BASE_OVERHEAD
+                else:
+                    estimated_memory = scheduler.estimate_memory(metadata, start_time, estimate_duration,
+                                                                 split_count, selected_region,
+                                                                 spool_threshold=spool_threshold,
+                                                                 outputs=rendition_outputs)
+            except Exception as e:
+                self.log(f"读取视频信息出错: {os.path.basename(video_path)}: {str(e)}")
+                metadata = None
+                estimated_memory = scheduler.BASE_OVERHEAD
+            jobs.append(VideoJob(i, video_path, metadata, estimated_memory))
+
+        self.log(f"内存预算 {scheduler.memory_budget / 1024 ** 2:.0f}MB，最多并行 {scheduler.max_workers} 个视频")
+
+        convert_options = dict(
+            output_mode=output_mode, start_time=start_time, split_duration=split_duration,
+            split_count=split_count, selected_region=selected_region, scene_detector=scene_detector,
+            target_size=target_size, clip_container=clip_container,
+            snap_to_keyframes=snap_to_keyframes, output_format=output_format,
+            decoder_backend=decoder_backend, encoder_backend=encoder_backend,
+            encode_workers=encode_workers, spool_threshold=spool_threshold, spool_dir=spool_dir,
+            renditions=renditions, dither=dither)
+
+        if dry_run:
+            planner = BatchPlanner(self, logger=self.log)
+            plan = planner.plan(jobs, scheduler, output_path, convert_options)
+            planner.summarize(plan)
+            self.report('plan', plan=plan)
+            return plan
+
+        watchdog = None
+        if video_timeout is not None or segment_timeout is not None or retries > 0:
+            watchdog = VideoWatchdog(video_timeout, segment_timeout, retries, retry_backoff,
+                                     logger=self.log, progress=self.progress_callback,
+                                     cancel_token=self.cancel_token)
+        quarantine = []
+
+        # 按调度顺序预读即将处理的视频
+        prefetcher = InputPrefetcher([job.video_path for job in scheduler.order_jobs(jobs)
+                                      if job.metadata is not None],
+                                     depth=prefetch, byte_budget=prefetch_budget,
+                                     warmers=[self.seek_index_cache.get], logger=self.log)
+
+        archiver = None
+        if archive != 'none':
+            run_name = os.path.splitext(os.path.basename(os.path.normpath(input_path)))[0] or 'output'
+            archiver = OutputArchiver(output_path, archive, archive_format, run_name,
+                                      staging_dir=spool_dir, logger=self.log)
+
+        def worker(job):
+            prefetcher.advance(job.video_path)
+            if archiver is None:
+                return process(job, output_path)
+
+            # 先输出到本地暂存目录，处理结束后追加到归档，已完成的片段与不打包时一样保留
+            staging = archiver.stage()
+            try:
+                success = process(job, staging)
+                archiver.pack(job.video_path, staging)
+                return success
+            except Exception as e:
+                self.log(f"打包输出出错: {str(e)}")
+                return False
+            finally:
+                archiver.discard(staging)
 
-        # 使用moviepy打开视频
-        clip = VideoFileClip(video_path)
+        def process(job, target_path):
+            try:
+                # 取消后排队中的视频不再开始
+                self.cancel_token.check()
+                self.log(f"处理视频 {job.index + 1}/{len(videos)}: {os.path.basename(job.video_path)} "
+                         f"(预估内存 {job.estimated_memory / 1024 ** 2:.0f}MB)")
+                if watchdog is not None:
+                    success, error, attempts = watchdog.run(job.video_path, target_path, convert_options)
+                    if not success:
+                        quarantine.append({'video': job.video_path, 'error': error, 'attempts': attempts})
+                    self.report('video_done', video=job.video_path, success=success)
+                    return success
+
+                self.convert_video(job.video_path, target_path, **convert_options)
+                self.report('video_done', video=job.video_path, success=True)
+                return True
+            except ProcessingCancelled:
+                self.report('video_done', video=job.video_path, success=False)
+                return False
+            except Exception as e:
+                self.log(f"处理视频出错: {str(e)}")
+                self.report('video_done', video=job.video_path, success=False)
+                return False
+
+        # 按内存预算调度处理每个视频
+        prefetcher.start()
+        try:
+            results = scheduler.run(jobs, worker)
+            if archiver is not None:
+                archiver.close()
+        finally:
+            prefetcher.close()
+            if archiver is not None:
+                archiver.abort()
+        results = {job.video_path: result is True for job, result in results}
+        self.log_run_summary(results, quarantine, output_path)
+        if self.cancel_token.cancelled:
+            self.log("处理已取消，未完成的视频没有输出")
+            raise ProcessingCancelled("处理已取消")
+        return results
+
+    def log_run_summary(self, results, quarantine, output_path):
+        """输出本次处理的汇总，隔离列表合并写入输出目录的quarantine.json"""
+        succeeded = sum(1 for success in results.values() if success)
+        self.log(f"处理汇总: 成功 {succeeded} 个，失败 {len(results) - succeeded} 个，"
+                 f"隔离 {len(quarantine)} 个")
+
+        for entry in quarantine:
+            self.log(f"已隔离: {entry['video']} (尝试 {entry['attempts']} 次): {entry['error']}")
+        quarantine_file = self.merge_quarantine(output_path, quarantine,
+                                                [path for path, success in results.items() if success])
+        if quarantine:
+            self.log(f"隔离列表已写入: {quarantine_file}")
+            self.report('quarantine', videos=quarantine)
+
+    def merge_quarantine(self, output_path, quarantine, succeeded):
+        """把本次的隔离记录合并到输出目录已有的隔离列表
+
+        同一视频只保留最新的记录，本次处理成功的视频从列表中移除；
+        其它调用写入的记录保留，监视模式下并发的处理不会互相覆盖。
 
-        # 检查开始时间是否有效
-        if start_time >= clip.duration:
-            self.log(f"警告: 开始时间 {start_time}秒 超过视频时长 {clip.duration}秒，将不处理此视频")
-            clip.close()
-            return
+        Args:
+            output_path: 输出目录
+            quarantine: 本次的隔离记录列表
+            succeeded: 本次处理成功的视频路径列表
 
-        # 裁剪到开始时间
-        clip = clip.subclipped(start_time)
+        Returns:
+            隔离列表文件路径
+        """
+        quarantine_file = os.path.join(output_path, self.QUARANTINE_NAME)
+        replaced = {entry['video'] for entry in quarantine} | set(succeeded)
+        with self._quarantine_lock:
+            try:
+                with open(quarantine_file, 'r', encoding='utf-8') as f:
+                    existing = json.load(f)
+            except (OSError, ValueError):
+                existing = []
+            if not isinstance(existing, list):
+                existing = []
+
+            entries = [entry for entry in existing
+                       if not (isinstance(entry, dict) and entry.get('video') in replaced)] + list(quarantine)
+            if entries == existing:
+                return quarantine_file
+            temp_path = f"{quarantine_file}.tmp"
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump(entries, f, ensure_ascii=False, indent=1)
+            os.replace(temp_path, quarantine_file)
+        return quarantine_file
+
+    def convert_video(self, video_path, output_path, output_mode='gif', start_time=0,
+                      split_duration=None, split_count=None, selected_region=None,
+                      scene_detector=None, target_size=None, clip_container='mp4',
+                      snap_to_keyframes=True, output_format='gif', decoder_backend='auto',
+                      encoder_backend='auto', encode_workers=1, spool_threshold=None, spool_dir=None,
+                      renditions=None, dither=None):
+        """按输出模式处理单个视频，参数含义同process_videos"""
+        if output_mode == 'clip':
+            self.convert_video_to_clips(video_path, output_path, start_time,
+                                        split_duration, split_count, scene_detector,
+                                        clip_container, snap_to_keyframes)
+        else:
+            self.convert_video_to_gif(video_path, output_path, start_time,
+                                      split_duration, split_count, selected_region,
+                                      scene_detector=scene_detector, target_size=target_size,
+                                      output_format=output_format,
+                                      decoder_backend=decoder_backend,
+                                      encoder_backend=encoder_backend,
+                                      encode_workers=encode_workers,
+                                      spool_threshold=spool_threshold,
+                                      spool_dir=spool_dir,
+                                      renditions=renditions,
+                                      dither=dither)
+
+    def plan_segments(self, duration, split_duration=None, split_count=None):
+        """根据分割方式计算片段
 
-        # 如果有选择区域，裁剪视频
-        if selected_region:
-            x, y, width, height = selected_region
-            clip = clip.crop(x1=x, y1=y, x2=x + width, y2=y + height)
+        Args:
+            duration: 待分割的总时长（秒）
+            split_duration: 分割时长（秒），与split_count互斥
+            split_count: 分割数量，与split_duration互斥
 
-        # 根据分割方式计算片段
+        Returns:
+            (片段索引, 开始时间, 结束时间) 列表
+        """
         segments = []
 
         if split_duration is not None:
             # 按时长分割
-            duration = clip.duration
             current_time = 0
             segment_index = 0
 
@@ -127,7 +451,6 @@ class VideoProcessor:
                 segment_index += 1
         else:
             # 按数量分割
-            duration = clip.duration
             segment_duration = duration / split_count
 
             for i in range(split_count):
@@ -135,24 +458,485 @@ class VideoProcessor:
                 end = min((i + 1) * segment_duration, duration)
                 segments.append((i, start, end))
 
+        return segments
+
+    def build_segments(self, video_path, start_time, duration, split_duration=None,
+                       split_count=None, scene_detector=None, decoder_backend='auto'):
+        """按场景切换或固定参数计算片段
+
+        场景检测与转换使用同一个解码器选择器，decoder_backend为auto时按文件自动选择。
+
+        Returns:
+            (片段索引, 开始时间, 结束时间) 列表，时间相对于start_time
+        """
+        if scene_detector is not None:
+            video_name = os.path.splitext(os.path.basename(video_path))[0]
+            self.log(f"检测视频 {video_name} 的场景切换...")
+            cuts = scene_detector.detect_cuts(video_path, start_time, duration, self.cancel_token,
+                                              decoder_backend, decoder_selector=self.decoder_selector)
+            return scene_detector.build_segments(cuts, duration)
+
+        return self.plan_segments(duration, split_duration, split_count)
+
+    def convert_video_to_clips(self, video_path, output_path, start_time=0, split_duration=None,
+                               split_count=None, scene_detector=None, container='mp4',
+                               snap_to_keyframes=True):
+        """将单个视频流复制切分为视频片段，不重新编码
+
+        Args:
+            video_path: 视频路径
+            output_path: 输出路径
+            start_time: 开始时间（秒）
+            split_duration: 分割时长（秒），与split_count互斥
+            split_count: 分割数量，与split_duration互斥
+            scene_detector: 场景检测器SceneDetector，指定时按场景切换分割
+            container: 输出容器格式，mp4 或 mkv
+            snap_to_keyframes: 是否将片段边界对齐到关键帧
+        """
+        video_name = os.path.splitext(os.path.basename(video_path))[0]
+        output_dir = os.path.join(output_path, video_name)
+        os.makedirs(output_dir, exist_ok=True)
+
+        metadata = self.probe_video(video_path)
+        if start_time >= metadata['duration']:
+            self.log(f"警告: 开始时间 {start_time}秒 超过视频时长 {metadata['duration']}秒，将不处理此视频")
+            return
+
+        begin = time.perf_counter()
+        duration = metadata['duration'] - start_time
+        segments = self.build_segments(video_path, start_time, duration,
+                                       split_duration, split_count, scene_detector)
+        self.log(f"视频 {video_name} 将流复制分割为 {len(segments)} 个片段")
+        timings = {'segments': time.perf_counter() - begin}
+
+        keyframes = None
+        if snap_to_keyframes:
+            seek_index = self.seek_index_cache.get(video_path)
+            keyframes = seek_index.keyframes if seek_index is not None else None
+
+        begin = time.perf_counter()
+        splitter = StreamCopySplitter(container, snap_to_keyframes, logger=self.log)
+        outputs = splitter.split(video_path, output_dir, start_time, segments, keyframes,
+                                 cancel_token=self.cancel_token)
+        timings['stream_copy'] = time.perf_counter() - begin
+
+        self.report('segments', video=video_path, done=len(segments), total=len(segments))
+        self._report_timings(video_path, timings)
+        self.log(f"视频 {video_name} 处理完成，输出 {len(outputs)} 个片段")
+
+    def _report_timings(self, video_path, timings):
+        """输出并报告视频各阶段的耗时"""
+        self.log("各阶段耗时: " + ", ".join(f"{name} {elapsed:.2f}秒" for name, elapsed in timings.items()))
+        self.report('timings', video=video_path, timings=timings)
+
+    def crop_frame(self, frame, selected_region):
+        """裁剪帧到选择区域"""
+        return crop_frame(frame, selected_region)
+
+    def read_segment_frames(self, decoder, start, end, fps, selected_region=None, transform=None):
+        """按输出帧率读取 [start, end) 区间的帧，并应用区域裁剪和帧变换
+
+        Yields:
+            RGB帧
+        """
+        for _, frame in decoder.iter_frames(start, end, fps):
+            frame = self.crop_frame(frame, selected_region)
+            if transform is not None:
+                frame = transform(frame)
+            yield frame
+
+    def use_ffmpeg_backend(self, encoder_backend, output_format, target_size=None):
+        """判断是否使用ffmpeg滤镜图后端生成GIF"""
+        if encoder_backend == 'python':
+            return False
+
+        if encoder_backend not in self.ENCODER_BACKENDS:
+            raise ValueError(f"不支持的生成后端: {encoder_backend}")
+
+        supported = output_format.name == 'gif' and not target_size
+        available = self.ffmpeg_backend.is_available()
+        if encoder_backend == 'ffmpeg' and not (supported and available):
+            reason = "未找到ffmpeg" if not available else "仅支持不限制大小的GIF输出"
+            self.log(f"ffmpeg后端不可用（{reason}），改用Python处理")
+        return supported and available
+
+    def convert_video_to_gif(self, video_path, output_path, start_time=0,
+                             split_duration=None, split_count=None, selected_region=None,
+                             scene_detector=None, target_size=None, output_format='gif',
+                             decoder_backend='auto', encoder_backend='auto', encode_workers=1,
+                             spool_threshold=None, spool_dir=None, segments=None, renditions=None,
+                             dither=None):
+        """将单个视频转换为GIF
+
+        Args:
+            video_path: 视频路径
+            output_path: 输出GIF路径
+            start_time: 开始时间（秒）
+            split_duration: 分割时长（秒），与split_count互斥
+            split_count: 分割数量，与split_duration互斥
+            selected_region: 选择的区域(x, y, width, height)，如果为None则转换整个视频
+            scene_detector: 场景检测器SceneDetector，指定时按场景切换分割
+            target_size: 每个GIF的目标大小上限（字节），指定时先抽样估算再选择编码参数
+            output_format: 动图格式名称(gif, webp, apng)或OutputFormat对象
+            decoder_backend: 解码器名称(opencv, pyav, ffmpeg)，auto时按文件自动选择
+            encoder_backend: GIF生成后端，python, ffmpeg 或 auto（可用时使用ffmpeg）
+            encode_workers: Python后端下的编码进程数，大于1时片段在多个进程中并行编码
+            spool_threshold: 时长不短于该值（秒）的片段把帧缓存到磁盘
+            spool_dir: 帧缓存文件所在目录
+            segments: 已计算好的 (片段索引, 开始时间, 结束时间) 列表，指定时只处理这些片段，
+                不再按分割参数计算
+            renditions: 多个输出规格，指定时每帧只解码一次，分别写入各规格的子目录，
+                忽略output_format和target_size
+            dither: GIF的抖动方式(none, bayer)，output_format为格式名称或规格未指定时使用，为None时未指定
+        """
+        if isinstance(output_format, str):
+            output_format = get_output_format(output_format, dither=dither)
+        if renditions:
+            renditions = build_renditions(renditions, self.GIF_FPS, dither)
+
+        video_name = os.path.splitext(os.path.basename(video_path))[0]
+        output_dir = os.path.join(output_path, video_name)
+        if not renditions:
+            os.makedirs(output_dir, exist_ok=True)
+
+        # 检查开始时间是否有效
+        duration = self.probe_video(video_path, decoder_backend)['duration']
+        if start_time >= duration:
+            self.log(f"警告: 开始时间 {start_time}秒 超过视频时长 {duration}秒，将不处理此视频")
+            return
+
+        # 根据分割方式计算片段
+        if segments is None:
+            segments = self.build_segments(video_path, start_time, duration - start_time,
+                                           split_duration, split_count, scene_detector, decoder_backend)
+
         self.log(f"视频 {video_name} 将分割为 {len(segments)} 个片段")
+        self.report('segments', video=video_path, done=0, total=len(segments))
+
+        if renditions:
+            if target_size:
+                self.log("警告: 多规格输出时不支持目标大小，将使用各规格指定的参数")
+            if encode_workers > 1:
+                self.log("多规格输出在单个进程中编码，忽略编码进程数")
+            for rendition in renditions:
+                os.makedirs(rendition.output_dir(output_path, video_name), exist_ok=True)
+            self.convert_renditions(video_path, output_path, video_name, start_time, segments,
+                                    renditions, selected_region, decoder_backend,
+                                    spool_threshold, spool_dir)
+            self.log(f"视频 {video_name} 处理完成，输出 {len(renditions)} 种规格")
+            return
 
-        # 处理每个片段
-        for segment_index, seg_start, seg_end in segments:
-            self.log(f"处理片段 {segment_index + 1}/{len(segments)}: {seg_start:.1f}秒 - {seg_end:.1f}秒")
+        if self.use_ffmpeg_backend(encoder_backend, output_format, target_size):
+            try:
+                begin = time.perf_counter()
+                self.ffmpeg_backend.convert(video_path, output_dir, start_time, segments,
+                                            self.GIF_FPS, output_format, selected_region,
+                                            cancel_token=self.cancel_token)
+                self.report('segments', video=video_path, done=len(segments), total=len(segments))
+                self._report_timings(video_path, {'ffmpeg': time.perf_counter() - begin})
+                self.log(f"视频 {video_name} 处理完成")
+                return
+            except ProcessingCancelled:
+                raise
+            except Exception as e:
+                self.log(f"ffmpeg后端处理失败，改用Python处理: {str(e)}")
 
-            # 创建子片段
-            subclip = clip.subclip(seg_start, seg_end)
+        self.convert_segments(video_path, output_dir, start_time, segments, selected_region,
+                              target_size, output_format, decoder_backend, encode_workers,
+                              spool_threshold, spool_dir)
+        self.log(f"视频 {video_name} 处理完成")
 
-            # 输出GIF文件路径
-            gif_path = os.path.join(output_dir, f"{segment_index + 1}.gif")
+    def convert_segments(self, video_path, output_dir, start_time, segments, selected_region=None,
+                         target_size=None, output_format=None, decoder_backend='auto',
+                         encode_workers=1, spool_threshold=None, spool_dir=None):
+        """通过解码器逐帧处理并写出所有片段
 
-            # 转换为GIF
-            self.log(f"生成GIF: {gif_path}")
-            subclip.write_gif(gif_path, fps=10)  # 使用较低的fps以减小文件大小
+        解码、变换（裁剪、缩放、去重、量化）和写出分别在流水线的不同线程中执行；
+        encode_workers大于1时，帧经共享内存交给多个编码进程，片段并行编码。
+        较长的片段可以把变换后的帧缓存到磁盘文件，写出时再逐帧读出并流式编码，
+        片段完成后自动删除缓存。
 
-            self.log(f"片段 {segment_index + 1} 处理完成")
+        Args:
+            video_path: 视频路径
+            output_dir: 输出目录
+            start_time: 开始时间（秒），片段时间相对于它
+            segments: (片段索引, 开始时间, 结束时间) 列表
+            selected_region: 选择的区域(x, y, width, height)
+            target_size: 每个片段的目标大小上限（字节）
+            output_format: 输出格式OutputFormat
+            decoder_backend: 解码器名称，auto时按文件自动选择
+            encode_workers: 编码进程数
+            spool_threshold: 时长不短于该值（秒）的片段把帧缓存到磁盘，为None时不缓存
+            spool_dir: 帧缓存文件所在目录，为None时使用系统临时目录
+        """
+        # 用关键帧索引决定每次跳转是直接向后解码还是跳到最近的关键帧
+        seek_index = self.seek_index_cache.get(video_path)
+        decoder = self.decoder_selector.open(video_path, decoder_backend, seek_index)
+        try:
+            plan = self.plan_segment_settings(decoder, start_time, segments, selected_region,
+                                              target_size, output_format)
+
+            def spool_capacity(segment_start, segment_end, fps):
+                return self.spool_capacity(segment_start, segment_end, fps, spool_threshold)
+
+            if encode_workers > 1 and len(plan) > 1:
+                encoder = ParallelSegmentEncoder(min(encode_workers, len(plan)), logger=self.log)
+                encoder.encode(decoder, plan, output_dir, output_format,
+                               crop=lambda frame: self.crop_frame(frame, selected_region),
+                               spool_capacity=spool_capacity, spool_dir=spool_dir,
+                               cancel_token=self.cancel_token,
+                               on_segment_done=lambda done: self.report(
+                                   'segments', video=video_path, done=done, total=len(plan)))
+                return
+
+            def decode():
+                for segment_index, segment_start, segment_end, settings in plan:
+                    capacity = spool_capacity(segment_start, segment_end, settings.fps)
+                    yield 'begin', segment_index, (settings, capacity)
+                    for _, frame in decoder.iter_frames(segment_start, segment_end, settings.fps):
+                        self.cancel_token.check()
+                        yield 'frame', segment_index, frame
+                    yield 'end', segment_index, None
+
+            transform_state = {}
+
+            def transform(item):
+                kind, segment_index, payload = item
+                if kind == 'begin':
+                    transform_state['settings'], capacity = payload
+                    transform_state['spooled'] = capacity is not None
+                    transform_state['previous'] = None
+                    return item
+                if kind == 'end':
+                    return item
+
+                settings = transform_state['settings']
+                frame = self.crop_frame(payload, selected_region)
+                if not settings.is_default():
+                    frame = settings.apply(frame)
+
+                # 与上一帧相同时不再量化，由写出阶段延长上一帧的显示时间
+                previous = transform_state['previous']
+                if previous is not None and np.array_equal(previous, frame):
+                    return 'repeat', segment_index, None
+                transform_state['previous'] = frame
+                # 缓存到磁盘的片段在写出时才转换
+                if transform_state['spooled']:
+                    return 'raw', segment_index, frame
+                return 'frame', segment_index, output_format.prepare_frame(frame)
+
+            writer_state = {}
+
+            def write(item):
+                kind, segment_index, payload = item
+                if kind == 'begin':
+                    gif_path = output_format.output_path(output_dir, segment_index)
+                    self.log(f"生成{output_format.name.upper()}: {gif_path}")
+                    settings, capacity = payload
+                    if capacity is not None:
+                        self.log(f"片段 {segment_index + 1} 的帧缓存到磁盘")
+                    writer_state['path'] = gif_path
+                    writer_state['writer'] = output_format.create_writer(gif_path, settings.fps,
+                                                                         capacity, spool_dir)
+                elif kind == 'raw':
+                    writer_state['writer'].add_frame(payload)
+                elif kind == 'frame':
+                    writer_state['writer'].add_prepared_frame(payload)
+                elif kind == 'repeat':
+                    writer_state['writer'].repeat_last_frame()
+                else:
+                    writer = writer_state.pop('writer')
+                    writer.close()
+                    if target_size:
+                        self.log(f"实际大小 {os.path.getsize(writer_state['path']) / 1024:.0f}KB")
+                    self.log(f"片段 {segment_index + 1} 处理完成")
+                    writer_state['done'] = writer_state.get('done', 0) + 1
+                    self.report('segments', video=video_path, done=writer_state['done'], total=len(plan))
+
+            executor = PipelineExecutor(queue_size=self.PIPELINE_QUEUE_SIZE)
+            try:
+                timings = executor.run(decode(), [('transform', transform)], write)
+            except Exception:
+                # 删除未写完的片段
+                if 'writer' in writer_state:
+                    writer_state['writer'].abort()
+                raise
+
+            self._report_timings(video_path, timings)
+        finally:
+            # 关闭视频
+            decoder.close()
+
+    def convert_renditions(self, video_path, output_path, video_name, start_time, segments,
+                           renditions, selected_region=None, decoder_backend='auto',
+                           spool_threshold=None, spool_dir=None):
+        """一次解码写出多个规格的片段
+
+        解码阶段按原始帧率读取每一帧，变换阶段对每帧只裁剪一次，再按各规格的帧率
+        取样、缩放减色、去重和量化，写出阶段把结果交给各规格的写入器。
 
-        # 关闭视频
-        clip.close()
-        self.log(f"视频 {video_name} 处理完成")
\ No newline at end of file
+        Args:
+            video_path: 视频路径
+            output_path: 输出路径，各规格写入 输出路径/规格名称/视频名称/
+            video_name: 视频名称
+            start_time: 开始时间（秒），片段时间相对于它
+            segments: (片段索引, 开始时间, 结束时间) 列表
+            renditions: Rendition列表
+            selected_region: 选择的区域(x, y, width, height)
+            decoder_backend: 解码器名称，auto时按文件自动选择
+            spool_threshold: 时长不短于该值（秒）的片段把帧缓存到磁盘，为None时不缓存
+            spool_dir: 帧缓存文件所在目录，为None时使用系统临时目录
+        """
+        seek_index = self.seek_index_cache.get(video_path)
+        decoder = self.decoder_selector.open(video_path, decoder_backend, seek_index)
+        try:
+            def decode():
+                for segment_index, seg_start, seg_end in segments:
+                    segment_start = start_time + seg_start
+                    segment_end = start_time + seg_end
+                    yield 'begin', segment_index, (segment_start, segment_end)
+                    for item in decoder.iter_frames(segment_start, segment_end):
+                        self.cancel_token.check()
+                        yield 'frame', segment_index, item
+                    yield 'end', segment_index, None
+
+            transform_state = {}
+
+            def sample(rendition_index, frames):
+                # 返回 (规格序号, 类型, 数据) 列表
+                rendition = renditions[rendition_index]
+                state = transform_state['renditions'][rendition_index]
+                output = []
+                for source in frames:
+                    # 取样重复使用同一原始帧时直接延长上一帧
+                    if source is state['source']:
+                        output.append((rendition_index, 'repeat', None))
+                        continue
+                    state['source'] = source
+                    frame = transform_state['cropped'].get(id(source))
+                    if frame is None:
+                        frame = self.crop_frame(source, selected_region)
+                        transform_state['cropped'][id(source)] = frame
+                    if not rendition.settings.is_default():
+                        frame = rendition.settings.apply(frame)
+
+                    if state['previous'] is not None and np.array_equal(state['previous'], frame):
+                        output.append((rendition_index, 'repeat', None))
+                        continue
+                    state['previous'] = frame
+                    if state['spooled']:
+                        output.append((rendition_index, 'raw', frame))
+                    else:
+                        output.append((rendition_index, 'frame', rendition.output_format.prepare_frame(frame)))
+                return output
+
+            def transform(item):
+                kind, segment_index, payload = item
+                if kind == 'begin':
+                    segment_start, segment_end = payload
+                    transform_state['renditions'] = []
+                    capacities = []
+                    for rendition in renditions:
+                        capacity = self.spool_capacity(segment_start, segment_end, rendition.fps,
+                                                       spool_threshold)
+                        capacities.append(capacity)
+                        transform_state['renditions'].append({
+                            'sampler': RenditionSampler(segment_start, segment_end, rendition.fps),
+                            'spooled': capacity is not None,
+                            'source': None,
+                            'previous': None,
+                        })
+                    return kind, segment_index, capacities
+
+                # 同一原始帧被多个规格使用时只裁剪一次
+                transform_state['cropped'] = {}
+                actions = []
+                for rendition_index, state in enumerate(transform_state['renditions']):
+                    if kind == 'frame':
+                        frames = state['sampler'].feed(*payload)
+                    else:
+                        frames = state['sampler'].finish()
+                    actions.extend(sample(rendition_index, frames))
+                transform_state['cropped'] = {}
+                return kind, segment_index, actions
+
+            writer_state = {'writers': {}, 'done': 0}
+
+            def write(item):
+                kind, segment_index, payload = item
+                writers = writer_state['writers']
+                if kind == 'begin':
+                    for rendition_index, rendition in enumerate(renditions):
+                        output_dir = rendition.output_dir(output_path, video_name)
+                        gif_path = rendition.output_format.output_path(output_dir, segment_index)
+                        self.log(f"生成{rendition.output_format.name.upper()}: {gif_path}")
+                        writers[rendition_index] = rendition.output_format.create_writer(
+                            gif_path, rendition.fps, payload[rendition_index], spool_dir)
+                    return
+
+                for rendition_index, action, data in payload:
+                    writer = writers[rendition_index]
+                    if action == 'raw':
+                        writer.add_frame(data)
+                    elif action == 'frame':
+                        writer.add_prepared_frame(data)
+                    else:
+                        writer.repeat_last_frame()
+
+                if kind == 'end':
+                    while writers:
+                        writers.pop(min(writers)).close()
+                    self.log(f"片段 {segment_index + 1} 处理完成")
+                    writer_state['done'] += 1
+                    self.report('segments', video=video_path, done=writer_state['done'], total=len(segments))
+
+            executor = PipelineExecutor(queue_size=self.PIPELINE_QUEUE_SIZE)
+            try:
+                timings = executor.run(decode(), [('transform', transform)], write)
+            except Exception:
+                # 删除未写完的片段
+                for writer in writer_state['writers'].values():
+                    writer.abort()
+                raise
+
+            self._report_timings(video_path, timings)
+        finally:
+            decoder.close()
+
+    def spool_capacity(self, segment_start, segment_end, fps, spool_threshold):
+        """片段帧缓存的容量（帧数），不需要缓存到磁盘时返回None"""
+        if spool_threshold is None or segment_end - segment_start < spool_threshold:
+            return None
+        return math.ceil((segment_end - segment_start) * fps) + 1
+
+    def plan_segment_settings(self, decoder, start_time, segments, selected_region=None,
+                              target_size=None, output_format=None):
+        """确定每个片段的编码参数
+
+        Returns:
+            (片段索引, 绝对开始时间, 绝对结束时间, GifSettings) 列表
+        """
+        plan = []
+        for segment_index, seg_start, seg_end in segments:
+            self.cancel_token.check()
+            segment_start = start_time + seg_start
+            segment_end = start_time + seg_end
+
+            settings = GifSettings(fps=self.GIF_FPS)
+            if target_size:
+                def read_window(offset, count, fps):
+                    window_start = segment_start + offset
+                    window_end = min(window_start + count / fps, segment_end)
+                    return list(self.read_segment_frames(decoder, window_start, window_end,
+                                                         fps, selected_region))
+
+                # 抽样试编码，选出满足大小限制的参数后只做一次完整编码
+                settings, estimated = self.size_estimator.choose_settings(
+                    read_window, seg_end - seg_start, target_size, output_format)
+                self.log(f"片段 {segment_index + 1} 目标大小 {target_size / 1024:.0f}KB，"
+                         f"选择参数 {settings}，预计 {estimated / 1024:.0f}KB")
+                if estimated > target_size:
+                    self.log(f"警告: 片段 {segment_index + 1} 使用最低画质参数仍可能超过目标大小")
+
+            plan.append((segment_index, segment_start, segment_end, settings))
+        return plan
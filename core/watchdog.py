@@ -0,0 +1,185 @@
+import os
+import time
+import queue
+import signal
+import multiprocessing
+
+from core.cancellation import CancelToken, ProcessingCancelled
+
+
+def run_isolated_video(messages, video_path, output_path, options, cancel_token=None):
+    """子进程入口，处理单个视频并把日志、进度和结果发回父进程
+
+    Args:
+        messages: 消息队列，消息为 ('log', 文本), ('progress', 事件字典), ('result', 是否成功, 错误信息)
+            或 ('cancelled',)
+        video_path: 视频路径
+        output_path: 输出路径
+        options: VideoProcessor.convert_video的其它参数
+        cancel_token: 与父进程共享的CancelToken
+    """
+    # 自成进程组，超时时连同编码子进程和ffmpeg一起结束
+    if hasattr(os, 'setpgrp'):
+        os.setpgrp()
+
+    from core.video_processor import VideoProcessor
+
+    processor = VideoProcessor()
+    processor.set_logger_callback(lambda message: messages.put(('log', message)))
+    processor.set_progress_callback(lambda event: messages.put(('progress', event)))
+    if cancel_token is not None:
+        processor.set_cancel_token(cancel_token)
+    try:
+        processor.convert_video(video_path, output_path, **options)
+        messages.put(('result', True, None))
+    except ProcessingCancelled:
+        messages.put(('cancelled',))
+    except Exception as e:
+        messages.put(('result', False, f"{type(e).__name__}: {e}"))
+
+
+class VideoWatchdog:
+    """在可结束的子进程中处理视频
+
+    每个视频在独立进程中处理，超过整体时限或长时间没有完成新片段时结束该进程，
+    失败后按指数退避重试，重试次数用完的视频记入隔离列表。暂停和取消转发给子进程，
+    暂停的时间不计入时限；取消时子进程删除未写完的输出后退出，超过KILL_WAIT仍未退出则强制结束。
+    """
+
+    # 等待子进程消息的间隔（秒）
+    POLL_INTERVAL = 0.5
+    # 结束子进程后等待其退出的时间（秒）
+    KILL_WAIT = 5.0
+
+    def __init__(self, video_timeout=None, segment_timeout=None, retries=0, retry_backoff=2.0,
+                 logger=None, progress=None, cancel_token=None):
+        """初始化看门狗
+
+        Args:
+            video_timeout: 单个视频一次尝试的时限（秒），为None时不限制
+            segment_timeout: 两个片段完成之间的最长间隔（秒），为None时不限制
+            retries: 失败后的重试次数
+            retry_backoff: 第一次重试前的等待时间（秒），之后每次加倍
+            logger: 日志函数
+            progress: 进度回调，接收子进程报告的事件字典
+            cancel_token: CancelToken，为None时不能暂停和取消
+        """
+        self.video_timeout = video_timeout
+        self.segment_timeout = segment_timeout
+        self.retries = max(0, retries)
+        self.retry_backoff = retry_backoff
+        self.logger = logger
+        self.progress = progress
+        self.cancel_token = cancel_token if cancel_token is not None else CancelToken()
+
+    def log(self, message):
+        """输出日志"""
+        if self.logger:
+            self.logger(message)
+
+    def _kill(self, process):
+        if process.pid is not None and hasattr(os, 'killpg'):
+            try:
+                os.killpg(process.pid, signal.SIGKILL)
+            except (ProcessLookupError, PermissionError):
+                pass
+        if process.is_alive():
+            process.kill()
+        process.join(self.KILL_WAIT)
+
+    def _join(self, process):
+        """子进程发回结果后等待其退出，超过KILL_WAIT仍未退出时由_attempt的finally强制结束"""
+        process.join(self.KILL_WAIT)
+        if process.is_alive():
+            self.log(f"处理进程 {process.pid} 发回结果后 {self.KILL_WAIT} 秒仍未退出，强制结束")
+
+    def _attempt(self, video_path, output_path, options):
+        """在子进程中处理一次
+
+        Returns:
+            (是否成功, 错误信息)
+        """
+        context = multiprocessing.get_context('spawn')
+        messages = context.Queue()
+        child_token = CancelToken.for_process(context)
+        process = context.Process(target=run_isolated_video,
+                                  args=(messages, video_path, output_path, options, child_token))
+        process.start()
+
+        started = last_progress = previous = time.monotonic()
+        cancel_deadline = None
+        try:
+            while True:
+                self.cancel_token.copy_state_to(child_token)
+                try:
+                    message = messages.get(timeout=self.POLL_INTERVAL)
+                except queue.Empty:
+                    message = None
+
+                now = time.monotonic()
+                if self.cancel_token.paused:
+                    # 暂停的时间不计入时限
+                    started += now - previous
+                    last_progress += now - previous
+                previous = now
+
+                if message is not None:
+                    kind = message[0]
+                    if kind == 'log':
+                        self.log(message[1])
+                    elif kind == 'progress':
+                        if message[1]['event'] == 'segments':
+                            last_progress = time.monotonic()
+                        if self.progress:
+                            self.progress(message[1])
+                    elif kind == 'cancelled':
+                        self._join(process)
+                        raise ProcessingCancelled("处理已取消")
+                    else:
+                        self._join(process)
+                        return message[1], message[2]
+                    continue
+
+                if self.cancel_token.cancelled:
+                    # 等子进程清理未写完的输出，超时后由finally强制结束
+                    if cancel_deadline is None:
+                        cancel_deadline = now + self.KILL_WAIT
+                    if now > cancel_deadline or not process.is_alive():
+                        raise ProcessingCancelled("处理已取消")
+                    continue
+                if self.video_timeout is not None and now - started > self.video_timeout:
+                    return False, f"处理超时（超过 {self.video_timeout} 秒）"
+                if self.segment_timeout is not None and now - last_progress > self.segment_timeout:
+                    return False, f"片段处理超时（{self.segment_timeout} 秒内没有完成新片段）"
+                if not process.is_alive():
+                    return False, f"处理进程异常退出，退出码 {process.exitcode}"
+        finally:
+            # 子进程已退出时也结束其进程组，清理残留的ffmpeg等编码进程
+            self._kill(process)
+            messages.close()
+
+    def run(self, video_path, output_path, options):
+        """处理单个视频，失败时重试
+
+        Args:
+            video_path: 视频路径
+            output_path: 输出路径
+            options: VideoProcessor.convert_video的其它参数
+
+        Returns:
+            (是否成功, 最后一次的错误信息, 尝试次数)，取消时抛出ProcessingCancelled
+        """
+        name = os.path.basename(video_path)
+        error = None
+        for attempt in range(1, self.retries + 2):
+            if attempt > 1:
+                delay = self.retry_backoff * 2 ** (attempt - 2)
+                self.log(f"{name} 将在 {delay:.0f} 秒后第 {attempt - 1} 次重试")
+                self.cancel_token.sleep(delay)
+            self.cancel_token.check()
+
+            success, error = self._attempt(video_path, output_path, options)
+            if success:
+                return True, None, attempt
+            self.log(f"{name} 第 {attempt} 次处理失败: {error}")
+        return False, error, self.retries + 1
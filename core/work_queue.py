@@ -0,0 +1,469 @@
+import os
+import re
+import json
+import time
+import uuid
+import socket
+import inspect
+import threading
+
+from core.file_manager import FileManager
+from core.job_manager import JobManager
+from core.video_processor import VideoProcessor
+from core.cancellation import ProcessingCancelled
+
+
+class WorkQueue:
+    """共享文件系统上的工作队列
+
+    目录结构:
+        items/<编号>.json            工作项，一个视频或一个视频的部分片段
+        leases/<编号>/<代数>.lease     租约文件，每次领取用O_EXCL原子创建下一代，持有者定期更新修改时间
+        leases/<编号>/<代数>.released  持有者释放该代租约的标记
+        attempts/<编号>              每次领取追加一行，用于限制重试次数
+        done/<编号>.json             处理结果
+
+    最新一代租约的修改时间超过lease_seconds未更新时视为持有者已崩溃，其它节点创建
+    下一代租约即可回收，同一代只有一个节点能创建成功。领取和回收只创建新文件，不需要
+    改名或硬链接，SMB等不支持硬链接的共享存储上同样可用。代数即防护令牌：出现更新的
+    一代后，旧持有者续租失败、停止处理且不再写入结果。旧的各代租约文件都保留，已用过的
+    代数不能再被创建。各节点的时钟需要大致同步，
+    lease_seconds应远大于时钟误差。
+    """
+
+    DEFAULT_LEASE_SECONDS = 300
+    DEFAULT_MAX_ATTEMPTS = 3
+
+    def __init__(self, queue_dir, lease_seconds=None, logger=None):
+        """初始化队列
+
+        Args:
+            queue_dir: 队列目录，所有节点挂载的同一路径
+            lease_seconds: 租约有效期（秒）
+            logger: 日志函数
+        """
+        self.queue_dir = queue_dir
+        self.lease_seconds = lease_seconds or self.DEFAULT_LEASE_SECONDS
+        self.logger = logger
+        for name in ('items', 'leases', 'attempts', 'done'):
+            FileManager.ensure_directory(os.path.join(queue_dir, name))
+
+    def log(self, message):
+        """输出日志"""
+        if self.logger:
+            self.logger(message)
+
+    def _path(self, kind, item_id):
+        suffix = {'items': '.json', 'attempts': '', 'done': '.json'}[kind]
+        return os.path.join(self.queue_dir, kind, f"{item_id}{suffix}")
+
+    @staticmethod
+    def _write_json(path, data):
+        """先写临时文件再改名，读取者不会看到写了一半的文件"""
+        temp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, indent=1)
+        os.replace(temp_path, path)
+
+    @staticmethod
+    def _read_json(path):
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def enqueue(self, params, segments_per_item=None, processor=None):
+        """把一次process_videos调用拆分为工作项写入队列
+
+        Args:
+            params: process_videos参数字典（JSON形式，与HTTP服务相同）
+            segments_per_item: 为None时每个视频一个工作项，否则每个工作项最多包含这么多片段，
+                仅支持gif模式
+            processor: 用于列出视频和计算片段的VideoProcessor
+
+        Returns:
+            工作项编号列表
+        """
+        options = JobManager.build_options(params)
+        processor = processor or VideoProcessor()
+        if segments_per_item and options.get('output_mode', 'gif') != 'gif':
+            raise ValueError("按片段拆分只支持gif模式")
+        # 按片段拆分的工作项不经过process_videos，时限和重试由队列的租约和重试次数代替
+        if segments_per_item and (options.get('video_timeout') is not None
+                                  or options.get('segment_timeout') is not None or options.get('retries')):
+            raise ValueError("按片段拆分时不支持 video_timeout, segment_timeout 和 retries，"
+                             f"失败的工作项由队列重新领取，最多 {self.DEFAULT_MAX_ATTEMPTS} 次")
+        # 工作项分别在各节点处理，同一个归档不能由多个工作项写入
+        archive = options.get('archive', 'none')
+        if archive == 'run' or (segments_per_item and archive != 'none'):
+            raise ValueError("分布式模式只支持按视频打包，且不能按片段拆分")
+
+        videos = options.get('video_files') or processor.get_video_files(options['input_path'])
+        item_params = {name: value for name, value in params.items() if name != 'video_files'}
+        run_id = f"{time.strftime('%Y%m%d%H%M%S')}-{uuid.uuid4().hex[:6]}"
+        start_time = options.get('start_time', 0)
+
+        item_ids = []
+        for video_index, video_path in enumerate(videos):
+            video_name = re.sub(r'[^\w.-]', '_', os.path.splitext(os.path.basename(video_path))[0])
+            chunks = [None]
+            if segments_per_item:
+                decoder_backend = options.get('decoder_backend', 'auto')
+                duration = processor.probe_video(video_path, decoder_backend)['duration']
+                if start_time >= duration:
+                    processor.log(f"警告: 开始时间超过视频时长，跳过 {os.path.basename(video_path)}")
+                    continue
+                segments = processor.build_segments(video_path, start_time, duration - start_time,
+                                                    options.get('split_duration'),
+                                                    options.get('split_count'),
+                                                    options.get('scene_detector'), decoder_backend)
+                chunks = [segments[i:i + segments_per_item]
+                          for i in range(0, len(segments), segments_per_item)]
+
+            for chunk_index, chunk in enumerate(chunks):
+                item_id = f"{run_id}_{video_index:05d}_{chunk_index:04d}_{video_name}"
+                self._write_json(self._path('items', item_id), {
+                    'id': item_id,
+                    'video_path': os.path.abspath(video_path),
+                    'segments': chunk,
+                    'params': item_params,
+                    'max_attempts': self.DEFAULT_MAX_ATTEMPTS,
+                })
+                item_ids.append(item_id)
+
+        self.log(f"已写入 {len(item_ids)} 个工作项: {self.queue_dir}")
+        return item_ids
+
+    def item_ids(self):
+        """队列中所有工作项编号，按写入顺序排序"""
+        names = os.listdir(os.path.join(self.queue_dir, 'items'))
+        return sorted(name[:-5] for name in names if name.endswith('.json'))
+
+    def is_done(self, item_id):
+        return os.path.exists(self._path('done', item_id))
+
+    def read_item(self, item_id):
+        return self._read_json(self._path('items', item_id))
+
+    def read_result(self, item_id):
+        return self._read_json(self._path('done', item_id))
+
+    def _lease_dir(self, item_id):
+        return os.path.join(self.queue_dir, 'leases', item_id)
+
+    def _lease_path(self, item_id, generation, suffix='.lease'):
+        return os.path.join(self._lease_dir(item_id), f"{generation:08d}{suffix}")
+
+    def _lease_generations(self, item_id):
+        """工作项的租约代数
+
+        Returns:
+            (所有租约代数升序列表, 已释放的代数集合)
+        """
+        try:
+            names = os.listdir(self._lease_dir(item_id))
+        except FileNotFoundError:
+            return [], set()
+
+        generations = []
+        released = set()
+        for name in names:
+            stem, suffix = os.path.splitext(name)
+            if not stem.isdigit():
+                continue
+            if suffix == '.lease':
+                generations.append(int(stem))
+            elif suffix == '.released':
+                released.add(int(stem))
+        return sorted(generations), released
+
+    def _lease_age(self, lease_path):
+        try:
+            return time.time() - os.stat(lease_path).st_mtime
+        except FileNotFoundError:
+            return None
+
+    def _active_generation(self, item_id):
+        """最新一代租约仍被持有且未过期时返回其代数，否则返回None"""
+        generations, released = self._lease_generations(item_id)
+        if not generations or generations[-1] in released:
+            return None
+        age = self._lease_age(self._lease_path(item_id, generations[-1]))
+        return generations[-1] if age is not None and age < self.lease_seconds else None
+
+    @staticmethod
+    def _token_generation(token):
+        return int(token.split('-', 1)[0])
+
+    def try_claim(self, item_id, worker_id):
+        """尝试领取工作项
+
+        Returns:
+            租约令牌，未领取到时返回None
+        """
+        if self.is_done(item_id):
+            return None
+
+        generations, released = self._lease_generations(item_id)
+        latest = generations[-1] if generations else 0
+        expired = bool(latest) and latest not in released
+        if expired:
+            age = self._lease_age(self._lease_path(item_id, latest))
+            if age is not None and age < self.lease_seconds:
+                return None
+
+        # 只有一个节点能创建下一代租约，创建失败说明已被其它节点领取
+        generation = latest + 1
+        FileManager.ensure_directory(self._lease_dir(item_id))
+        try:
+            fd = os.open(self._lease_path(item_id, generation), os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644)
+        except FileExistsError:
+            return None
+
+        token = f"{generation:08d}-{uuid.uuid4().hex}"
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump({'worker': worker_id, 'token': token, 'claimed_at': time.time()}, f)
+
+        # 之前各代的租约文件保留为墓碑，过时的节点不能再创建已被使用过的代数；
+        # 读取代数列表后其它节点可能已领取了更新的一代，这时新建的一代已被取代，放弃领取
+        if not self.holds_lease(item_id, token):
+            return None
+        if expired:
+            self.log(f"工作项 {item_id} 的租约已过期，重新处理")
+
+        # 创建租约前工作项可能刚被其它节点完成
+        if self.is_done(item_id):
+            self.release(item_id, token)
+            return None
+
+        with open(self._path('attempts', item_id), 'a', encoding='utf-8') as f:
+            f.write(f"{worker_id} {time.time()}\n")
+        return token
+
+    def attempts(self, item_id):
+        """工作项已被领取的次数"""
+        try:
+            with open(self._path('attempts', item_id), 'r', encoding='utf-8') as f:
+                return sum(1 for _ in f)
+        except FileNotFoundError:
+            return 0
+
+    def holds_lease(self, item_id, token):
+        """租约是否仍属于token的持有者：自己的一代未释放，且没有更新的一代"""
+        generation = self._token_generation(token)
+        generations, released = self._lease_generations(item_id)
+        if not generations or generations[-1] != generation or generation in released:
+            return False
+        try:
+            return self._read_json(self._lease_path(item_id, generation)).get('token') == token
+        except (OSError, ValueError):
+            return False
+
+    def renew(self, item_id, token):
+        """更新租约的修改时间
+
+        Returns:
+            租约是否仍属于自己
+        """
+        if not self.holds_lease(item_id, token):
+            return False
+        try:
+            os.utime(self._lease_path(item_id, self._token_generation(token)))
+        except FileNotFoundError:
+            return False
+        return True
+
+    def release(self, item_id, token):
+        """释放自己持有的租约，保留租约文件使下一次领取创建更新的一代"""
+        if self.holds_lease(item_id, token):
+            path = self._lease_path(item_id, self._token_generation(token), '.released')
+            with open(path, 'w', encoding='utf-8'):
+                pass
+
+    def complete(self, item_id, token, result):
+        """仍持有租约时写入结果并释放租约
+
+        Returns:
+            是否写入了结果，租约已被回收时不写入
+        """
+        if not self.holds_lease(item_id, token):
+            self.log(f"工作项 {item_id} 的租约已被回收，不写入结果")
+            return False
+        self._write_json(self._path('done', item_id), result)
+        self.release(item_id, token)
+        return True
+
+    def status(self):
+        """队列状态统计
+
+        Returns:
+            {'total', 'done', 'failed', 'leased', 'pending'}
+        """
+        counts = {'total': 0, 'done': 0, 'failed': 0, 'leased': 0, 'pending': 0}
+        for item_id in self.item_ids():
+            counts['total'] += 1
+            if self.is_done(item_id):
+                try:
+                    success = self.read_result(item_id).get('success')
+                except (OSError, ValueError):
+                    success = False
+                counts['done' if success else 'failed'] += 1
+            else:
+                counts['leased' if self._active_generation(item_id) is not None else 'pending'] += 1
+        return counts
+
+
+class QueueWorker:
+    """工作队列的处理节点
+
+    反复领取工作项并用VideoProcessor处理，处理期间后台线程定期续租，
+    结果按通常的 output_path/<视频名>/ 结构写出。续租时发现租约已被回收则取消处理，
+    未写完的输出被删除，也不写入结果或释放租约。
+    """
+
+    def __init__(self, work_queue, worker_id=None, poll_interval=5.0, logger=None):
+        """初始化处理节点
+
+        Args:
+            work_queue: WorkQueue
+            worker_id: 节点标识，默认为 主机名-进程号
+            poll_interval: 没有可领取的工作项时的等待间隔（秒）
+            logger: 日志函数
+        """
+        self.queue = work_queue
+        self.worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}"
+        self.poll_interval = poll_interval
+        self.logger = logger
+        self._stop = threading.Event()
+
+    def log(self, message):
+        """输出日志"""
+        if self.logger:
+            self.logger(f"[{self.worker_id}] {message}")
+
+    def stop(self):
+        """处理完当前工作项后停止"""
+        self._stop.set()
+
+    def _keep_alive(self, item_id, token, finished, cancel_token):
+        while not finished.wait(self.queue.lease_seconds / 3):
+            if not self.queue.renew(item_id, token):
+                self.log(f"工作项 {item_id} 的租约已被回收，取消处理")
+                cancel_token.cancel()
+                return
+
+    def _process(self, item, processor):
+        """处理一个工作项
+
+        Returns:
+            是否处理成功
+        """
+        options = JobManager.build_options(item['params'])
+
+        if item['segments'] is None:
+            options.pop('video_files', None)
+            options['max_workers'] = 1
+            results = processor.process_videos(video_files=[item['video_path']], **options)
+            return bool(results.get(item['video_path']))
+
+        # 只处理分配到的片段，片段序号决定输出文件名，和单机处理的结果一致
+        accepted = inspect.signature(processor.convert_video_to_gif).parameters
+        gif_options = {name: value for name, value in options.items()
+                       if name in accepted and name != 'output_path'}
+        segments = [tuple(segment) for segment in item['segments']]
+        processor.convert_video_to_gif(item['video_path'], options['output_path'],
+                                       segments=segments, **gif_options)
+        return True
+
+    def run_item(self, item_id, token):
+        """处理已领取的工作项并写入结果"""
+        item = self.queue.read_item(item_id)
+        attempt = self.queue.attempts(item_id)
+        if attempt > item.get('max_attempts', WorkQueue.DEFAULT_MAX_ATTEMPTS):
+            # 之前的处理节点在处理中崩溃，租约过期后被回收
+            self.log(f"工作项 {item_id} 已尝试 {attempt - 1} 次，不再重试")
+            self.queue.complete(item_id, token, {'success': False, 'worker': self.worker_id,
+                                                 'error': "超过最大重试次数"})
+            return
+
+        self.log(f"开始处理工作项 {item_id} (第 {attempt} 次)")
+        processor = VideoProcessor()
+        processor.set_logger_callback(self.log)
+        finished = threading.Event()
+        keeper = threading.Thread(target=self._keep_alive,
+                                  args=(item_id, token, finished, processor.cancel_token), daemon=True)
+        keeper.start()
+
+        begin = time.time()
+        error = None
+        try:
+            success = self._process(item, processor)
+        except ProcessingCancelled:
+            # 租约已被回收，由新的持有者处理
+            return
+        except Exception as e:
+            success = False
+            error = str(e)
+            self.log(f"工作项 {item_id} 处理出错: {error}")
+        finally:
+            finished.set()
+            keeper.join()
+
+        if not self.queue.holds_lease(item_id, token):
+            self.log(f"工作项 {item_id} 的租约已被回收，不写入结果")
+            return
+
+        # 还有重试次数时只释放租约，由任意节点重新领取
+        if not success and attempt < item.get('max_attempts', WorkQueue.DEFAULT_MAX_ATTEMPTS):
+            self.log(f"工作项 {item_id} 处理失败，稍后重试")
+            self.queue.release(item_id, token)
+            return
+
+        self.queue.complete(item_id, token, {
+            'success': success,
+            'error': error,
+            'worker': self.worker_id,
+            'attempt': attempt,
+            'elapsed': time.time() - begin,
+        })
+
+    def run(self, exit_when_empty=True):
+        """持续领取并处理工作项
+
+        Args:
+            exit_when_empty: 所有工作项都有结果后是否退出
+
+        Returns:
+            本节点处理的工作项数量
+        """
+        processed = 0
+        while not self._stop.is_set():
+            claimed = False
+            pending = False
+            for item_id in self.queue.item_ids():
+                if self._stop.is_set():
+                    break
+                if self.queue.is_done(item_id):
+                    continue
+                pending = True
+                token = self.queue.try_claim(item_id, self.worker_id)
+                if token is None:
+                    continue
+                claimed = True
+                self.run_item(item_id, token)
+                processed += 1
+
+            if not pending and exit_when_empty:
+                break
+            if not claimed:
+                self._stop.wait(self.poll_interval)
+
+        self.log(f"处理节点退出，共处理 {processed} 个工作项")
+        return processed
+
+
+def run_local_worker(queue_dir, lease_seconds=None, worker_id=None):
+    """本机处理节点进程入口，用于在一台机器上启动多个处理节点"""
+    from utils.logger import Logger
+
+    logger = Logger()
+    work_queue = WorkQueue(queue_dir, lease_seconds, logger=logger.info)
+    QueueWorker(work_queue, worker_id, logger=logger.info).run(exit_when_empty=True)
@@ -1,10 +1,15 @@
 import sys
-from PyQt5.QtWidgets import QApplication
-from ui.main_window import MainWindow
 
 
 def main():
-    """主程序入口函数"""
+    """主程序入口函数，带参数运行时进入命令行模式"""
+    if len(sys.argv) > 1:
+        import cli
+        sys.exit(cli.main(sys.argv[1:]))
+
+    from PyQt5.QtWidgets import QApplication
+    from ui.main_window import MainWindow
+
     app = QApplication(sys.argv)
     window = MainWindow()
     window.show()
@@ -0,0 +1,34 @@
+import sys
+import argparse
+
+from core.work_queue import WorkQueue, QueueWorker
+from utils.logger import Logger
+
+
+def build_parser():
+    """创建命令行参数解析器"""
+    parser = argparse.ArgumentParser(description="视频转GIF工具（分布式处理节点）")
+    parser.add_argument('--queue-dir', required=True, help="共享的工作队列目录")
+    parser.add_argument('--worker-id', default=None, help="节点标识，默认为 主机名-进程号")
+    parser.add_argument('--lease-seconds', type=float, default=None, help="租约有效期(秒)，需与其它节点一致")
+    parser.add_argument('--poll-interval', type=float, default=5.0, help="没有可领取的工作项时的等待间隔(秒)")
+    parser.add_argument('--keep-running', action='store_true', help="队列处理完后继续等待新的工作项")
+    return parser
+
+
+def main(argv=None):
+    """处理节点入口函数"""
+    args = build_parser().parse_args(argv)
+
+    logger = Logger()
+    work_queue = WorkQueue(args.queue_dir, args.lease_seconds, logger=logger.info)
+    worker = QueueWorker(work_queue, args.worker_id, args.poll_interval, logger=logger.info)
+    try:
+        worker.run(exit_when_empty=not args.keep_running)
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
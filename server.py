@@ -0,0 +1,167 @@
+import re
+import sys
+import json
+import argparse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+from core.job_manager import JobManager
+from core.scheduler import JobScheduler
+from utils.logger import Logger
+
+
+class JobRequestHandler(BaseHTTPRequestHandler):
+    """任务服务的HTTP请求处理类
+
+    接口:
+        GET  /health                 服务状态
+        POST /jobs                   提交任务，请求体为process_videos参数的JSON，
+                                     memory_budget, max_workers, schedule_order 由服务启动参数统一设置
+        GET  /jobs                   任务列表
+        GET  /jobs/<id>              任务状态、进度、各阶段耗时和结果
+        GET  /jobs/<id>/events       日志事件流（每行一个JSON），任务结束后关闭，
+                                     可用 ?since=<序号> 从指定事件继续读取
+    """
+
+    # 日志事件流等待新事件的间隔（秒）
+    EVENT_WAIT = 1.0
+    JOB_PATH = re.compile(r'^/jobs/(\d+)(/events)?$')
+
+    server_version = "VideoProcessTools"
+
+    @property
+    def manager(self):
+        return self.server.manager
+
+    def log_message(self, format, *args):
+        self.server.logger.info(f"{self.client_address[0]} {format % args}")
+
+    def _send_json(self, status, data):
+        body = json.dumps(data, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_error(self, status, message):
+        self._send_json(status, {'error': message})
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path == '/health':
+            self._send_json(200, {'status': 'ok'})
+            return
+        if url.path == '/jobs':
+            self._send_json(200, {'jobs': [job.to_dict() for job in self.manager.list()]})
+            return
+
+        match = self.JOB_PATH.match(url.path)
+        if not match:
+            self._send_error(404, "接口不存在")
+            return
+
+        job = self.manager.get(int(match.group(1)))
+        if job is None:
+            self._send_error(404, "任务不存在")
+            return
+
+        if match.group(2):
+            try:
+                since = int(parse_qs(url.query).get('since', ['0'])[0])
+            except ValueError:
+                self._send_error(400, "since必须是整数")
+                return
+            self._stream_events(job, since)
+        else:
+            self._send_json(200, job.to_dict(detail=True))
+
+    def _stream_events(self, job, since):
+        """以换行分隔的JSON持续输出日志事件，直到任务结束或客户端断开"""
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/x-ndjson; charset=utf-8')
+        self.send_header('Cache-Control', 'no-cache')
+        self.end_headers()
+
+        try:
+            while True:
+                events, finished = job.wait_events(since, self.EVENT_WAIT)
+                for event in events:
+                    self.wfile.write(json.dumps(event, ensure_ascii=False).encode('utf-8') + b'\n')
+                since += len(events)
+                self.wfile.flush()
+                if finished and not events:
+                    status = job.to_dict()
+                    self.wfile.write(json.dumps({'status': status['status'], 'error': status['error']},
+                                                ensure_ascii=False).encode('utf-8') + b'\n')
+                    return
+        except (BrokenPipeError, ConnectionResetError):
+            return
+
+    def do_POST(self):
+        if urlparse(self.path).path != '/jobs':
+            self._send_error(404, "接口不存在")
+            return
+
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+            params = json.loads(self.rfile.read(length).decode('utf-8') or '{}')
+            if not isinstance(params, dict):
+                raise ValueError("请求体必须是JSON对象")
+            job = self.manager.submit(params)
+        except (ValueError, TypeError) as e:
+            self._send_error(400, str(e))
+            return
+
+        self._send_json(201, job.to_dict())
+
+
+class JobServer(ThreadingHTTPServer):
+    """任务服务，每个请求一个线程，任务在JobManager的线程池中执行"""
+
+    daemon_threads = True
+
+    def __init__(self, address, manager, logger):
+        super().__init__(address, JobRequestHandler)
+        self.manager = manager
+        self.logger = logger
+
+
+def build_parser():
+    """创建命令行参数解析器"""
+    parser = argparse.ArgumentParser(description="视频转GIF工具（本地HTTP任务服务）")
+    parser.add_argument('--host', default='127.0.0.1', help="监听地址，默认只接受本机连接")
+    parser.add_argument('--port', type=int, default=8765, help="监听端口")
+    parser.add_argument('--workers', type=int, default=1, help="同时执行的任务数")
+    parser.add_argument('--memory-budget', type=int, default=None, help="所有任务共用的内存预算(MB)")
+    parser.add_argument('--max-workers', type=int, default=None,
+                        help="所有任务合计最多并行处理的视频数，默认为CPU核心数")
+    parser.add_argument('--schedule-order', choices=JobScheduler.ORDERS, default='largest_first',
+                        help="视频的排队顺序")
+    return parser
+
+
+def main(argv=None):
+    """服务入口函数"""
+    args = build_parser().parse_args(argv)
+
+    logger = Logger()
+    manager = JobManager(workers=args.workers,
+                         memory_budget=args.memory_budget * 1024 * 1024 if args.memory_budget else None,
+                         max_workers=args.max_workers, schedule_order=args.schedule_order,
+                         logger=logger.info)
+    server = JobServer((args.host, args.port), manager, logger)
+    logger.info(f"任务服务已启动: http://{args.host}:{server.server_address[1]}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        logger.info("任务服务正在停止，等待执行中的任务完成")
+        manager.shutdown()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,69 @@
+"""测试用的合成视频：每GOP帧一个关键帧、带B帧，以及各解码后端顺序解码的参考帧"""
+import numpy as np
+import pytest
+
+from core.decoders import DECODERS
+
+FPS = 25
+FRAME_COUNT = 100
+GOP = 12
+WIDTH, HEIGHT = 96, 64
+EPSILON = 1e-3
+
+
+def synthetic_frame(index):
+    """每帧方块位置不同，相邻帧的内容一定不同"""
+    frame = np.zeros((HEIGHT, WIDTH, 3), dtype=np.uint8)
+    frame[:, :, 0] = np.linspace(0, 255, WIDTH, dtype=np.uint8)
+    x, y = (index * 7) % (WIDTH - 16), (index * 3) % (HEIGHT - 16)
+    frame[y:y + 16, x:x + 16] = (255, 255, 255)
+    return frame
+
+
+@pytest.fixture(scope='module')
+def clip(tmp_path_factory):
+    imageio_ffmpeg = pytest.importorskip('imageio_ffmpeg')
+    path = str(tmp_path_factory.mktemp('clip') / 'synthetic.mp4')
+    writer = imageio_ffmpeg.write_frames(path, (WIDTH, HEIGHT), fps=FPS, codec='libx264',
+                                         pix_fmt_out='yuv420p', macro_block_size=1,
+                                         output_params=['-g', str(GOP), '-keyint_min', str(GOP),
+                                                        '-sc_threshold', '0', '-bf', '2'])
+    writer.send(None)
+    for index in range(FRAME_COUNT):
+        writer.send(synthetic_frame(index))
+    writer.close()
+    return path
+
+
+@pytest.fixture(params=sorted(DECODERS))
+def backend(request):
+    decoder_class = DECODERS[request.param]
+    if not decoder_class.is_available():
+        pytest.skip(f"{request.param} 解码器不可用")
+    return decoder_class
+
+
+_references = {}
+
+
+@pytest.fixture
+def reference(clip, backend):
+    """同一后端从头顺序解码、不跳转得到的全部帧"""
+    key = (clip, backend.name)
+    if key not in _references:
+        with backend(clip) as decoder:
+            _references[key] = list(decoder.iter_frames())
+    frames = _references[key]
+    assert len(frames) == FRAME_COUNT
+    return frames
+
+
+def expected_samples(reference, start, end, fps):
+    """每个输出时间点取时间戳不晚于它的最近一帧"""
+    total = int(np.ceil((end - start) * fps - EPSILON))
+    samples = []
+    for index in range(total):
+        point = start + index / fps
+        frames = [frame for timestamp, frame in reference if timestamp <= point + EPSILON]
+        samples.append((point, frames[-1]))
+    return samples
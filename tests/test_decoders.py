@@ -0,0 +1,24 @@
+import cv2
+import numpy as np
+import pytest
+
+from core.decoders import crop_frame
+from synthetic_clip import EPSILON, backend, clip, expected_samples, reference  # noqa: F401
+
+
+@pytest.mark.parametrize('region, size', [((11, 5, 61, 41), None), ((11, 5, 61, 41), (30, 20)), (None, (48, 32))])
+def test_output_region_and_size_match_reference(clip, backend, reference, region, size):
+    """解码器内部先裁剪再按面积缩小，结果与对原始帧裁剪缩小一致"""
+    with backend(clip) as decoder:
+        decoder.set_output(region, size)
+        actual = list(decoder.iter_frames(1.3, 2.5, 10))
+    expected = expected_samples(reference, 1.3, 2.5, 10)
+    assert len(actual) == len(expected)
+    for (timestamp, frame), (expected_timestamp, expected_frame) in zip(actual, expected):
+        expected_frame = crop_frame(expected_frame, region)
+        if size is not None:
+            expected_frame = cv2.resize(expected_frame, size, interpolation=cv2.INTER_AREA)
+        assert timestamp == pytest.approx(expected_timestamp, abs=EPSILON)
+        assert frame.shape == expected_frame.shape
+        # ffmpeg的面积缩小与OpenCV的舍入略有不同
+        assert np.abs(frame.astype(int) - expected_frame).mean() < 1
@@ -0,0 +1,95 @@
+import numpy as np
+import pytest
+
+from core.seek_index import SeekIndex, SeekIndexCache
+from synthetic_clip import (EPSILON, FPS, FRAME_COUNT, GOP, backend, clip, expected_samples,  # noqa: F401
+                            reference, synthetic_frame)
+
+# (开始, 结束) 秒：落在帧上、落在关键帧上、关键帧前一帧、两帧之间、到视频结尾
+SEGMENTS = [
+    (0, 1.0),
+    (37 / FPS, 62 / FPS),
+    (GOP / FPS, 2 * GOP / FPS),
+    ((GOP - 1) / FPS, (GOP + 1) / FPS),
+    (1.3, 2.5 + 0.5 / FPS),
+    (3.0, FRAME_COUNT / FPS),
+]
+
+
+@pytest.fixture(scope='module')
+def cached_index(clip, tmp_path_factory):
+    """先建立索引写入缓存目录，再由新的缓存对象从磁盘读回"""
+    cache_dir = str(tmp_path_factory.mktemp('seek_index'))
+    SeekIndexCache(cache_dir=cache_dir).get(clip)
+    cache = SeekIndexCache(cache_dir=cache_dir)
+    assert cache._load(cache._cache_key(clip)) is not None
+    return cache.get(clip)
+
+
+@pytest.fixture(params=[False, True], ids=['no_index', 'cached_index'])
+def seek_index(request, cached_index):
+    return cached_index if request.param else None
+
+
+def expected_frames(reference, start, end):
+    return [(timestamp, frame) for timestamp, frame in reference
+            if start - EPSILON <= timestamp < end - EPSILON]
+
+
+def assert_same_frames(actual, expected):
+    assert len(actual) == len(expected)
+    for (timestamp, frame), (expected_timestamp, expected_frame) in zip(actual, expected):
+        assert timestamp == pytest.approx(expected_timestamp, abs=EPSILON)
+        assert np.array_equal(frame, expected_frame)
+
+
+def test_reference_decode_is_frame_accurate(reference):
+    for index, (timestamp, frame) in enumerate(reference):
+        assert timestamp == pytest.approx(index / FPS, abs=EPSILON)
+        # 有损压缩，只要求与原始帧接近且与相邻帧明显不同
+        assert np.abs(frame.astype(int) - synthetic_frame(index)).mean() < 8
+
+
+def test_seek_index_keyframes(clip, cached_index):
+    expected = [index / FPS for index in range(0, FRAME_COUNT, GOP)]
+    assert SeekIndex.build(clip).keyframes == pytest.approx(expected, abs=EPSILON)
+    assert cached_index.keyframes == pytest.approx(expected, abs=EPSILON)
+    assert cached_index.keyframe_before(GOP / FPS) == pytest.approx(GOP / FPS)
+    assert cached_index.keyframe_before((GOP - 1) / FPS) == pytest.approx(0)
+    assert cached_index.has_keyframe_between((GOP - 1) / FPS, GOP / FPS)
+    assert not cached_index.has_keyframe_between(GOP / FPS, (2 * GOP - 1) / FPS)
+
+
+@pytest.mark.parametrize('start, end', SEGMENTS)
+def test_segment_frames_match_reference(clip, backend, reference, seek_index, start, end):
+    with backend(clip, seek_index) as decoder:
+        actual = list(decoder.iter_frames(start, end))
+    assert_same_frames(actual, expected_frames(reference, start, end))
+
+
+@pytest.mark.parametrize('start, end', SEGMENTS)
+def test_segment_samples_match_reference(clip, backend, reference, seek_index, start, end):
+    with backend(clip, seek_index) as decoder:
+        actual = list(decoder.iter_frames(start, end, 10))
+    assert_same_frames(actual, expected_samples(reference, start, end, 10))
+
+
+def test_consecutive_segments_match_reference(clip, backend, reference, seek_index):
+    """相邻片段复用同一解码器，越过边界的帧留给下一个片段，不需要重新跳转"""
+    boundaries = [0, 11 / FPS, 1.0, 37 / FPS, 2.0 + 0.5 / FPS, 3.0, FRAME_COUNT / FPS]
+    with backend(clip, seek_index) as decoder:
+        seeks = []
+        original_seek = decoder._seek
+        decoder._seek = lambda timestamp, keyframe=None: (seeks.append(timestamp),
+                                                          original_seek(timestamp, keyframe))
+        for start, end in zip(boundaries, boundaries[1:]):
+            actual = list(decoder.iter_frames(start, end, 10))
+            assert_same_frames(actual, expected_samples(reference, start, end, 10))
+    assert seeks == []
+
+
+def test_backward_seek_matches_reference(clip, backend, reference, seek_index):
+    with backend(clip, seek_index) as decoder:
+        for start, end in reversed(SEGMENTS):
+            actual = list(decoder.iter_frames(start, end))
+            assert_same_frames(actual, expected_frames(reference, start, end))
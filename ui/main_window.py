@@ -2,12 +2,18 @@ import os
 from PyQt5.QtWidgets import (QMainWindow, QWidget, QVBoxLayout, QHBoxLayout,
                              QLabel, QLineEdit, QPushButton, QFileDialog,
                              QTextEdit, QSplitter, QMessageBox, QSpinBox,
-                             QDoubleSpinBox, QGroupBox, QRadioButton, QButtonGroup)
+                             QDoubleSpinBox, QGroupBox, QRadioButton, QButtonGroup,
+                             QComboBox, QCheckBox)
 from PyQt5.QtCore import Qt, QThread, pyqtSignal, QSize
 from PyQt5.QtGui import QFont, QIcon
 
 from ui.video_preview import VideoPreviewWidget
 from core.video_processor import VideoProcessor
+from core.scheduler import JobScheduler
+from core.scene_detector import SceneDetector
+from core.folder_watcher import WatchService
+from core.batch_planner import BatchPlanner
+from core.cancellation import CancelToken, ProcessingCancelled
 from utils.logger import Logger
 
 
@@ -16,6 +22,7 @@ class ProcessingThread(QThread):
     update_signal = pyqtSignal(str)  # 用于发送日志消息的信号
     finished_signal = pyqtSignal()  # 处理完成信号
     error_signal = pyqtSignal(str)  # 错误信号
+    cancelled_signal = pyqtSignal()  # 取消信号
 
     def __init__(self, processor, params):
         super().__init__()
@@ -27,6 +34,8 @@ class ProcessingThread(QThread):
             self.processor.set_logger_callback(self.log_callback)
             self.processor.process_videos(**self.params)
             self.finished_signal.emit()
+        except ProcessingCancelled:
+            self.cancelled_signal.emit()
         except Exception as e:
             self.error_signal.emit(str(e))
 
@@ -34,15 +43,76 @@ class ProcessingThread(QThread):
         self.update_signal.emit(message)
 
 
+class PlanThread(QThread):
+    """预估线程，只计算片段并试处理，不输出GIF"""
+    update_signal = pyqtSignal(str)  # 用于发送日志消息的信号
+    finished_signal = pyqtSignal(object)  # 预估完成信号，携带预估结果
+    error_signal = pyqtSignal(str)  # 错误信号
+    cancelled_signal = pyqtSignal()  # 取消信号
+
+    def __init__(self, processor, params):
+        super().__init__()
+        self.processor = processor
+        self.params = params
+
+    def run(self):
+        try:
+            self.processor.set_logger_callback(self.log_callback)
+            plan = self.processor.process_videos(dry_run=True, **self.params)
+            self.finished_signal.emit(plan)
+        except ProcessingCancelled:
+            self.cancelled_signal.emit()
+        except Exception as e:
+            self.error_signal.emit(str(e))
+
+    def log_callback(self, message):
+        self.update_signal.emit(message)
+
+
+class WatchThread(QThread):
+    """监视文件夹线程，持续处理新增的视频直到停止"""
+    update_signal = pyqtSignal(str)  # 用于发送日志消息的信号
+    finished_signal = pyqtSignal()  # 停止监视信号
+    error_signal = pyqtSignal(str)  # 错误信号
+
+    def __init__(self, processor, params):
+        super().__init__()
+        self.processor = processor
+        params = dict(params)
+        # 监视模式下并行任务数为同时处理的视频数
+        self.service = WatchService(processor, params.pop('input_path'), params.pop('output_path'),
+                                    concurrency=params.pop('max_workers'), **params)
+
+    def run(self):
+        try:
+            self.processor.set_logger_callback(self.log_callback)
+            self.service.run()
+            self.finished_signal.emit()
+        except Exception as e:
+            self.error_signal.emit(str(e))
+
+    def stop(self):
+        """停止监视，已开始处理的视频会处理完"""
+        self.service.stop()
+
+    def log_callback(self, message):
+        self.update_signal.emit(message)
+
+
 class MainWindow(QMainWindow):
     """主窗口类"""
 
+    # 关闭窗口时等待处理线程结束的最长时间（毫秒）
+    CLOSE_WAIT_MS = 15000
+
     def __init__(self):
         super().__init__()
         self.init_ui()
         self.logger = Logger()
         self.processor = VideoProcessor()
         self.processing_thread = None
+        self.plan_thread = None
+        self.cancel_token = CancelToken()
 
     def init_ui(self):
         """初始化UI界面"""
@@ -122,13 +192,16 @@ class MainWindow(QMainWindow):
         self.split_type_group = QButtonGroup(self)
         self.split_by_duration = QRadioButton("按时长分割")
         self.split_by_count = QRadioButton("按数量分割")
+        self.split_by_scene = QRadioButton("按场景分割")
         self.split_by_duration.setChecked(True)
 
         self.split_type_group.addButton(self.split_by_duration, 1)
         self.split_type_group.addButton(self.split_by_count, 2)
+        self.split_type_group.addButton(self.split_by_scene, 3)
 
         split_type_layout.addWidget(self.split_by_duration)
         split_type_layout.addWidget(self.split_by_count)
+        split_type_layout.addWidget(self.split_by_scene)
 
         params_layout.addWidget(split_type_group)
 
@@ -159,21 +232,168 @@ class MainWindow(QMainWindow):
         count_layout.addWidget(self.count)
         params_layout.addLayout(count_layout)
 
+        # 场景切换阈值
+        threshold_layout = QHBoxLayout()
+        threshold_label = QLabel("场景切换阈值:")
+        self.scene_threshold = QDoubleSpinBox()
+        self.scene_threshold.setMinimum(0.05)
+        self.scene_threshold.setMaximum(1.0)
+        self.scene_threshold.setSingleStep(0.05)
+        self.scene_threshold.setValue(0.35)
+        self.scene_threshold.setDecimals(2)
+        self.style_spinbox(self.scene_threshold)
+
+        threshold_layout.addWidget(threshold_label)
+        threshold_layout.addWidget(self.scene_threshold)
+        params_layout.addLayout(threshold_layout)
+
+        # 场景片段时长限制
+        scene_length_layout = QHBoxLayout()
+        min_scene_label = QLabel("最短片段(秒):")
+        self.min_scene_length = QDoubleSpinBox()
+        self.min_scene_length.setMinimum(0.1)
+        self.min_scene_length.setMaximum(999999)
+        self.min_scene_length.setValue(1)
+        self.min_scene_length.setDecimals(1)
+        self.style_spinbox(self.min_scene_length)
+        max_scene_label = QLabel("最长片段(秒):")
+        self.max_scene_length = QDoubleSpinBox()
+        self.max_scene_length.setMinimum(0.1)
+        self.max_scene_length.setMaximum(999999)
+        self.max_scene_length.setValue(10)
+        self.max_scene_length.setDecimals(1)
+        self.style_spinbox(self.max_scene_length)
+
+        scene_length_layout.addWidget(min_scene_label)
+        scene_length_layout.addWidget(self.min_scene_length)
+        scene_length_layout.addWidget(max_scene_label)
+        scene_length_layout.addWidget(self.max_scene_length)
+        params_layout.addLayout(scene_length_layout)
+
         # 状态切换
         self.split_by_duration.toggled.connect(self.update_split_type)
+        self.split_by_scene.toggled.connect(self.update_split_type)
         self.update_split_type()
 
-        # 开始按钮
+        # 输出格式
+        output_format_layout = QHBoxLayout()
+        output_format_label = QLabel("输出格式:")
+        self.output_format = QComboBox()
+        self.output_format.addItem("GIF", ('gif', 'gif'))
+        self.output_format.addItem("动态WebP", ('gif', 'webp'))
+        self.output_format.addItem("APNG", ('gif', 'apng'))
+        self.output_format.addItem("MP4片段(流复制)", ('clip', 'mp4'))
+        self.output_format.addItem("MKV片段(流复制)", ('clip', 'mkv'))
+        self.snap_to_keyframes = QCheckBox("边界对齐关键帧")
+        self.snap_to_keyframes.setChecked(True)
+
+        output_format_layout.addWidget(output_format_label)
+        output_format_layout.addWidget(self.output_format)
+        output_format_layout.addWidget(self.snap_to_keyframes)
+        params_layout.addLayout(output_format_layout)
+
+        self.output_format.currentIndexChanged.connect(self.update_output_format)
+        self.update_output_format()
+
+        # 目标文件大小
+        target_size_layout = QHBoxLayout()
+        target_size_label = QLabel("目标大小(KB):")
+        self.target_size = QSpinBox()
+        self.target_size.setMinimum(0)
+        self.target_size.setMaximum(10 * 1024 * 1024)
+        self.target_size.setSingleStep(100)
+        self.target_size.setValue(0)
+        self.target_size.setSpecialValueText("不限制")
+        self.style_spinbox(self.target_size)
+        self.update_output_format()
+
+        target_size_layout.addWidget(target_size_label)
+        target_size_layout.addWidget(self.target_size)
+        params_layout.addLayout(target_size_layout)
+
+        # 并行任务数
+        workers_layout = QHBoxLayout()
+        workers_label = QLabel("并行任务数:")
+        self.max_workers = QSpinBox()
+        self.max_workers.setMinimum(1)
+        self.max_workers.setMaximum(64)
+        self.max_workers.setValue(1)
+        self.style_spinbox(self.max_workers)
+
+        workers_layout.addWidget(workers_label)
+        workers_layout.addWidget(self.max_workers)
+        params_layout.addLayout(workers_layout)
+
+        # 内存预算
+        memory_layout = QHBoxLayout()
+        memory_label = QLabel("内存预算(MB):")
+        self.memory_budget = QSpinBox()
+        self.memory_budget.setMinimum(256)
+        self.memory_budget.setMaximum(1024 * 1024)
+        self.memory_budget.setSingleStep(256)
+        self.memory_budget.setValue(JobScheduler.default_memory_budget() // (1024 * 1024))
+        self.style_spinbox(self.memory_budget)
+
+        memory_layout.addWidget(memory_label)
+        memory_layout.addWidget(self.memory_budget)
+        params_layout.addLayout(memory_layout)
+
+        # 每个视频的编码进程数
+        encode_workers_layout = QHBoxLayout()
+        encode_workers_label = QLabel("编码进程数:")
+        self.encode_workers = QSpinBox()
+        self.encode_workers.setMinimum(1)
+        self.encode_workers.setMaximum(64)
+        self.encode_workers.setValue(1)
+        self.style_spinbox(self.encode_workers)
+
+        encode_workers_layout.addWidget(encode_workers_label)
+        encode_workers_layout.addWidget(self.encode_workers)
+        params_layout.addLayout(encode_workers_layout)
+
+        # 监视模式
+        self.watch_folder = QCheckBox("持续监视输入文件夹，自动处理新视频")
+        params_layout.addWidget(self.watch_folder)
+
+        # 预估和开始按钮
+        buttons_layout = QHBoxLayout()
+        self.plan_button = QPushButton("预估")
+        self.plan_button.setMinimumHeight(40)
+        self.plan_button.setToolTip("计算片段并试处理一小段，预估片段数、输出大小和耗时")
+        self.plan_button.clicked.connect(self.start_plan)
+        self.style_button(self.plan_button)
+
         self.start_button = QPushButton("开始处理")
         self.start_button.setMinimumHeight(40)
         self.start_button.clicked.connect(self.start_processing)
         self.style_button(self.start_button, is_primary=True)
 
-        params_layout.addWidget(self.start_button)
+        buttons_layout.addWidget(self.plan_button, 1)
+        buttons_layout.addWidget(self.start_button, 2)
+        params_layout.addLayout(buttons_layout)
+
+        # 暂停和取消按钮，处理中可用
+        control_layout = QHBoxLayout()
+        self.pause_button = QPushButton("暂停")
+        self.pause_button.setMinimumHeight(32)
+        self.pause_button.clicked.connect(self.toggle_pause)
+        self.style_button(self.pause_button)
+
+        self.cancel_button = QPushButton("取消")
+        self.cancel_button.setMinimumHeight(32)
+        self.cancel_button.setToolTip("停止处理并删除未写完的输出")
+        self.cancel_button.clicked.connect(self.cancel_processing)
+        self.style_button(self.cancel_button)
+
+        control_layout.addWidget(self.pause_button)
+        control_layout.addWidget(self.cancel_button)
+        params_layout.addLayout(control_layout)
+        self.set_run_controls(False)
         params_layout.addStretch()
 
         # 右侧 - 视频预览
         self.video_preview = VideoPreviewWidget()
+        self.video_preview.set_settings_callback(self.quick_preview_settings)
 
         # 将左右两侧添加到上半部分布局
         top_layout.addWidget(params_group, 1)
@@ -327,8 +547,19 @@ class MainWindow(QMainWindow):
     def update_split_type(self):
         """根据选择的分割方式更新UI状态"""
         is_duration = self.split_by_duration.isChecked()
+        is_scene = self.split_by_scene.isChecked()
         self.duration.setEnabled(is_duration)
-        self.count.setEnabled(not is_duration)
+        self.count.setEnabled(self.split_by_count.isChecked())
+        self.scene_threshold.setEnabled(is_scene)
+        self.min_scene_length.setEnabled(is_scene)
+        self.max_scene_length.setEnabled(is_scene)
+
+    def update_output_format(self):
+        """根据输出格式更新UI状态"""
+        output_mode, _ = self.output_format.currentData()
+        self.snap_to_keyframes.setEnabled(output_mode == 'clip')
+        if hasattr(self, 'target_size'):
+            self.target_size.setEnabled(output_mode != 'clip')
 
     def browse_input_path(self):
         """浏览并选择输入视频路径"""
@@ -358,8 +589,8 @@ class MainWindow(QMainWindow):
             self.output_path.setText(directory)
             self.log_text.append(f"输出路径已设置: {directory}")
 
-    def start_processing(self):
-        """开始处理视频"""
+    def collect_params(self):
+        """检查并收集处理参数，参数无效时提示并返回None"""
         # 参数检查
         input_path = self.input_path.text().strip()
         output_path = self.output_path.text().strip()
@@ -367,28 +598,41 @@ class MainWindow(QMainWindow):
 
         if not input_path:
             QMessageBox.warning(self, "参数错误", "请输入视频路径")
-            return
+            return None
 
         if not output_path:
             QMessageBox.warning(self, "参数错误", "请选择输出路径")
-            return
+            return None
 
         # 获取分割参数
         split_by_duration = self.split_by_duration.isChecked()
+        scene_detector = None
 
         if split_by_duration:
             duration = self.duration.value()
             if duration <= 0:
                 QMessageBox.warning(self, "参数错误", "分割时长必须大于0")
-                return
+                return None
+            count = None
+        elif self.split_by_scene.isChecked():
+            if self.max_scene_length.value() < self.min_scene_length.value():
+                QMessageBox.warning(self, "参数错误", "最长片段时长不能小于最短片段时长")
+                return None
+            scene_detector = SceneDetector(threshold=self.scene_threshold.value(),
+                                           min_scene_length=self.min_scene_length.value(),
+                                           max_scene_length=self.max_scene_length.value())
+            duration = None
             count = None
         else:
             count = self.count.value()
             if count <= 0:
                 QMessageBox.warning(self, "参数错误", "分割数量必须大于0")
-                return
+                return None
             duration = None
 
+        # 获取输出格式
+        output_mode, file_format = self.output_format.currentData()
+
         # 获取视频预览框选区域
         selected_region = self.video_preview.get_selected_region()
 
@@ -399,20 +643,164 @@ class MainWindow(QMainWindow):
             'start_time': start_time,
             'split_duration': duration,
             'split_count': count,
-            'selected_region': selected_region
+            'selected_region': selected_region,
+            'max_workers': self.max_workers.value(),
+            'memory_budget': self.memory_budget.value() * 1024 * 1024,
+            'encode_workers': self.encode_workers.value(),
+            'scene_detector': scene_detector,
+            'target_size': self.target_size.value() * 1024 or None,
+            'output_mode': output_mode,
+            'clip_container': file_format if output_mode == 'clip' else 'mp4',
+            'output_format': file_format if output_mode == 'gif' else 'gif',
+            'snap_to_keyframes': self.snap_to_keyframes.isChecked()
         }
+        return params
+
+    def quick_preview_settings(self):
+        """快速预览使用的当前设置，流复制模式不生成动图时返回None"""
+        output_mode, file_format = self.output_format.currentData()
+        if output_mode == 'clip':
+            return None
+
+        settings = {
+            'start_time': self.start_time.value(),
+            'fps': VideoProcessor.GIF_FPS,
+            'output_format': file_format,
+            'target_size': self.target_size.value() * 1024 or None,
+        }
+        if self.split_by_duration.isChecked():
+            settings['split_duration'] = self.duration.value() or None
+        elif self.split_by_scene.isChecked():
+            # 场景分割的片段长度要完整解码后才知道，按最长片段时长估算
+            settings['split_duration'] = self.max_scene_length.value()
+        else:
+            settings['split_count'] = self.count.value() or None
+        return settings
+
+    def start_plan(self):
+        """预估处理耗时和输出大小"""
+        params = self.collect_params()
+        if params is None:
+            return
+
+        self.plan_button.setEnabled(False)
+        self.start_button.setEnabled(False)
+        self.log_text.append("开始预估...")
+        self.begin_run()
+
+        self.plan_thread = PlanThread(self.processor, params)
+        self.plan_thread.update_signal.connect(self.update_log)
+        self.plan_thread.finished_signal.connect(self.plan_finished)
+        self.plan_thread.error_signal.connect(self.plan_error)
+        self.plan_thread.cancelled_signal.connect(self.processing_cancelled)
+        self.plan_thread.start()
+
+    def plan_finished(self, plan):
+        """预估完成回调"""
+        self.plan_button.setEnabled(True)
+        self.start_button.setEnabled(True)
+        self.set_run_controls(False)
+        if not plan:
+            return
+
+        message = (f"视频数: {len(plan['videos'])}\n"
+                   f"片段数: {plan['segments']}\n"
+                   f"预计输出: {plan['bytes'] / 1024 ** 2:.1f}MB\n"
+                   f"预计耗时: {BatchPlanner.format_duration(plan['wall_seconds'])}"
+                   f"（并行 {plan['workers']} 个）")
+        if plan['bytes'] > plan['free_bytes']:
+            message += f"\n\n警告: 预计输出超过输出磁盘的剩余空间 {plan['free_bytes'] / 1024 ** 3:.1f}GB"
+        QMessageBox.information(self, "预估结果", message)
+
+    def plan_error(self, error_message):
+        """预估出错回调"""
+        self.plan_button.setEnabled(True)
+        self.processing_error(error_message)
+
+    def start_processing(self):
+        """开始处理视频"""
+        # 监视中再次点击按钮时停止监视
+        if isinstance(self.processing_thread, WatchThread) and self.processing_thread.isRunning():
+            self.processing_thread.stop()
+            self.start_button.setEnabled(False)
+            self.log_text.append("正在停止监视，等待正在处理的视频完成...")
+            return
+
+        params = self.collect_params()
+        if params is None:
+            return
+        input_path = params['input_path']
+
+        if self.watch_folder.isChecked():
+            if not os.path.isdir(input_path):
+                QMessageBox.warning(self, "参数错误", "监视模式的视频路径必须是文件夹")
+                return
+
+            self.plan_button.setEnabled(False)
+            self.start_button.setText("停止监视")
+            self.watch_folder.setEnabled(False)
+            self.begin_run()
+            self.processing_thread = WatchThread(self.processor, params)
+            self.processing_thread.update_signal.connect(self.update_log)
+            self.processing_thread.finished_signal.connect(self.watch_finished)
+            self.processing_thread.error_signal.connect(self.watch_error)
+            self.processing_thread.start()
+            return
 
         # 禁用开始按钮
         self.start_button.setEnabled(False)
+        self.plan_button.setEnabled(False)
         self.log_text.append("开始处理视频...")
+        self.begin_run()
 
         # 创建并启动处理线程
         self.processing_thread = ProcessingThread(self.processor, params)
         self.processing_thread.update_signal.connect(self.update_log)
         self.processing_thread.finished_signal.connect(self.processing_finished)
         self.processing_thread.error_signal.connect(self.processing_error)
+        self.processing_thread.cancelled_signal.connect(self.processing_cancelled)
         self.processing_thread.start()
 
+    def set_run_controls(self, running):
+        """处理开始或结束时切换暂停和取消按钮"""
+        self.pause_button.setText("暂停")
+        self.pause_button.setEnabled(running)
+        self.cancel_button.setEnabled(running)
+
+    def begin_run(self):
+        """每次处理使用新的取消标记"""
+        self.cancel_token = CancelToken()
+        self.processor.set_cancel_token(self.cancel_token)
+        self.set_run_controls(True)
+
+    def toggle_pause(self):
+        """暂停或继续处理"""
+        if self.cancel_token.paused:
+            self.cancel_token.resume()
+            self.pause_button.setText("暂停")
+            self.log_text.append("继续处理")
+        else:
+            self.cancel_token.pause()
+            self.pause_button.setText("继续")
+            self.log_text.append("已暂停，正在处理的帧完成后停止")
+
+    def cancel_processing(self):
+        """取消处理，正在处理的视频删除未写完的输出后结束"""
+        self.cancel_token.cancel()
+        self.pause_button.setEnabled(False)
+        self.cancel_button.setEnabled(False)
+        self.log_text.append("正在取消，等待正在处理的视频清理...")
+        if isinstance(self.processing_thread, WatchThread) and self.processing_thread.isRunning():
+            self.processing_thread.stop()
+            self.start_button.setEnabled(False)
+
+    def processing_cancelled(self):
+        """处理取消回调"""
+        self.start_button.setEnabled(True)
+        self.plan_button.setEnabled(True)
+        self.set_run_controls(False)
+        self.log_text.append("处理已取消")
+
     def update_log(self, message):
         """更新日志显示"""
         self.log_text.append(message)
@@ -423,11 +811,46 @@ class MainWindow(QMainWindow):
     def processing_finished(self):
         """处理完成回调"""
         self.start_button.setEnabled(True)
+        self.plan_button.setEnabled(True)
+        self.set_run_controls(False)
         self.log_text.append("所有视频处理完成!")
         QMessageBox.information(self, "处理完成", "所有视频已成功转换为GIF")
 
+    def reset_watch_controls(self):
+        """停止监视后恢复按钮状态"""
+        self.start_button.setText("开始处理")
+        self.start_button.setEnabled(True)
+        self.plan_button.setEnabled(True)
+        self.watch_folder.setEnabled(True)
+        self.set_run_controls(False)
+
+    def watch_finished(self):
+        """停止监视回调"""
+        self.reset_watch_controls()
+        self.log_text.append("已停止监视输入文件夹")
+
+    def watch_error(self, error_message):
+        """监视出错回调"""
+        self.reset_watch_controls()
+        self.processing_error(error_message)
+
     def processing_error(self, error_message):
         """处理错误回调"""
         self.start_button.setEnabled(True)
+        self.plan_button.setEnabled(True)
+        self.set_run_controls(False)
         self.log_text.append(f"处理出错: {error_message}")
         QMessageBox.critical(self, "处理错误", f"发生错误: {error_message}")
+
+    def closeEvent(self, event):
+        """关闭窗口时取消处理，等待处理线程清理未写完的输出后退出"""
+        threads = [thread for thread in (self.processing_thread, self.plan_thread)
+                   if thread is not None and thread.isRunning()]
+        if threads:
+            self.cancel_token.cancel()
+            if isinstance(self.processing_thread, WatchThread):
+                self.processing_thread.stop()
+            for thread in threads:
+                thread.wait(self.CLOSE_WAIT_MS)
+        self.video_preview.cancel_quick_preview(self.CLOSE_WAIT_MS)
+        super().closeEvent(event)
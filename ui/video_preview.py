@@ -2,8 +2,36 @@ import cv2
 import os
 from PyQt5.QtWidgets import (QWidget, QVBoxLayout, QLabel, QHBoxLayout,
                              QPushButton, QComboBox, QSizePolicy, QSlider)
-from PyQt5.QtCore import Qt, QTimer, QRect, QPoint
-from PyQt5.QtGui import QImage, QPixmap, QPainter, QPen, QColor, QMouseEvent, QFont
+from PyQt5.QtCore import (Qt, QTimer, QRect, QPoint, QThread, pyqtSignal, QBuffer, QByteArray,
+                          QIODevice)
+from PyQt5.QtGui import QImage, QPixmap, QPainter, QPen, QColor, QMouseEvent, QFont, QMovie
+
+from core.decoders import DecoderSelector
+from core.seek_index import SeekIndexCache
+from core.quick_preview import QuickPreviewRenderer
+from core.cancellation import CancelToken, ProcessingCancelled
+
+
+class QuickPreviewThread(QThread):
+    """快速预览线程，在后台渲染预览GIF，不阻塞界面"""
+    finished_signal = pyqtSignal(object)  # 渲染完成信号，携带预览结果
+    error_signal = pyqtSignal(str)  # 错误信号
+
+    def __init__(self, renderer, video_path, options, cancel_token):
+        super().__init__()
+        self.renderer = renderer
+        self.video_path = video_path
+        self.options = options
+        self.cancel_token = cancel_token
+
+    def run(self):
+        try:
+            result = self.renderer.render(self.video_path, cancel_token=self.cancel_token, **self.options)
+            self.finished_signal.emit(result)
+        except ProcessingCancelled:
+            pass
+        except Exception as e:
+            self.error_signal.emit(str(e))
 
 
 class VideoPreviewWidget(QWidget):
@@ -15,7 +43,8 @@ class VideoPreviewWidget(QWidget):
 
         # 视频相关变量
         self.video_path = None
-        self.cap = None
+        self.decoder = None
+        self.decoder_selector = DecoderSelector()
         self.frame = None
         self.timer = QTimer(self)
         self.timer.timeout.connect(self.update_frame)
@@ -34,6 +63,18 @@ class VideoPreviewWidget(QWidget):
         self.total_frames = 0
         self.is_slider_updating = False
 
+        # 快速预览相关变量，渲染器复用预览已选出的解码后端
+        self.settings_callback = None
+        self.quick_preview_renderer = QuickPreviewRenderer(decoder_selector=self.decoder_selector,
+                                                           seek_index_cache=SeekIndexCache())
+        self.quick_preview_thread = None
+        self.quick_preview_threads = []
+        self.quick_preview_token = None
+        self.quick_preview_target_size = None
+        self.quick_preview_movie = None
+        self.quick_preview_buffer = None
+        self.quick_preview_data = None
+
     def init_ui(self):
         """初始化UI界面"""
         layout = QVBoxLayout(self)
@@ -124,12 +165,30 @@ class VideoPreviewWidget(QWidget):
         self.reset_button.clicked.connect(self.reset_selection)
         self.reset_button.setEnabled(False)
 
+        self.quick_preview_button = QPushButton("快速预览")
+        self.quick_preview_button.clicked.connect(self.request_quick_preview)
+        self.quick_preview_button.setEnabled(False)
+
         controls_layout.addWidget(self.play_button)
         controls_layout.addWidget(self.reset_button)
+        controls_layout.addWidget(self.quick_preview_button)
         layout.addLayout(controls_layout)
 
+        # 快速预览的动图和预计大小
+        self.quick_preview_label = QLabel()
+        self.quick_preview_label.setAlignment(Qt.AlignCenter)
+        self.quick_preview_label.setVisible(False)
+        layout.addWidget(self.quick_preview_label)
+
+        self.quick_preview_info = QLabel()
+        self.quick_preview_info.setStyleSheet("color: #666; font-size: 11px;")
+        self.quick_preview_info.setWordWrap(True)
+        self.quick_preview_info.setVisible(False)
+        layout.addWidget(self.quick_preview_info)
+
         # 提示信息
-        hint_label = QLabel("提示: 拖动鼠标在视频上选择区域。只有选择的区域将被转换为GIF。")
+        hint_label = QLabel("提示: 拖动鼠标在视频上选择区域。只有选择的区域将被转换为GIF。"
+                            "点击“快速预览”查看开头几秒的效果和预计的输出大小。")
         hint_label.setStyleSheet("color: #666; font-size: 11px;")
         hint_label.setWordWrap(True)
         layout.addWidget(hint_label)
@@ -154,26 +213,24 @@ class VideoPreviewWidget(QWidget):
 
     def set_video(self, video_path):
         """设置视频路径并初始化"""
-        # 停止当前播放
+        # 停止当前播放，清除上一个视频的快速预览
         self.stop_video()
+        self.clear_quick_preview()
 
         self.video_path = video_path
 
         try:
-            # 打开视频
-            self.cap = cv2.VideoCapture(video_path)
-            if not self.cap.isOpened():
-                raise Exception("无法打开视频文件")
+            # 打开视频，按文件自动选择解码器
+            self.decoder = self.decoder_selector.open(video_path)
 
             # 读取第一帧
-            ret, self.frame = self.cap.read()
-            if not ret:
+            item = self.decoder.read()
+            if item is None:
                 raise Exception("无法读取视频帧")
+            self.frame = item[1]
 
-            # 获取视频总帧数和FPS
-            self.total_frames = int(self.cap.get(cv2.CAP_PROP_FRAME_COUNT))
-            fps = self.cap.get(cv2.CAP_PROP_FPS)
-            duration = self.total_frames / fps if fps > 0 else 0
+            # 获取视频总帧数
+            self.total_frames = self.decoder.frame_count
 
             # 更新进度条
             self.progress_slider.setEnabled(True)
@@ -190,6 +247,7 @@ class VideoPreviewWidget(QWidget):
             # 启用控制按钮
             self.play_button.setEnabled(True)
             self.reset_button.setEnabled(True)
+            self.quick_preview_button.setEnabled(True)
 
             # 更新视频选择下拉框
             current_filename = os.path.basename(video_path)
@@ -201,15 +259,16 @@ class VideoPreviewWidget(QWidget):
             self.preview_label.setText(f"视频加载失败: {str(e)}")
             self.play_button.setEnabled(False)
             self.reset_button.setEnabled(False)
+            self.quick_preview_button.setEnabled(False)
             self.progress_slider.setEnabled(False)
 
     def update_time_display(self):
         """更新时间显示"""
-        if self.cap is None:
+        if self.decoder is None:
             return
 
         # 计算当前时间和总时间
-        fps = self.cap.get(cv2.CAP_PROP_FPS)
+        fps = self.decoder.fps
         if fps <= 0:
             fps = 30  # 默认值
 
@@ -225,13 +284,14 @@ class VideoPreviewWidget(QWidget):
 
     def slider_value_changed(self, value):
         """进度条值改变时的处理"""
-        if self.is_slider_updating or self.cap is None:
+        if self.is_slider_updating or self.decoder is None:
             return
 
         # 设置视频位置
-        self.cap.set(cv2.CAP_PROP_POS_FRAMES, value)
-        ret, self.frame = self.cap.read()
-        if ret:
+        self.decoder.seek_frame(value)
+        item = self.decoder.read()
+        if item is not None:
+            self.frame = item[1]
             self.current_frame_position = value
             self.display_frame(self.frame)
             self.update_time_display()
@@ -251,15 +311,16 @@ class VideoPreviewWidget(QWidget):
             self.timer.stop()
             self.play_button.setText("播放")
 
-        if self.cap is not None:
-            self.cap.release()
-            self.cap = None
+        if self.decoder is not None:
+            self.decoder.close()
+            self.decoder = None
 
     def update_frame(self):
         """更新显示下一帧"""
-        if self.cap is not None and self.cap.isOpened():
-            ret, self.frame = self.cap.read()
-            if ret:
+        if self.decoder is not None:
+            item = self.decoder.read()
+            if item is not None:
+                self.frame = item[1]
                 self.current_frame_position += 1
 
                 # 更新进度条，防止递归调用
@@ -274,7 +335,7 @@ class VideoPreviewWidget(QWidget):
                 self.display_frame(self.frame)
             else:
                 # 视频播放完毕，重新开始
-                self.cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+                self.decoder.seek(0)
                 self.current_frame_position = 0
                 self.progress_slider.setValue(0)
                 self.update_time_display()
@@ -286,8 +347,8 @@ class VideoPreviewWidget(QWidget):
         if frame is None:
             return
 
-        # 将BGR转换为RGB
-        frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+        # 解码器输出的帧已经是RGB
+        frame_rgb = frame
 
         # 获取预览标签大小
         label_size = self.preview_label.size()
@@ -460,3 +521,106 @@ class VideoPreviewWidget(QWidget):
 
         return (original_rect.x(), original_rect.y(),
                 original_rect.width(), original_rect.height())
+
+    def set_settings_callback(self, callback):
+        """设置获取快速预览参数的回调函数
+
+        回调返回传给QuickPreviewRenderer.render的参数字典（可另含target_size，单位字节），
+        当前设置不支持预览时返回None。
+        """
+        self.settings_callback = callback
+
+    def request_quick_preview(self):
+        """按当前选择区域和设置在后台渲染视频开头几秒的预览，新请求会取消未完成的预览"""
+        if self.video_path is None or self.frame is None:
+            return
+
+        settings = self.settings_callback() if self.settings_callback else {}
+        if settings is None:
+            self.show_quick_preview_info("当前输出模式不生成动图，无需预览")
+            return
+        options = dict(settings)
+        self.quick_preview_target_size = options.pop('target_size', None)
+        options['selected_region'] = self.get_selected_region()
+
+        self.cancel_quick_preview()
+        self.quick_preview_threads = [thread for thread in self.quick_preview_threads if thread.isRunning()]
+        self.quick_preview_token = CancelToken()
+        self.quick_preview_thread = QuickPreviewThread(self.quick_preview_renderer, self.video_path,
+                                                       options, self.quick_preview_token)
+        self.quick_preview_thread.finished_signal.connect(self.quick_preview_finished)
+        self.quick_preview_thread.error_signal.connect(self.quick_preview_error)
+        # 已取消的线程结束前保留引用
+        self.quick_preview_threads.append(self.quick_preview_thread)
+        self.show_quick_preview_info("正在生成预览...")
+        self.quick_preview_thread.start()
+
+    def cancel_quick_preview(self, wait_ms=0):
+        """取消未完成的快速预览
+
+        Args:
+            wait_ms: 等待后台线程结束的最长时间（毫秒），为0时不等待
+        """
+        if self.quick_preview_token is not None:
+            self.quick_preview_token.cancel()
+        self.quick_preview_thread = None
+        if wait_ms:
+            for thread in self.quick_preview_threads:
+                thread.wait(wait_ms)
+
+    def clear_quick_preview(self):
+        """取消并隐藏快速预览"""
+        self.cancel_quick_preview()
+        if self.quick_preview_movie is not None:
+            self.quick_preview_movie.stop()
+        self.quick_preview_label.clear()
+        self.quick_preview_label.setVisible(False)
+        self.quick_preview_info.setVisible(False)
+        self.quick_preview_movie = None
+        self.quick_preview_buffer = None
+        self.quick_preview_data = None
+
+    def show_quick_preview_info(self, text):
+        """显示快速预览的状态信息"""
+        self.quick_preview_info.setText(text)
+        self.quick_preview_info.setVisible(True)
+
+    @staticmethod
+    def format_size(size):
+        """把字节数格式化为KB或MB"""
+        if size < 1024 * 1024:
+            return f"{size / 1024:.0f}KB"
+        return f"{size / 1024 ** 2:.1f}MB"
+
+    def quick_preview_finished(self, result):
+        """显示预览动图和预计大小，忽略已被新请求取代的结果"""
+        if self.sender() is not self.quick_preview_thread:
+            return
+        self.quick_preview_thread = None
+
+        if self.quick_preview_movie is not None:
+            self.quick_preview_movie.stop()
+        # QMovie从缓冲区逐帧读取，动图数据和缓冲区在播放期间都需要保留引用
+        self.quick_preview_data = QByteArray(result['data'])
+        self.quick_preview_buffer = QBuffer(self.quick_preview_data)
+        self.quick_preview_buffer.open(QIODevice.ReadOnly)
+        self.quick_preview_movie = QMovie(self.quick_preview_buffer, b'gif')
+        self.quick_preview_label.setMovie(self.quick_preview_movie)
+        self.quick_preview_label.setVisible(True)
+        self.quick_preview_movie.start()
+
+        text = (f"预览 {result['width']}x{result['height']}，{result['duration']:.1f}秒 {result['frames']} 帧，"
+                f"渲染耗时 {result['elapsed']:.1f}秒。按原尺寸输出预计每个片段"
+                f"（{result['segment_duration']:.1f}秒）约 {self.format_size(result['segment_bytes'])}，"
+                f"整个视频约 {self.format_size(result['total_bytes'])}")
+        target_size = self.quick_preview_target_size
+        if target_size and result['segment_bytes'] > target_size:
+            text += f"，超过目标大小 {self.format_size(target_size)}，处理时会降低画质"
+        self.show_quick_preview_info(text)
+
+    def quick_preview_error(self, error_message):
+        """显示预览出错信息"""
+        if self.sender() is not self.quick_preview_thread:
+            return
+        self.quick_preview_thread = None
+        self.show_quick_preview_info(f"预览失败: {error_message}")